@@ -0,0 +1,425 @@
+"""Local HTTP API around the metrics engine, for tools that call the simulator directly
+
+An asyncio server built on the standard library only, run as its own process:
+
+    python api_server.py --port 8765 --workers 2
+
+Endpoints (inputs use the same keys as the app's input_data, rates as fractions):
+
+    POST /v1/metrics        One scenario as a JSON object -> {"inputs": ..., <metric>: value, ...}
+    POST /v1/metrics/batch  {"scenarios": [...], "metrics": [...]} or JSON Lines, one scenario per line
+                            -> {"results": [...]}, or with ?stream=1 one JSON Lines result per
+                            scenario, streamed as each chunk is scored
+    GET  /v1/stats          Latency percentiles per endpoint, request counts and throughput
+    GET  /healthz           Liveness check
+
+Single-scenario requests that arrive within a few milliseconds of each other
+are coalesced into one calculate_metrics_batch call. Scoring runs in a pool of
+worker processes so the event loop stays responsive, and back-pressure limits
+(requests in flight, body size, rows per batch, chunks in flight per stream)
+turn overload into fast 503/413 responses instead of an ever-growing queue.
+"""
+import argparse
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import json
+import multiprocessing
+import signal
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from metrics import INPUT_KEYS, OUTPUT_KEYS, calculate_metrics_batch
+from profiling import Profiler
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+class HTTPError(Exception):
+    """An error response: status code plus a message returned as {"error": message}"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class _StreamAborted(Exception):
+    """Raised when a streamed response fails after its headers were sent"""
+
+def score_columns(columns, metrics=None):
+    """Metrics for a dict of input columns; runs in the worker pool"""
+    results = calculate_metrics_batch(columns)
+    return {key: results[key] for key in (metrics or OUTPUT_KEYS)}
+
+def _scenario_columns(scenarios):
+    """Validate a list of scenario objects and turn them into float64 input columns"""
+    if not isinstance(scenarios, list) or not scenarios:
+        raise HTTPError(400, "Expected a non-empty list of scenarios")
+    if not all(isinstance(scenario, dict) for scenario in scenarios):
+        raise HTTPError(400, "Each scenario must be a JSON object of inputs")
+    unknown = set().union(*scenarios) - set(INPUT_KEYS)
+    if unknown:
+        raise HTTPError(400, f"Unknown input(s): {', '.join(sorted(unknown))}")
+    columns = {}
+    for key in INPUT_KEYS:
+        values = [scenario.get(key, 0) for scenario in scenarios]
+        if any(isinstance(value, (bool, str)) or value is None for value in values):
+            raise HTTPError(400, f"Input '{key}' must be a number")
+        try:
+            columns[key] = np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            raise HTTPError(400, f"Input '{key}' must be a number") from None
+    return columns
+
+def _result_rows(results):
+    """Per-scenario dicts from metric columns"""
+    keys = list(results)
+    return [dict(zip(keys, values)) for values in zip(*(results[key].tolist() for key in keys))]
+
+def _parse_metrics(requested):
+    if requested is None:
+        return None
+    if not isinstance(requested, list) or not requested:
+        raise HTTPError(400, "'metrics' must be a non-empty list of metric names")
+    unknown = [m for m in requested if m not in OUTPUT_KEYS]
+    if unknown:
+        raise HTTPError(400, f"Unknown metric(s): {', '.join(map(str, unknown))}")
+    return requested
+
+class Coalescer:
+    """Groups single-scenario requests that arrive close together into one batch call
+
+    A batch is sent once it holds max_batch scenarios or max_delay seconds
+    after its first scenario arrived, whichever comes first.
+    """
+
+    def __init__(self, score, max_batch=1024, max_delay=0.002):
+        self.score = score
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.rows = 0
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def submit(self, scenario):
+        """Metrics for one validated scenario, computed alongside its neighbours"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((scenario, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.rows += len(batch)
+        try:
+            rows = _result_rows(await self.score(_scenario_columns([scenario for scenario, _ in batch])))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), row in zip(batch, rows):
+            if not future.done():
+                future.set_result(row)
+
+class MetricsServer:
+    """The HTTP service: routing, limits, the worker pool and statistics
+
+    `workers` is the number of worker processes; 0 scores in a single
+    background thread instead, which suits small deployments and tests.
+    """
+
+    def __init__(self, workers=1, max_in_flight=256, max_body_bytes=64 << 20, max_batch_rows=1_000_000,
+                 chunk_rows=50_000, coalesce_max_batch=1024, coalesce_delay=0.002):
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.max_body_bytes = max_body_bytes
+        self.max_batch_rows = max_batch_rows
+        self.chunk_rows = chunk_rows
+        self.max_chunks_in_flight = max(2, workers * 2)
+        if workers > 0:
+            self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=1)
+        self.coalescer = Coalescer(self._score, coalesce_max_batch, coalesce_delay)
+        self.latency = Profiler(window=1000, enabled=True)
+        self.started = time.monotonic()
+        self.in_flight = 0
+        self.statuses = {}
+        self.rows_scored = 0
+        self.rejected = 0
+        self._recent = deque()  # (time, rows) per request over the last minute
+
+    async def _score(self, columns, metrics=None):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, score_columns, columns, metrics)
+
+    async def _score_chunks(self, columns, n_rows, metrics):
+        """Yield metric columns for consecutive chunks, in order, with a bounded number in flight"""
+        pending = deque()
+        try:
+            for start in range(0, n_rows, self.chunk_rows):
+                chunk = {key: values[start:start + self.chunk_rows] for key, values in columns.items()}
+                pending.append(asyncio.ensure_future(self._score(chunk, metrics)))
+                if len(pending) >= self.max_chunks_in_flight:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    # Statistics
+
+    def _count(self, status, rows):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.rows_scored += rows
+        now = time.monotonic()
+        self._recent.append((now, rows))
+        while self._recent and self._recent[0][0] < now - 60:
+            self._recent.popleft()
+
+    def stats(self):
+        """Counters, throughput over the last minute and latency percentiles per endpoint"""
+        now = time.monotonic()
+        recent = [(t, rows) for t, rows in self._recent if t >= now - 60]
+        window = min(60.0, now - self.started) or 1.0
+        return {
+            "uptime_s": now - self.started,
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "requests": {str(status): count for status, count in sorted(self.statuses.items())},
+            "rejected": self.rejected,
+            "rows_scored": self.rows_scored,
+            "coalesced": {"batches": self.coalescer.batches, "rows": self.coalescer.rows,
+                          "mean_batch_size": self.coalescer.rows / self.coalescer.batches
+                          if self.coalescer.batches else 0.0},
+            "last_minute": {"requests_per_s": len(recent) / window,
+                            "rows_per_s": sum(rows for _, rows in recent) / window},
+            "latency_ms": self.latency.summary(),
+        }
+
+    # HTTP
+
+    async def _read_request(self, reader):
+        """(method, path, query, headers, body) of the next request, or None at end of stream"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise HTTPError(413, "Request headers too large") from None
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line") from None
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPError(400, "Chunked request bodies are not supported; send Content-Length")
+        length = int(headers.get("content-length") or 0)
+        if length > self.max_body_bytes:
+            raise HTTPError(413, f"Request body over {self.max_body_bytes:,} bytes")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        return method.upper(), url.path, parse_qs(url.query), headers, body
+
+    @staticmethod
+    async def _send(writer, status, payload, content_type="application/json", headers=None):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}"]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        """Serve requests on one keep-alive connection"""
+        try:
+            while True:
+                keep_alive = True
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, query, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    await self._dispatch(writer, method, path, query, headers, body)
+                except HTTPError as e:
+                    # The rest of an oversized request is still unread, so drop the connection
+                    keep_alive = keep_alive and e.status != 413
+                    await self._send(writer, e.status, {"error": str(e)},
+                                     headers={"Connection": "keep-alive" if keep_alive else "close"})
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, _StreamAborted):
+            pass
+        except Exception as e:
+            print(f"error: {e!r}", file=sys.stderr, flush=True)
+            try:
+                await self._send(writer, 500, {"error": "Internal server error"}, headers={"Connection": "close"})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, writer, method, path, query, headers, body):
+        if path == "/healthz":
+            await self._send(writer, 200, {"status": "ok"})
+            return
+        if path == "/v1/stats":
+            await self._send(writer, 200, self.stats())
+            return
+        if path not in ("/v1/metrics", "/v1/metrics/batch"):
+            raise HTTPError(404, f"No endpoint at {path}")
+        if method != "POST":
+            raise HTTPError(405, f"{path} only accepts POST")
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            self._count(503, 0)
+            await self._send(writer, 503, {"error": "Server busy, retry shortly"}, headers={"Retry-After": "1"})
+            return
+
+        self.in_flight += 1
+        start = time.perf_counter()
+        status, rows = 500, 0
+        try:
+            if path == "/v1/metrics":
+                rows = await self._single(writer, body)
+            else:
+                rows = await self._batch(writer, query, headers, body)
+            status = 200
+        except HTTPError as e:
+            status = e.status
+            raise
+        finally:
+            self.in_flight -= 1
+            self.latency.record(f"POST {path}", time.perf_counter() - start)
+            self._count(status, rows)
+
+    async def _single(self, writer, body):
+        scenario = _load_json(body)
+        _scenario_columns([scenario])  # reject bad input before it joins a batch
+        result = await self.coalescer.submit(scenario)
+        inputs = {key: float(scenario.get(key, 0)) for key in INPUT_KEYS}
+        await self._send(writer, 200, {"inputs": inputs, **result})
+        return 1
+
+    async def _batch(self, writer, query, headers, body):
+        if "ndjson" in headers.get("content-type", "") or "jsonlines" in headers.get("content-type", ""):
+            scenarios = [_load_json(line) for line in body.splitlines() if line.strip()]
+            metrics = _parse_metrics(query["metrics"][0].split(",")) if "metrics" in query else None
+        else:
+            payload = _load_json(body)
+            if isinstance(payload, dict):
+                scenarios = payload.get("scenarios")
+                metrics = _parse_metrics(payload.get("metrics"))
+            else:
+                scenarios, metrics = payload, None
+        if isinstance(scenarios, list) and len(scenarios) > self.max_batch_rows:
+            raise HTTPError(413, f"Batch of {len(scenarios):,} scenarios is over the {self.max_batch_rows:,} limit")
+        columns = _scenario_columns(scenarios)
+        n_rows = len(scenarios)
+        del scenarios
+
+        if query.get("stream", ["0"])[0].lower() in ("1", "true", "yes"):
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+            try:
+                async for results in self._score_chunks(columns, n_rows, metrics):
+                    data = "".join(json.dumps(row) + "\n" for row in _result_rows(results)).encode()
+                    writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    # Waiting for the client to take each chunk bounds the memory a slow reader can pin
+                    await writer.drain()
+            except ConnectionError:
+                raise
+            except Exception as e:
+                # The status line has gone out; ending without the final chunk tells the client it failed
+                print(f"error: {e!r}", file=sys.stderr, flush=True)
+                raise _StreamAborted() from e
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        else:
+            rows = []
+            async for results in self._score_chunks(columns, n_rows, metrics):
+                rows += _result_rows(results)
+            await self._send(writer, 200, {"results": rows})
+        return n_rows
+
+    async def serve(self, host="127.0.0.1", port=8765, ready=None):
+        """Listen until cancelled or sent SIGTERM; `ready` is called with the bound (host, port)"""
+        server = await asyncio.start_server(self.handle, host, port, limit=64 << 10)
+        # A load balancer stops instances with SIGTERM; shut the worker pool down with them
+        task = asyncio.current_task()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+        except NotImplementedError:
+            pass
+        if ready:
+            ready(server.sockets[0].getsockname()[:2])
+        try:
+            async with server:
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+
+def _load_json(data):
+    try:
+        return json.loads(data)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPError(400, f"Invalid JSON: {e}") from None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the sales metrics engine over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default 8765)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for scoring; 0 scores in a background thread (default 1)")
+    parser.add_argument("--max-in-flight", type=int, default=256,
+                        help="Requests handled at once before answering 503 (default 256)")
+    parser.add_argument("--max-batch-rows", type=int, default=1_000_000,
+                        help="Largest batch accepted, in scenarios (default 1000000)")
+    parser.add_argument("--max-body-mb", type=float, default=64, help="Largest request body in MB (default 64)")
+    parser.add_argument("--chunk-rows", type=int, default=50_000,
+                        help="Scenarios per worker task and per streamed chunk (default 50000)")
+    parser.add_argument("--coalesce-ms", type=float, default=2.0,
+                        help="How long a single request waits for others to batch with (default 2)")
+    args = parser.parse_args(argv)
+
+    server = MetricsServer(workers=args.workers, max_in_flight=args.max_in_flight,
+                           max_body_bytes=int(args.max_body_mb * 2**20), max_batch_rows=args.max_batch_rows,
+                           chunk_rows=args.chunk_rows, coalesce_delay=args.coalesce_ms / 1000)
+
+    def ready(address):
+        print(f"Serving metrics on http://{address[0]}:{address[1]} with {args.workers} worker(s)",
+              file=sys.stderr, flush=True)
+
+    try:
+        asyncio.run(server.serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""Headless batch runner: score a file of scenarios without the Streamlit UI
+
+Reads CSV, Parquet or JSON Lines scenarios whose columns use the same keys as
+the app's input_data (rates as fractions, e.g. 0.2 for 20%), or the
+"Input: <key>" headings of the all-simulations export. Scenarios are read and
+scored in chunks, optionally across worker processes, and results are
+appended to the output file as each chunk finishes, so files larger than
+memory can be processed.
+
+    python batch_runner.py scenarios.csv results.parquet --workers 4
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import sys
+import time
+
+import pandas as pd
+
+from metrics import INPUT_KEYS, OUTPUT_KEYS, calculate_metrics_batch
+
+SUPPORTED_EXTENSIONS = [".csv", ".parquet", ".jsonl", ".ndjson"]
+
+def _file_type(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"Unsupported file type '{extension}' (expected one of {', '.join(SUPPORTED_EXTENSIONS)})")
+    return "jsonl" if extension == ".ndjson" else extension[1:]
+
+def read_chunks(path, chunk_size=100_000):
+    """Yield DataFrames of at most chunk_size scenarios from a scenario file"""
+    file_type = _file_type(path)
+    if file_type == "csv":
+        yield from pd.read_csv(path, chunksize=chunk_size)
+    elif file_type == "jsonl":
+        yield from pd.read_json(path, lines=True, chunksize=chunk_size)
+    else:
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+
+def normalise_columns(chunk):
+    """Strip the export's "Input: " prefixes so columns match input keys"""
+    renamed = {column: column[len("Input: "):] for column in chunk.columns if str(column).startswith("Input: ")}
+    chunk = chunk.rename(columns=renamed)
+    if not any(key in chunk.columns for key in INPUT_KEYS):
+        raise ValueError("Scenario file has no recognised input columns")
+    return chunk
+
+def score_chunk(chunk, keep_columns=True, metrics=None):
+    """Calculate metrics for one chunk of scenarios"""
+    chunk = normalise_columns(chunk)
+    results = calculate_metrics_batch(chunk)
+    if metrics:
+        results = results[list(metrics)]
+    if keep_columns:
+        results = pd.concat([chunk.drop(columns=[c for c in results.columns if c in chunk.columns]), results], axis=1)
+    return results
+
+class ResultWriter:
+    """Append result chunks to a CSV, JSON Lines or Parquet file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file_type = _file_type(path)
+        self._parquet_writer = None
+        self._started = False
+
+    def write(self, frame):
+        if self.file_type == "csv":
+            frame.to_csv(self.path, mode="a" if self._started else "w", header=not self._started, index=False)
+        elif self.file_type == "jsonl":
+            with open(self.path, "a" if self._started else "w") as f:
+                if not frame.empty:
+                    # Each chunk ends with its own newline; 15 digits so values round-trip like the exports
+                    frame.to_json(f, orient="records", lines=True, double_precision=15)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+            else:
+                table = table.cast(self._parquet_writer.schema)
+            self._parquet_writer.write_table(table)
+        self._started = True
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+def run(input_path, output_path, chunk_size=100_000, workers=1, keep_columns=True, metrics=None, progress=None):
+    """Score every scenario in input_path into output_path; returns (rows, seconds)"""
+    writer = ResultWriter(output_path)
+    rows = 0
+    start = time.perf_counter()
+    chunks = read_chunks(input_path, chunk_size)
+    try:
+        if workers > 1:
+            # Bound the number of chunks in flight so memory stays flat
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                in_flight = []
+                for chunk in chunks:
+                    in_flight.append(pool.submit(score_chunk, chunk, keep_columns, metrics))
+                    if len(in_flight) >= workers * 2:
+                        rows += _write_result(writer, in_flight.pop(0).result(), rows, start, progress)
+                for future in in_flight:
+                    rows += _write_result(writer, future.result(), rows, start, progress)
+        else:
+            for chunk in chunks:
+                rows += _write_result(writer, score_chunk(chunk, keep_columns, metrics), rows, start, progress)
+    finally:
+        writer.close()
+    return rows, time.perf_counter() - start
+
+def _write_result(writer, frame, rows_so_far, start, progress):
+    writer.write(frame)
+    if progress:
+        done = rows_so_far + len(frame)
+        elapsed = time.perf_counter() - start
+        progress(f"{done:,} rows, {done / elapsed:,.0f} rows/s")
+    return len(frame)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calculate sales metrics for a file of scenarios.")
+    parser.add_argument("input", help="Scenario file (.csv, .parquet, .jsonl)")
+    parser.add_argument("output", help="Results file (.csv, .parquet, .jsonl)")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="Scenarios per chunk (default 100000)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (default 1)")
+    parser.add_argument("--metrics", nargs="+", choices=OUTPUT_KEYS, help="Only write these metrics")
+    parser.add_argument("--no-inputs", action="store_true", help="Do not copy input columns into the results")
+    parser.add_argument("--quiet", action="store_true", help="Only print the final summary")
+    args = parser.parse_args(argv)
+
+    def progress(message):
+        print(message, file=sys.stderr, flush=True)
+
+    try:
+        rows, seconds = run(args.input, args.output, chunk_size=args.chunk_size, workers=args.workers,
+                            keep_columns=not args.no_inputs, metrics=args.metrics,
+                            progress=None if args.quiet else progress)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"error: {e}\n")
+    rate = rows / seconds if seconds > 0 else float("inf")
+    print(f"Scored {rows:,} scenarios in {seconds:.2f}s ({rate:,.0f} rows/s) -> {args.output}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
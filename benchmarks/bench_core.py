@@ -0,0 +1,274 @@
+"""Benchmarks for the computation, comparison, export, import and report paths
+
+Runs headless (no Streamlit) and records, for each case, latency percentiles
+over repeated runs, throughput in items per second and peak traced memory.
+Results are compared against benchmarks/baseline.json; any case whose median
+latency or peak memory exceeds its baseline by more than the tolerance is
+reported and the run exits with status 1.
+
+Latencies are only comparable on the machine that recorded them, so the
+baseline stores its machine string and the time of a fixed calibration
+workload. Baseline latencies are scaled by this run's calibration time over
+the baseline's, absorbing CPU frequency and load differences; on a different
+machine (or Python) only peak memory is compared.
+
+    python benchmarks/bench_core.py                    # compare against the baseline
+    python benchmarks/bench_core.py --update-baseline  # re-record every case in one run
+    python benchmarks/bench_core.py --quick            # skip the 100k-simulation cases
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from metrics import (INPUT_KEYS, INTEGER_KEYS, RATE_KEYS, calculate_metrics,  # noqa: E402
+                     calculate_metrics_batch, calculate_record)
+from schema import InputRecord  # noqa: E402
+from exports import export_file  # noqa: E402
+from imports import import_simulations  # noqa: E402
+from kernel import available_backends, evaluate, output_buffer, parity  # noqa: E402
+from reports import REPORTLAB_AVAILABLE, create_pdf_report  # noqa: E402
+from simulation_store import SimulationStore  # noqa: E402
+from views import comparison_views  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+STORE_SIZES = [10, 100, 1_000, 10_000, 100_000]
+
+COMPARE_METRICS = ["revenue", "net_profit", "roi", "customers"]
+
+def machine():
+    """Identifies the machine a baseline was recorded on"""
+    return " / ".join([f"{platform.system()} {platform.machine()} {platform.processor()}".strip(),
+                       f"{os.cpu_count()} CPU", f"Python {platform.python_version()}", f"NumPy {np.__version__}"])
+
+def calibrate(repeat=7):
+    """Median milliseconds for a fixed mix of interpreter and NumPy work
+
+    Run before the cases and stored with the baseline, so latencies can be
+    scaled by how fast this machine is running right now.
+    """
+    values = np.random.default_rng(0).uniform(1, 2, 200_000)
+
+    def workload():
+        total = 0.0
+        record = {"a": 1.0, "b": 2.0}
+        for i in range(50_000):
+            record["a"] = record["b"] * 0.5 + i
+            total += record["a"] / (i + 1)
+        for _ in range(10):
+            total += float(np.sum(np.sqrt(values * values + 1.0) / values))
+        return total
+
+    workload()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        workload()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1e3
+
+def random_inputs(n, seed=0):
+    """n plausible scenarios as a dict of input columns"""
+    rng = np.random.default_rng(seed)
+    columns = {key: rng.uniform(0.01, 0.5, n) if key in RATE_KEYS else rng.uniform(1, 10_000, n).round()
+               for key in INPUT_KEYS}
+    return columns
+
+def build_store(n, seed=0):
+    """A SimulationStore holding n simulations"""
+    inputs = random_inputs(n, seed)
+    store = SimulationStore()
+    store.add_many([f"Sim {i + 1}" for i in range(n)], [f"Simulation {i + 1}" for i in range(n)],
+                   ["2024-01-01 00:00:00"] * n, np.column_stack([inputs[key] for key in INPUT_KEYS]))
+    return store
+
+def measure(func, items=1, repeat=20, min_time=0.25):
+    """Latency percentiles, throughput and peak memory for one benchmark case
+
+    `func` is timed `repeat` times (more if `min_time` has not yet elapsed),
+    then run once more under tracemalloc for peak memory so tracing does not
+    skew the timings.
+    """
+    func()  # warm-up
+    gc.collect()
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < repeat or time.perf_counter() - started < min_time:
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings = np.array(timings)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {
+        "runs": len(timings),
+        "items": items,
+        "p50_ms": p50 * 1e3,
+        "p95_ms": p95 * 1e3,
+        "p99_ms": p99 * 1e3,
+        "throughput_per_s": items / p50 if p50 > 0 else float("inf"),
+        "peak_memory_mb": peak / 2**20,
+    }
+
+def benchmark_cases(sizes):
+    """Yield (name, func, items, repeat) for every benchmark case
+
+    Stores are built just before their cases run and dropped afterwards, so
+    each case sees the same heap state whichever sizes are selected.
+    """
+    scalar_inputs = {key: int(values[0]) if key in INTEGER_KEYS else float(values[0])
+                     for key, values in random_inputs(1).items()}
+    scalar_record = InputRecord.from_dict(scalar_inputs)
+    batch_inputs = random_inputs(100_000)
+    yield "calculate_metrics scalar x1000", lambda: [calculate_metrics(scalar_inputs) for _ in range(1000)], 1000, 20
+    yield "calculate_record scalar x1000", lambda: [calculate_record(scalar_record) for _ in range(1000)], 1000, 20
+    yield "calculate_metrics_batch 100k", lambda: calculate_metrics_batch(batch_inputs), 100_000, 10
+    # The fused kernel on every backend installed here, writing into a reused buffer
+    for size, inputs in [("100k", batch_inputs), ("1M", random_inputs(1_000_000))]:
+        buffer = output_buffer(len(inputs["leads"]))
+        if size != "100k":
+            yield f"calculate_metrics_batch {size}", lambda inputs=inputs: calculate_metrics_batch(inputs), len(buffer[0]), 5
+        for backend in available_backends():
+            yield (f"fused kernel {backend} {size}",
+                   lambda inputs=inputs, backend=backend, buffer=buffer: evaluate(inputs, backend, out=buffer),
+                   len(buffer[0]), 10 if size == "100k" else 5)
+        del inputs, buffer
+    del batch_inputs
+    if REPORTLAB_AVAILABLE:
+        sim_data = calculate_metrics(scalar_inputs)
+        yield "create_pdf_report", lambda: create_pdf_report(sim_data, "Benchmark"), 1, 10
+    for n in sizes:
+        store = build_store(n)
+        sim_ids = store.ids()
+        repeat = 20 if n <= 10_000 else 5
+        # What the Compare tab renders: the table with its changed inputs, and the chart data
+        yield f"compare comparison_views N={n}", lambda: comparison_views(store, sim_ids, COMPARE_METRICS), n, repeat
+        yield f"df_all_sims export N={n}", store.export_frame, n, repeat
+        csv_export = export_file(store, "CSV")
+        yield (f"import CSV with verify N={n}",
+               lambda: import_simulations(SimulationStore(), csv_export, "all_simulations.csv", verify=True), n, repeat)
+        del store, sim_ids, csv_export
+
+def _report(name, r):
+    print(f"{name:<42} p50 {r['p50_ms']:9.2f} ms  p95 {r['p95_ms']:9.2f} ms  "
+          f"{r['throughput_per_s']:>14,.0f}/s  peak {r['peak_memory_mb']:8.2f} MB", flush=True)
+
+def _regressions(name, result, base, tolerance, scale=None):
+    """Messages for each field of one case that exceeds its baseline
+
+    `scale` multiplies the baseline latency (see calibrate); None skips the
+    latency check, for a baseline recorded on another machine.
+    """
+    messages = []
+    fields = [("peak_memory_mb", "peak memory", 0.1, 1.0)]
+    if scale is not None:
+        fields.insert(0, ("p50_ms", "median latency", 1.0, scale))
+    # Absolute slack keeps scheduler noise on millisecond-scale cases from failing the run
+    for field, label, slack, factor in fields:
+        expected = base[field] * factor
+        limit = max(expected * (1 + tolerance), expected + slack)
+        if result[field] > limit:
+            messages.append(f"{name}: {label} {result[field]:.2f} vs baseline {expected:.2f} "
+                            f"(+{(result[field] / expected - 1) * 100:.0f}%, limit +{tolerance * 100:.0f}%)")
+    return messages
+
+def kernel_parity(only=None):
+    """Messages for installed kernel backends whose results differ from calculate_metrics"""
+    messages = []
+    for backend in available_backends():
+        name = f"fused kernel {backend} parity"
+        if only and only not in name:
+            continue
+        # numpy and numba repeat calculate_metrics' operations exactly; numexpr may round differently
+        error, limit = parity(backend), (1e-12 if backend == "numexpr" else 0.0)
+        print(f"{name:<42} max relative difference {error:.1e} (limit {limit:.0e})", flush=True)
+        if error > limit:
+            messages.append(f"{name}: results differ from calculate_metrics by up to {error:.1e}")
+    return messages
+
+def run(sizes, only=None, baseline=None, tolerance=0.5, scale=None):
+    """Run every case; returns (results, regression messages)
+
+    Kernel backends are first checked against calculate_metrics, and
+    a mismatch counts as a regression. Baseline latencies are multiplied by
+    `scale` (None compares memory only). A case that looks slower than its
+    baseline is measured once more and only counts as a regression if the
+    second run confirms it, so a single noisy run on a busy machine does not
+    fail the suite.
+    """
+    results, regressions = {}, kernel_parity(only)
+    for name, func, items, repeat in benchmark_cases(sizes):
+        if only and only not in name:
+            continue
+        results[name] = measure(func, items, repeat)
+        _report(name, results[name])
+        if baseline and name in baseline and _regressions(name, results[name], baseline[name], tolerance, scale):
+            results[name] = measure(func, items, repeat)
+            _report(f"{name} (re-run)", results[name])
+            regressions += _regressions(name, results[name], baseline[name], tolerance, scale)
+    return results, regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulator's core paths against a stored baseline.")
+    parser.add_argument("--quick", action="store_true", help="Only use stores of up to 10k simulations")
+    parser.add_argument("--only", help="Only run cases whose name contains this text")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Allowed slowdown or memory growth as a fraction of the baseline (default 0.5)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="Write these results as the new baseline")
+    args = parser.parse_args(argv)
+
+    sizes = [n for n in STORE_SIZES if n <= 10_000] if args.quick else STORE_SIZES
+    recorded = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            recorded = json.load(f)
+    baseline = recorded.get("results", {})
+    calibration_ms = calibrate()
+    print(f"Machine: {machine()}\nCalibration: {calibration_ms:.2f} ms\n", flush=True)
+
+    if args.update_baseline:
+        if args.only or args.quick:
+            # Cases recorded in separate runs (or machines) would not share one calibration
+            parser.error("--update-baseline records every case in one run; drop --only and --quick")
+        results, _ = run(sizes)
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": machine(), "calibration_ms": calibration_ms, "results": results}, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    scale = None
+    if baseline and recorded.get("machine") == machine() and recorded.get("calibration_ms"):
+        scale = calibration_ms / recorded["calibration_ms"]
+        print(f"Baseline latencies scaled by {scale:.2f} (calibration {recorded['calibration_ms']:.2f} ms when "
+              f"recorded)\n", flush=True)
+    elif baseline:
+        print(f"Baseline recorded on another machine ({recorded.get('machine')}); comparing peak memory only\n",
+              flush=True)
+    results, regressions = run(sizes, args.only, baseline, args.tolerance, scale)
+    if not baseline:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one")
+        return 0
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) against the baseline:")
+        for message in regressions:
+            print(f"  REGRESSION {message}")
+        return 1
+    print(f"\nNo regressions against the baseline ({len(results)} cases, tolerance {args.tolerance:.0%})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
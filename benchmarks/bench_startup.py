@@ -0,0 +1,88 @@
+"""Cold-start benchmark: module import times and the app's first render
+
+Every measurement runs in a fresh interpreter so nothing is already cached
+in sys.modules, and is repeated to report the median.
+
+    python benchmarks/bench_startup.py --repeat 5 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules making up the computation core, which must not pull in Streamlit or pandas
+CORE_MODULES = ["metrics", "montecarlo", "sensitivity", "projection", "metric_graph", "simulation_store",
+                "history_db", "exports", "reports"]
+
+# Heavy dependencies that should stay unloaded until a view needs them
+HEAVY_MODULES = ["streamlit", "pandas", "pyarrow", "reportlab", "plotly.graph_objs._figure"]
+
+IMPORT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+FIRST_RENDER_SNIPPET = """
+import json, logging, sys, time
+logging.disable(logging.WARNING)
+from streamlit.testing.v1 import AppTest
+before = set(sys.modules)
+start = time.perf_counter()
+app = AppTest.from_file("streamlit_app.py", default_timeout=120).run()
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "errors": [str(e.value) for e in app.exception],
+                  "loaded": [m for m in {heavy!r} if m in sys.modules and m not in before]}}))
+"""
+
+def _run(snippet):
+    """Run a snippet in a fresh interpreter and return its JSON result"""
+    completed = subprocess.run([sys.executable, "-c", snippet], cwd=REPO_ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else "benchmark failed")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def measure(snippet, repeat):
+    """Median seconds over `repeat` fresh runs, plus what the last run loaded"""
+    runs = [_run(snippet) for _ in range(repeat)]
+    return {**runs[-1], "seconds": statistics.median(run["seconds"] for run in runs)}
+
+def run_startup_benchmarks(repeat=3, first_render=True):
+    """Import time for each core module and, if Streamlit is installed, the app's first render"""
+    results = {}
+    for module in CORE_MODULES:
+        results[f"import {module}"] = measure(IMPORT_SNIPPET.format(module=module, heavy=HEAVY_MODULES), repeat)
+    if first_render:
+        try:
+            results["first render"] = measure(FIRST_RENDER_SNIPPET.format(heavy=HEAVY_MODULES), repeat)
+        except RuntimeError as e:
+            results["first render"] = {"seconds": None, "errors": [str(e)], "loaded": []}
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start import and first-render latency.")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh runs per measurement (default 3)")
+    parser.add_argument("--no-render", action="store_true", help="Skip the Streamlit first-render measurement")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = run_startup_benchmarks(args.repeat, first_render=not args.no_render)
+    for name, result in results.items():
+        seconds = "n/a" if result["seconds"] is None else f"{result['seconds'] * 1000:8.1f} ms"
+        loaded = ", ".join(result["loaded"]) or "-"
+        print(f"{name:<28} {seconds:>11}   heavy modules loaded: {loaded}")
+        for error in result.get("errors", []):
+            print(f"{'':<28} error: {error}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
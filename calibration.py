@@ -0,0 +1,279 @@
+"""Calibrate simulator inputs from a CRM event log
+
+The log has one row per event: an id for the lead (or account), the kind of
+event, when it happened and, for deals, the amount. Event kinds are "lead"
+(a new lead), "meeting" (a booked meeting), "deal" (a won deal) and "churn"
+(a customer leaving); other values are ignored. Column and event names can
+be mapped onto these with `columns` and `events`.
+
+The log is read in chunks (CSV via pandas, Parquet a row group batch at a
+time from a memory-mapped file) and folded into fixed-size state: monthly
+event counts, QuantileSketches for deal sizes and sales cycles, and the
+creation times of leads that have not closed yet. Leads open for longer
+than `max_open_days` are dropped, so memory depends on how many leads are
+in flight, not on the size of the log. Logs are expected to be roughly in
+time order, as CRM exports are; a deal that arrives before its lead still
+counts towards the rates but not towards the cycle length.
+
+Rates are ratios of event counts: meetings per lead, deals per meeting and
+churns per customer-month (customers being the running total of deals less
+churns, plus `initial_customers`).
+"""
+import numpy as np
+
+from lazy import is_available
+from metrics import INTEGER_KEYS, RATE_KEYS
+from montecarlo import QuantileSketch
+
+PYARROW_AVAILABLE = is_available("pyarrow")
+
+# Inputs a calibration can estimate
+CALIBRATED_KEYS = ["lead_booking_rate", "meeting_conversion_rate", "churn_rate", "sales_cycle_length",
+                   "average_deal_size"]
+
+EVENT_KINDS = ["lead", "meeting", "deal", "churn"]
+
+# Columns of the per-month breakdown
+MONTHLY_COLUMNS = ["leads", "meetings", "deals", "churns", "customers", "lead_booking_rate", "meeting_conversion_rate",
+                   "churn_rate", "average_deal_size", "median_deal_size", "median_cycle_days"]
+
+# Column names expected in the log; pass `columns` to map others onto them
+DEFAULT_COLUMNS = {"id": "lead_id", "event": "event", "timestamp": "timestamp", "amount": "amount"}
+
+_DAY_NS = 86_400 * 10**9
+
+def iter_event_chunks(source, file_name=None, chunk_rows=500_000, columns=None):
+    """DataFrames of at most chunk_rows events from a CSV (optionally compressed) or Parquet log"""
+    import pandas as pd
+
+    columns = {**DEFAULT_COLUMNS, **(columns or {})}
+    file_name = (file_name or (source if isinstance(source, str) else getattr(source, "name", ""))).lower()
+    wanted = list(columns.values())
+    if file_name.endswith(".parquet"):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("Parquet event logs require pyarrow. Install with: pip install pyarrow")
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(source, memory_map=isinstance(source, str))
+        present = [name for name in wanted if name in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=chunk_rows, columns=present):
+            yield batch.to_pandas()
+        return
+    compression = "infer" if isinstance(source, str) else ("gzip" if file_name.endswith(".gz") else None)
+    yield from pd.read_csv(source, chunksize=chunk_rows, compression=compression,
+                           usecols=lambda name: name in wanted,
+                           dtype={columns["id"]: str, columns["event"]: str})
+
+def _rate(events, exposure):
+    """events / exposure capped at 1, NaN where there is no exposure"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(exposure > 0, np.minimum(events / exposure, 1.0), np.nan)
+
+class EventLogCalibrator:
+    """Streaming funnel, cycle-length and deal-size statistics from CRM events
+
+    Feed DataFrames of events to `update` (or use `calibrate`), then read
+    point estimates with `inputs`, Monte Carlo distributions with
+    `distributions` and the per-month breakdown with `monthly`.
+    """
+
+    def __init__(self, columns=None, events=None, max_open_days=365, initial_customers=0, n_bins=1024):
+        import pandas as pd
+
+        self.columns = {**DEFAULT_COLUMNS, **(columns or {})}
+        # Event value in the log -> code (index into EVENT_KINDS)
+        names = {kind: kind for kind in EVENT_KINDS}
+        names.update(events or {})
+        self._codes = {value: EVENT_KINDS.index(kind) for kind, value in names.items()}
+        self.max_open_days = max_open_days
+        self.initial_customers = initial_customers
+        self.n_bins = n_bins
+        self._counts = {}
+        self._revenue = {}
+        self._deal_sizes = QuantileSketch(n_bins)
+        self._cycle_days = QuantileSketch(n_bins)
+        self._monthly_deal_sizes = {}
+        self._monthly_cycle_days = {}
+        # Creation time (ns) of each lead that has not closed yet, indexed by lead id
+        self._open = pd.Series(np.zeros(0, dtype=np.int64), index=pd.Index([], dtype=object))
+        self.rows = 0
+        self.skipped = 0
+        self.unmatched_deals = 0
+
+    def update(self, chunk):
+        """Fold one DataFrame of events into the statistics"""
+        import pandas as pd
+
+        columns = self.columns
+        self.rows += len(chunk)
+        codes = chunk[columns["event"]].map(self._codes).to_numpy(dtype=np.float64, na_value=np.nan)
+        times = pd.to_datetime(chunk[columns["timestamp"]], errors="coerce", utc=True).dt.tz_localize(None)
+        stamps = times.to_numpy(dtype="datetime64[ns]")
+        valid = ~np.isnan(codes) & ~np.isnat(stamps)
+        self.skipped += int((~valid).sum())
+        codes = codes[valid].astype(np.int64)
+        stamps = stamps[valid]
+        ids = chunk[columns["id"]].to_numpy(dtype=object)[valid]
+        months = stamps.astype("datetime64[M]")
+        amounts = (chunk[columns["amount"]].to_numpy(dtype=np.float64, na_value=np.nan)[valid]
+                   if columns["amount"] in chunk.columns else np.full(len(codes), np.nan))
+
+        # Monthly event counts
+        month_values, month_index = np.unique(months, return_inverse=True)
+        counts = np.zeros((len(month_values), len(EVENT_KINDS)), dtype=np.int64)
+        np.add.at(counts, (month_index, codes), 1)
+        is_deal = codes == EVENT_KINDS.index("deal")
+        sized = is_deal & np.isfinite(amounts) & (amounts >= 0)
+        revenue = np.bincount(month_index[sized], weights=amounts[sized], minlength=len(month_values))
+        for month, row, total in zip(month_values, counts, revenue):
+            self._counts[month] = self._counts.get(month, 0) + row
+            self._revenue[month] = self._revenue.get(month, 0.0) + total
+
+        # Deal sizes, overall and per month
+        self._deal_sizes.update(amounts[sized])
+        for month in np.unique(months[sized]):
+            self._sketch_for(self._monthly_deal_sizes, month).update(amounts[sized & (months == month)])
+
+        # Sales cycles: remember new leads, then match this chunk's deals against every open lead
+        is_lead = codes == EVENT_KINDS.index("lead")
+        if is_lead.any():
+            new = pd.Series(stamps[is_lead].astype(np.int64), index=pd.Index(ids[is_lead], dtype=object))
+            self._open = pd.concat([self._open, new])
+            self._open = self._open[~self._open.index.duplicated(keep="first")]
+        if is_deal.any():
+            positions = self._open.index.get_indexer(ids[is_deal])
+            matched = positions >= 0
+            self.unmatched_deals += int((~matched).sum())
+            deal_stamps = stamps[is_deal][matched].astype(np.int64)
+            cycles = (deal_stamps - self._open.to_numpy()[positions[matched]]) / _DAY_NS
+            keep = cycles >= 0
+            self._cycle_days.update(cycles[keep])
+            deal_months = months[is_deal][matched][keep]
+            for month in np.unique(deal_months):
+                self._sketch_for(self._monthly_cycle_days, month).update(cycles[keep][deal_months == month])
+            closed = np.zeros(len(self._open), dtype=bool)
+            closed[positions[matched]] = True
+            self._open = self._open[~closed]
+        if len(stamps) and len(self._open):
+            cutoff = stamps.max().astype(np.int64) - self.max_open_days * _DAY_NS
+            self._open = self._open[self._open.to_numpy() >= cutoff]
+        return self
+
+    def _sketch_for(self, sketches, month):
+        if month not in sketches:
+            # Per-month sketches are smaller; they only back the monthly medians
+            sketches[month] = QuantileSketch(max(self.n_bins // 4, 64))
+        return sketches[month]
+
+    @property
+    def open_leads(self):
+        return len(self._open)
+
+    def monthly(self):
+        """Per-month counts, rates, deal sizes and cycle lengths as a DataFrame indexed by month"""
+        import pandas as pd
+
+        if not self._counts:
+            return pd.DataFrame(columns=MONTHLY_COLUMNS)
+        first, last = min(self._counts), max(self._counts)
+        months = np.arange(first, last + np.timedelta64(1, "M"))
+        counts = np.array([self._counts.get(month, np.zeros(len(EVENT_KINDS), dtype=np.int64)) for month in months])
+        leads, meetings, deals, churns = counts.T
+        revenue = np.array([self._revenue.get(month, 0.0) for month in months])
+        # Customers at the start of each month
+        customers = self.initial_customers + np.concatenate([[0], np.cumsum(deals - churns)[:-1]])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            average_deal_size = np.where(deals > 0, revenue / deals, np.nan)
+        return pd.DataFrame({
+            "leads": leads, "meetings": meetings, "deals": deals, "churns": churns, "customers": customers,
+            "lead_booking_rate": _rate(meetings, leads),
+            "meeting_conversion_rate": _rate(deals, meetings),
+            "churn_rate": _rate(churns, customers),
+            "average_deal_size": average_deal_size,
+            "median_deal_size": [self._median(self._monthly_deal_sizes, month) for month in months],
+            "median_cycle_days": [self._median(self._monthly_cycle_days, month) for month in months],
+        }, index=pd.DatetimeIndex(months.astype("datetime64[ns]"), name="Month").to_period("M"))
+
+    @staticmethod
+    def _median(sketches, month):
+        sketch = sketches.get(month)
+        return float(sketch.quantile(0.5)) if sketch is not None else np.nan
+
+    def _totals(self):
+        counts = sum(self._counts.values(), np.zeros(len(EVENT_KINDS), dtype=np.int64))
+        return dict(zip(EVENT_KINDS, counts.tolist()))
+
+    def _customer_months(self):
+        return int(self.monthly()["customers"].clip(lower=0).sum()) if self._counts else 0
+
+    def inputs(self):
+        """Point estimates for CALIBRATED_KEYS in the simulator's units; inputs the log cannot support are left out"""
+        totals = self._totals()
+        estimates = {}
+        if totals["lead"]:
+            estimates["lead_booking_rate"] = min(totals["meeting"] / totals["lead"], 1.0)
+        if totals["meeting"]:
+            estimates["meeting_conversion_rate"] = min(totals["deal"] / totals["meeting"], 1.0)
+        exposure = self._customer_months()
+        if exposure:
+            estimates["churn_rate"] = min(totals["churn"] / exposure, 1.0)
+        if self._cycle_days.count:
+            estimates["sales_cycle_length"] = int(round(float(self._cycle_days.quantile(0.5))))
+        if self._deal_sizes.count:
+            estimates["average_deal_size"] = float(self._deal_sizes.mean)
+        return estimates
+
+    def distributions(self, n_points=21, min_exposure=30):
+        """Monte Carlo distribution specs for the calibrated inputs
+
+        Deal size and cycle length are "empirical" over n_points quantiles
+        of the observed values. A rate is "empirical" over its monthly
+        values when at least three months have `min_exposure` leads,
+        meetings or customers behind them (so a thin first or last month
+        does not widen the spread), otherwise "normal" around the overall
+        rate with its binomial standard error.
+        """
+        monthly = self.monthly()
+        totals = self._totals()
+        exposure = {"lead_booking_rate": ("leads", totals["lead"]),
+                    "meeting_conversion_rate": ("meetings", totals["meeting"]),
+                    "churn_rate": ("customers", self._customer_months())}
+        specs = {}
+        for key, value in self.inputs().items():
+            if key in RATE_KEYS:
+                column, total = exposure[key]
+                months = monthly.loc[monthly[column] >= min_exposure, key].dropna().to_numpy()
+                if len(months) >= 3:
+                    specs[key] = {"type": "empirical", "values": np.sort(months).tolist()}
+                else:
+                    std = float(np.sqrt(value * (1 - value) / total))
+                    specs[key] = {"type": "normal", "mean": value, "std": std}
+            else:
+                sketch = self._cycle_days if key == "sales_cycle_length" else self._deal_sizes
+                values = sketch.quantile(np.linspace(0, 1, n_points))
+                if key in INTEGER_KEYS:
+                    values = np.round(values)
+                specs[key] = {"type": "empirical", "values": values.tolist()}
+        return specs
+
+    def summary(self):
+        """Rows read and skipped, event totals and lead matching"""
+        return {"rows": self.rows, "skipped": self.skipped, **self._totals(),
+                "cycles_measured": self._cycle_days.count, "unmatched_deals": self.unmatched_deals,
+                "open_leads": self.open_leads}
+
+def calibrate(source, file_name=None, chunk_rows=500_000, columns=None, events=None, **options):
+    """Stream an event log (path or file object) through an EventLogCalibrator and return it
+
+    `options` go to EventLogCalibrator (max_open_days, initial_customers,
+    n_bins).
+    """
+    calibrator = EventLogCalibrator(columns=columns, events=events, **options)
+    for chunk in iter_event_chunks(source, file_name, chunk_rows, columns):
+        calibrator.update(chunk)
+    return calibrator
+
+def form_values(inputs):
+    """Calibrated inputs as the input form shows them: rates in percent, whole numbers as int"""
+    return {key: value * 100 if key in RATE_KEYS else int(value) if key in INTEGER_KEYS else float(value)
+            for key, value in inputs.items()}
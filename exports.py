@@ -0,0 +1,143 @@
+"""Chunked export of saved simulations to CSV, JSON, JSON Lines, Parquet and zip"""
+import gzip
+import io
+import json
+import tempfile
+import zipfile
+
+from lazy import is_available
+
+# pyarrow is only imported once a Parquet file is actually written
+PYARROW_AVAILABLE = is_available("pyarrow")
+
+# Export formats: file extension and MIME type
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "JSON": ("json", "application/json"),
+    "JSON Lines": ("jsonl", "application/x-ndjson"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "JSON (changes only)": ("changes.json", "application/json"),
+}
+
+def _chunks(store, sim_ids, chunk_rows):
+    """Export frames of at most chunk_rows simulations"""
+    sim_ids = store.ids() if sim_ids is None else list(sim_ids)
+    for start in range(0, len(sim_ids), chunk_rows):
+        yield store.export_frame(sim_ids[start:start + chunk_rows])
+
+def iter_csv(store, sim_ids=None, chunk_rows=5000):
+    """CSV text in chunks, header first"""
+    for i, chunk in enumerate(_chunks(store, sim_ids, chunk_rows)):
+        yield chunk.to_csv(index=False, header=(i == 0))
+
+def iter_jsonl(store, sim_ids=None, chunk_rows=5000):
+    """JSON Lines text in chunks, one flat record per simulation"""
+    for chunk in _chunks(store, sim_ids, chunk_rows):
+        # pandas writes 10 digits by default, which is too few for the inputs to round-trip;
+        # each chunk already ends with a newline
+        yield chunk.to_json(orient="records", lines=True, double_precision=15)
+
+def iter_json(store, sim_ids=None, chunk_rows=1000):
+    """The nested {sim_id: {name, timestamp, data}} JSON document in chunks"""
+    sim_ids = store.ids() if sim_ids is None else list(sim_ids)
+    yield "{"
+    for start in range(0, len(sim_ids), chunk_rows):
+        records = store.to_records(sim_ids[start:start + chunk_rows])
+        parts = [f"{json.dumps(sim_id)}: {json.dumps(record)}" for sim_id, record in records.items()]
+        yield (", " if start else "") + ", ".join(parts)
+    yield "}"
+
+def iter_changes_json(store, sim_ids=None, chunk_rows=5000):
+    """Baselines plus each simulation's changed inputs, without outputs, in chunks
+
+    Outputs are recomputed from the inputs on import, so a library of
+    scenarios that each change a few inputs exports at a fraction of the
+    size of the full JSON document.
+    """
+    sim_ids = store.ids() if sim_ids is None else list(sim_ids)
+    baselines = {name: store.baseline(name) for name in store.baselines()}
+    yield f'{{"baselines": {json.dumps(baselines)}, "simulations": {{'
+    for start in range(0, len(sim_ids), chunk_rows):
+        records = store.to_compact_records(sim_ids[start:start + chunk_rows])
+        parts = [f"{json.dumps(sim_id)}: {json.dumps(record)}" for sim_id, record in records.items()]
+        yield (", " if start else "") + ", ".join(parts)
+    yield "}}"
+
+def write_parquet(store, fileobj, sim_ids=None, chunk_rows=50000):
+    """Write simulations to Parquet one row group per chunk"""
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("Parquet export requires pyarrow. Install with: pip install pyarrow")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in _chunks(store, sim_ids, chunk_rows):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(fileobj, table.schema, compression="zstd")
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+def write_export(store, export_format, fileobj, sim_ids=None, compress=False):
+    """Stream one export format into a binary file object, optionally gzipped"""
+    if export_format == "Parquet":
+        # Parquet is compressed internally, so gzip would only add overhead
+        write_parquet(store, fileobj, sim_ids)
+        return
+    text_chunks = {"CSV": iter_csv, "JSON": iter_json, "JSON Lines": iter_jsonl,
+                   "JSON (changes only)": iter_changes_json}[export_format](store, sim_ids)
+    target = gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=6) if compress else fileobj
+    try:
+        for chunk in text_chunks:
+            target.write(chunk.encode())
+    finally:
+        if compress:
+            target.close()
+
+def write_bundle(store, fileobj, sim_ids=None, basename="all_simulations"):
+    """Zip archive with every available export format"""
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        for export_format, (extension, _) in EXPORT_FORMATS.items():
+            if export_format == "Parquet" and not PYARROW_AVAILABLE:
+                continue
+            with bundle.open(f"{basename}.{extension}", "w", force_zip64=True) as entry:
+                if export_format == "Parquet":
+                    # Parquet needs a seekable target, so build it beside the archive first
+                    with tempfile.TemporaryFile() as parquet_file:
+                        write_parquet(store, parquet_file, sim_ids)
+                        parquet_file.seek(0)
+                        while block := parquet_file.read(1 << 20):
+                            entry.write(block)
+                else:
+                    write_export(store, export_format, entry, sim_ids)
+
+def export_file(store, export_format, sim_ids=None, compress=False):
+    """An export's file contents as bytes, ready for st.download_button
+
+    The file is built in a spooled temporary file that spills to disk past
+    8 MB, so building it never holds more than one chunk of rows as Python
+    objects; only the finished file is read into memory.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=8 << 20) as spool:
+        if export_format == "Zip bundle":
+            write_bundle(store, spool, sim_ids)
+        else:
+            write_export(store, export_format, spool, sim_ids, compress)
+        spool.seek(0)
+        return spool.read()
+
+def frame_to_bytes(df, export_format):
+    """Small single-frame exports (e.g. one simulation) as bytes"""
+    if export_format == "CSV":
+        return df.to_csv(index=False).encode()
+    if export_format == "JSON Lines":
+        # The same 15 digits as the full export, so the file round-trips through a verified import
+        return df.to_json(orient="records", lines=True, double_precision=15).encode()
+    if export_format == "Parquet":
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+    raise ValueError(f"Unsupported format '{export_format}'")
@@ -0,0 +1,187 @@
+"""Goal seek: find the input values that make a metric hit a target
+
+Free inputs move along one parameter t. With a single free input, t is that
+input's value; with several, every free input is scaled by the common factor
+t, so the answer is "change all of these by the same percentage". For each
+problem the metric is first checked for linearity in t across the bounds and
+solved in closed form; the remaining problems are bracketed on a grid and
+refined by vectorised bisection. Every step evaluates all rows in one
+calculate_metrics_batch call, so thousands of targets solve together.
+"""
+import numpy as np
+
+from metrics import INPUT_KEYS, RATE_KEYS, calculate_metrics_batch
+
+def default_bounds(key, base_value):
+    """Search range for an input: [0, 1] for rates, otherwise 0 to ten times its value"""
+    if key in RATE_KEYS:
+        return 0.0, 1.0
+    return 0.0, max(10.0 * abs(float(base_value)), 1.0)
+
+def _broadcast_inputs(inputs, n_rows):
+    """Every input as a float64 array of n_rows values; scalars are repeated"""
+    return {key: np.broadcast_to(np.asarray(inputs.get(key, 0), dtype=np.float64), (n_rows,)).copy()
+            for key in INPUT_KEYS}
+
+def _parameter_bounds(columns, free_keys, bounds):
+    """Per-row search interval for t"""
+    n_rows = len(columns[INPUT_KEYS[0]])
+    if len(free_keys) == 1:
+        key = free_keys[0]
+        low, high = bounds[key]
+        return np.broadcast_to(np.asarray(low, dtype=float), (n_rows,)).copy(), \
+            np.broadcast_to(np.asarray(high, dtype=float), (n_rows,)).copy()
+    t_low, t_high = np.full(n_rows, -np.inf), np.full(n_rows, np.inf)
+    for key in free_keys:
+        base = columns[key]
+        if np.any(base <= 0):
+            raise ValueError(f"'{key}' must be positive to be scaled together with other inputs")
+        low, high = bounds[key]
+        t_low = np.maximum(t_low, np.asarray(low, dtype=float) / base)
+        t_high = np.minimum(t_high, np.asarray(high, dtype=float) / base)
+    return t_low, t_high
+
+def _evaluate(columns, metric, free_keys, rows, t):
+    """Metric values for the given rows with the free inputs set from t"""
+    trial = {key: values[rows] for key, values in columns.items()}
+    if len(free_keys) == 1:
+        trial[free_keys[0]] = t
+    else:
+        for key in free_keys:
+            trial[key] = trial[key] * t
+    return calculate_metrics_batch(trial)[metric]
+
+def _bisect(columns, metric, free_keys, rows, targets, lo, hi, gap_lo, max_iterations):
+    """Vectorised bisection of metric - target on the brackets [lo, hi]"""
+    for _ in range(max_iterations):
+        mid = 0.5 * (lo + hi)
+        gap_mid = _evaluate(columns, metric, free_keys, rows, mid) - targets
+        left = np.sign(gap_mid) * np.sign(gap_lo) <= 0
+        hi = np.where(left, mid, hi)
+        lo = np.where(left, lo, mid)
+        gap_lo = np.where(left, gap_lo, gap_mid)
+        if np.all(hi - lo <= 1e-12 * np.maximum(np.abs(hi), 1.0)):
+            break
+    return 0.5 * (lo + hi)
+
+def goal_seek_batch(inputs, metric, targets, free_keys, bounds=None, grid_points=64, max_iterations=100):
+    """Solve many goal-seek problems at once
+
+    `inputs` holds scalars or per-row arrays (dict or DataFrame) and `targets`
+    is a scalar or per-row array. `bounds` maps each free input to (low, high)
+    and defaults to default_bounds. Returns a dict with the required "values"
+    per free input, the "achieved" metric, a "feasible" mask (False where the
+    target is out of reach, in which case the closest value within the bounds
+    is returned) and the "method" used per row.
+    """
+    free_keys = list(free_keys)
+    if not free_keys:
+        raise ValueError("Choose at least one input to solve for")
+    targets = np.asarray(targets, dtype=np.float64)
+    lengths = [len(np.atleast_1d(inputs[key])) for key in INPUT_KEYS if key in inputs and np.ndim(inputs[key]) > 0]
+    n_rows = max(lengths + [targets.size])
+    targets = np.broadcast_to(targets, (n_rows,))
+    columns = _broadcast_inputs(inputs, n_rows)
+
+    bounds = dict(bounds or {})
+    for key in free_keys:
+        if key not in bounds:
+            bounds[key] = default_bounds(key, np.max(np.abs(columns[key])))
+        low, high = bounds[key]
+        if key in RATE_KEYS:
+            # Keep the search inside the range the form accepts
+            low, high = np.maximum(low, 0.0), np.minimum(high, 1.0)
+        bounds[key] = (np.maximum(low, 0.0), high)
+    t_low, t_high = _parameter_bounds(columns, free_keys, bounds)
+    if np.any(t_low > t_high):
+        raise ValueError("The bounds leave no room to move the free inputs")
+
+    t = np.full(n_rows, np.nan)
+    feasible = np.zeros(n_rows, dtype=bool)
+    method = np.full(n_rows, "bracketing", dtype=object)
+    all_rows = np.arange(n_rows)
+
+    # Closed form: sample five points; where they lie on a line, invert it
+    fractions = np.linspace(0.0, 1.0, 5)
+    probe_t = t_low[:, None] + (t_high - t_low)[:, None] * fractions
+    probes = _evaluate(columns, metric, free_keys, np.repeat(all_rows, 5), probe_t.ravel()).reshape(n_rows, 5)
+    f_low, f_high = probes[:, 0], probes[:, -1]
+    line = f_low[:, None] + (f_high - f_low)[:, None] * fractions
+    scale = np.maximum(np.abs(probes).max(axis=1), 1.0)
+    linear = np.all(np.isfinite(probes), axis=1) & np.all(np.abs(probes - line) <= 1e-9 * scale[:, None], axis=1)
+    slope = f_high - f_low
+    solvable = linear & (slope != 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_linear = t_low + (targets - f_low) / slope * (t_high - t_low)
+    in_range = solvable & (t_linear >= t_low) & (t_linear <= t_high)
+    if in_range.any():
+        rows = all_rows[in_range]
+        achieved = _evaluate(columns, metric, free_keys, rows, t_linear[rows])
+        # Guard against kinks the probes missed
+        ok = np.abs(achieved - targets[rows]) <= 1e-7 * np.maximum(np.abs(targets[rows]), 1.0)
+        t[rows[ok]] = t_linear[rows[ok]]
+        feasible[rows[ok]] = True
+        method[rows[ok]] = "closed form"
+
+    # Bracketing on a grid, then bisection inside the first bracket
+    rows = all_rows[~feasible]
+    if len(rows):
+        grid = t_low[rows, None] + (t_high - t_low)[rows, None] * np.linspace(0.0, 1.0, grid_points)
+        values = _evaluate(columns, metric, free_keys, np.repeat(rows, grid_points), grid.ravel())
+        gap = values.reshape(len(rows), grid_points) - targets[rows, None]
+        crossing = (np.sign(gap[:, :-1]) * np.sign(gap[:, 1:]) <= 0) & np.isfinite(gap[:, :-1]) & np.isfinite(gap[:, 1:])
+        bracketed = crossing.any(axis=1)
+
+        # Out of reach: the closest grid point is the best the bounds allow
+        closest = np.argmin(np.where(np.isfinite(gap), np.abs(gap), np.inf), axis=1)
+        missed = rows[~bracketed]
+        t[missed] = grid[~bracketed, closest[~bracketed]]
+        method[missed] = "closest"
+
+        # A sign change can also be a jump (e.g. a guarded ratio switching
+        # on), so a bracket only counts once bisection lands on the target
+        pending = np.flatnonzero(bracketed)
+        while len(pending):
+            first = np.argmax(crossing[pending], axis=1)
+            t_found = _bisect(columns, metric, free_keys, rows[pending], targets[rows[pending]],
+                              grid[pending, first], grid[pending, first + 1], gap[pending, first], max_iterations)
+            achieved = _evaluate(columns, metric, free_keys, rows[pending], t_found)
+            target_rows = targets[rows[pending]]
+            ok = np.abs(achieved - target_rows) <= 1e-6 * np.maximum(np.abs(target_rows), 1.0)
+            t[rows[pending[ok]]] = t_found[ok]
+            feasible[rows[pending[ok]]] = True
+            crossing[pending[~ok], first[~ok]] = False
+            pending = pending[~ok]
+            exhausted = ~crossing[pending].any(axis=1)
+            method[rows[pending[exhausted]]] = "closest"
+            t[rows[pending[exhausted]]] = grid[pending[exhausted], closest[pending[exhausted]]]
+            pending = pending[~exhausted]
+
+    if len(free_keys) == 1:
+        solved = {free_keys[0]: t}
+    else:
+        solved = {key: columns[key] * t for key in free_keys}
+    achieved = _evaluate(columns, metric, free_keys, all_rows, t)
+    return {"values": solved, "achieved": achieved, "feasible": feasible, "method": method}
+
+def goal_seek(base_inputs, metric, target, free_keys, bounds=None):
+    """Input values that make one scenario's metric equal target
+
+    Returns {"values": {key: value}, "achieved", "feasible", "method"}.
+    """
+    result = goal_seek_batch(base_inputs, metric, [target], free_keys, bounds)
+    return {
+        "values": {key: float(values[0]) for key, values in result["values"].items()},
+        "achieved": float(result["achieved"][0]),
+        "feasible": bool(result["feasible"][0]),
+        "method": result["method"][0],
+    }
+
+def break_even_curve(base_inputs, solve_for, over, over_values, metric="net_profit", target=0.0, bounds=None):
+    """Value of `solve_for` needed to reach target as `over` moves through over_values
+
+    For example, the leads needed to break even at each of 1,000 deal sizes.
+    """
+    inputs = {key: base_inputs.get(key, 0) for key in INPUT_KEYS}
+    inputs[over] = np.asarray(over_values, dtype=np.float64)
+    return goal_seek_batch(inputs, metric, target, [solve_for], bounds)
@@ -0,0 +1,201 @@
+"""Persistent simulation history in a local SQLite database"""
+from contextlib import closing
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from metrics import INPUT_KEYS, OUTPUT_KEYS
+
+# Columns that get their own index for fast filtering and sorting
+INDEXED_COLUMNS = ["name", "timestamp", "revenue", "net_profit", "roi", "customer_lifetime_value", "cac_ratio"]
+
+FILTER_OPERATORS = ["=", "!=", "<", "<=", ">", ">=", "LIKE"]
+
+META_COLUMNS = ["id", "sim_id", "name", "timestamp"]
+
+logger = logging.getLogger(__name__)
+
+class HistoryWriteError(Exception):
+    """Queued simulations that could not be written to the history database"""
+
+class SimulationHistory:
+    """Simulation runs persisted to SQLite, written in batches off the UI thread
+
+    `save` only queues a row; a daemon thread drains the queue and writes
+    whatever has accumulated in a single transaction. A batch that fails
+    (a locked database, a full disk) is retried `retries` times, then logged
+    and dropped; the writer keeps going, and the failure is raised as a
+    HistoryWriteError by the next `check` or `flush`. Reads open their own
+    connection and fetch one page at a time, so nothing is loaded up front.
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=0.25, retries=3):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self._columns = INPUT_KEYS + OUTPUT_KEYS
+        self._queue = queue.Queue()
+        self._failures = []
+        self._failures_lock = threading.Lock()
+        self._create_schema()
+        self._writer = threading.Thread(target=self._write_loop, name="simulation-history-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _create_schema(self):
+        value_columns = ", ".join(f"{column} REAL" for column in self._columns)
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS simulations ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, sim_id TEXT, name TEXT, timestamp TEXT, "
+                f"{value_columns})"
+            )
+            for column in INDEXED_COLUMNS:
+                connection.execute(f"CREATE INDEX IF NOT EXISTS idx_simulations_{column} ON simulations ({column})")
+
+    def _write_loop(self):
+        connection = None
+        placeholders = ", ".join("?" for _ in range(len(self._columns) + 3))
+        insert = f"INSERT INTO simulations (sim_id, name, timestamp, {', '.join(self._columns)}) VALUES ({placeholders})"
+        while True:
+            batch = [self._queue.get()]
+            # Gather whatever else arrives shortly after, up to the batch size
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            rows = [row for row in batch if row is not None]
+            try:
+                if rows:
+                    connection = self._write_batch(connection, insert, rows)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if None in batch:
+                if connection is not None:
+                    connection.close()
+                return
+
+    def _write_batch(self, connection, insert, rows):
+        """Insert rows in one transaction, retrying with a fresh connection; returns the connection to reuse"""
+        for attempt in range(self.retries + 1):
+            try:
+                if connection is None:
+                    connection = self._connect()
+                with connection:
+                    connection.executemany(insert, rows)
+                return connection
+            except sqlite3.Error as e:
+                error = e
+                if connection is not None:
+                    connection.close()
+                    connection = None
+                if attempt < self.retries:
+                    time.sleep(0.1 * 2 ** attempt)
+        logger.error("Could not write %d simulation(s) to %s: %s", len(rows), self.path, error)
+        with self._failures_lock:
+            self._failures.append((len(rows), error))
+        return None
+
+    def save(self, sim_id, name, timestamp, results):
+        """Queue one simulation for writing; returns immediately"""
+        if not self._writer.is_alive():
+            raise HistoryWriteError("The history writer has stopped; nothing more can be saved")
+        inputs = results["inputs"]
+        values = [inputs.get(key, 0) for key in INPUT_KEYS] + [results[key] for key in OUTPUT_KEYS]
+        self._queue.put((sim_id, name, timestamp, *[float(value) for value in values]))
+
+    def save_many(self, rows):
+        """Queue several (sim_id, name, timestamp, results) tuples"""
+        for row in rows:
+            self.save(*row)
+
+    def check(self):
+        """Raise HistoryWriteError for batches that failed since the last check"""
+        with self._failures_lock:
+            failures, self._failures = self._failures, []
+        if failures:
+            lost = sum(count for count, _ in failures)
+            raise HistoryWriteError(f"{lost:,} simulation(s) could not be saved to the history "
+                                    f"({failures[-1][1]})")
+
+    def flush(self):
+        """Block until every queued simulation has been written or has failed, then `check`"""
+        self._queue.join()
+        self.check()
+
+    def close(self):
+        """Write anything pending and stop the writer thread"""
+        self._queue.put(None)
+        self._writer.join()
+
+    def _where(self, filters):
+        """SQL WHERE clause and parameters from (column, operator, value) filters"""
+        clauses, params = [], []
+        for column, operator, value in filters or []:
+            if column not in self._columns and column not in META_COLUMNS:
+                raise ValueError(f"Unknown column '{column}'")
+            if operator not in FILTER_OPERATORS:
+                raise ValueError(f"Unsupported operator '{operator}'")
+            clauses.append(f"{column} {operator} ?")
+            params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def count(self, filters=None):
+        """Number of stored simulations matching the filters"""
+        where, params = self._where(filters)
+        with closing(self._connect()) as connection:
+            return connection.execute(f"SELECT COUNT(*) FROM simulations{where}", params).fetchone()[0]
+
+    def query(self, filters=None, columns=None, order_by="timestamp", descending=True, limit=50, offset=0):
+        """One page of simulations matching the filters, as a DataFrame
+
+        Filters are (column, operator, value) tuples combined with AND, e.g.
+        [("roi", ">", 200), ("timestamp", ">=", "2024-01-01")].
+        """
+        import pandas as pd
+
+        columns = list(columns or self._columns)
+        for column in columns + [order_by]:
+            if column not in self._columns and column not in META_COLUMNS:
+                raise ValueError(f"Unknown column '{column}'")
+        where, params = self._where(filters)
+        direction = "DESC" if descending else "ASC"
+        sql = (f"SELECT {', '.join(META_COLUMNS + [c for c in columns if c not in META_COLUMNS])} FROM simulations{where} "
+               f"ORDER BY {order_by} {direction}, id {direction} LIMIT ? OFFSET ?")
+        with closing(self._connect()) as connection:
+            return pd.read_sql_query(sql, connection, params=params + [int(limit), int(offset)])
+
+    def load(self, ids):
+        """Full result dicts for the given database ids, as {id: (name, timestamp, results)}"""
+        if not ids:
+            return {}
+        placeholders = ", ".join("?" for _ in ids)
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                f"SELECT id, name, timestamp, {', '.join(self._columns)} FROM simulations WHERE id IN ({placeholders})",
+                [int(i) for i in ids]
+            ).fetchall()
+        loaded = {}
+        for row in rows:
+            inputs = dict(zip(INPUT_KEYS, row[3:3 + len(INPUT_KEYS)]))
+            outputs = dict(zip(OUTPUT_KEYS, row[3 + len(INPUT_KEYS):]))
+            loaded[row[0]] = (row[1], row[2], {"inputs": inputs, **outputs})
+        return loaded
+
+    def delete(self, ids):
+        """Remove simulations by database id"""
+        # Pending rows must reach the table first; failed writes stay for the next check
+        self._queue.join()
+        placeholders = ", ".join("?" for _ in ids)
+        with closing(self._connect()) as connection, connection:
+            connection.execute(f"DELETE FROM simulations WHERE id IN ({placeholders})", [int(i) for i in ids])
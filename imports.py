@@ -0,0 +1,230 @@
+"""Bulk import of simulations exported from the Download tab
+
+Every export format can be read back: CSV, JSON, JSON Lines and Parquet
+(optionally gzipped), and the changes-only JSON. Each file is parsed
+straight into columns. The inputs are checked with vectorised rules and
+the rows go into the store in one `add_many` call, so importing tens of
+thousands of simulations does no per-row Python work after parsing.
+"""
+import gzip
+import io
+import itertools
+import json
+
+import numpy as np
+
+from exports import PYARROW_AVAILABLE
+from metrics import INPUT_KEYS, OUTPUT_KEYS, calculate_metrics_batch
+from schema import validate_input_columns
+
+_META_COLUMNS = ["Simulation ID", "Simulation Name", "Timestamp"]
+
+def _open(source):
+    """Binary file object for a path, bytes or file object, un-gzipped if needed"""
+    if isinstance(source, (bytes, bytearray)):
+        fileobj = io.BytesIO(source)
+    elif isinstance(source, str):
+        fileobj = open(source, "rb")
+    else:
+        fileobj = source
+    head = fileobj.read(2)
+    fileobj.seek(0)
+    return gzip.GzipFile(fileobj=fileobj) if head == b"\x1f\x8b" else fileobj
+
+def _format_of(file_name):
+    name = file_name.lower().removesuffix(".gz")
+    for extension, import_format in ((".parquet", "Parquet"), (".jsonl", "JSON Lines"), (".ndjson", "JSON Lines"),
+                                     (".json", "JSON"), (".csv", "CSV")):
+        if name.endswith(extension):
+            return import_format
+    raise ValueError(f"Cannot tell the format of '{file_name}'; expected .csv, .json, .jsonl or .parquet")
+
+def _frame_from_json(document):
+    """Export-layout frame (plus a Baseline column and the baselines) from either JSON export"""
+    import pandas as pd
+
+    if "simulations" in document and "baselines" in document:
+        # Changes-only export: each row is its baseline with the changed inputs applied
+        baselines = document["baselines"]
+        simulations = document["simulations"]
+        records = list(simulations.values())
+        baseline_names = [record["baseline"] for record in records]
+        unknown = set(baseline_names) - set(baselines)
+        if unknown:
+            raise ValueError(f"Simulations refer to missing baseline(s): {', '.join(sorted(unknown))}")
+        order = list(baselines)
+        base = np.array([[float(baselines[name].get(key, 0)) for key in INPUT_KEYS] for name in order])
+        index = {name: i for i, name in enumerate(order)}
+        inputs = pd.DataFrame(base[[index[name] for name in baseline_names]], columns=INPUT_KEYS)
+        changes = pd.DataFrame.from_records([record["changes"] for record in records])
+        if not changes.empty:
+            for key in changes.columns:
+                if key in inputs.columns:
+                    values = changes[key].to_numpy(dtype=np.float64, na_value=np.nan)
+                    given = ~np.isnan(values)
+                    inputs.loc[given, key] = values[given]
+                else:
+                    inputs[key] = changes[key]
+        df = inputs.rename(columns=lambda key: f"Input: {key}")
+        meta = {"Simulation ID": list(simulations), "Simulation Name": [record["name"] for record in records],
+                "Timestamp": [record["timestamp"] for record in records], "Baseline": baseline_names}
+        return pd.concat([pd.DataFrame(meta), df], axis=1), baselines
+
+    # Full export: {sim_id: {name, timestamp, data: {inputs, <metric>...}}}
+    records = list(document.values())
+    data = [record["data"] for record in records]
+    inputs = pd.DataFrame.from_records([row["inputs"] for row in data]).add_prefix("Input: ")
+    outputs = pd.DataFrame.from_records(data, exclude=["inputs"]).add_prefix("Output: ")
+    meta = pd.DataFrame({"Simulation ID": list(document), "Simulation Name": [record["name"] for record in records],
+                         "Timestamp": [record["timestamp"] for record in records]})
+    return pd.concat([meta, inputs, outputs], axis=1), None
+
+def read_export(source, file_name=None):
+    """(frame, baselines) read from an exported file
+
+    The frame has the CSV export's layout ("Simulation ID", "Simulation
+    Name", "Timestamp", "Input: ..." and "Output: ..." columns); the
+    changes-only JSON also gives a "Baseline" column and its baselines dict,
+    otherwise baselines is None. `source` is a path, bytes or a binary file
+    object; the format comes from `file_name` (or the path).
+    """
+    import pandas as pd
+
+    file_name = file_name or (source if isinstance(source, str) else getattr(source, "name", ""))
+    import_format = _format_of(file_name)
+    fileobj = _open(source)
+    text_columns = {column: str for column in _META_COLUMNS}
+    if import_format == "Parquet":
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("Parquet import requires pyarrow. Install with: pip install pyarrow")
+        return pd.read_parquet(fileobj), None
+    if import_format == "CSV":
+        # Only empty cells are missing, so a simulation named "NA" stays a name
+        return pd.read_csv(fileobj, dtype=text_columns, keep_default_na=False, na_values=[""]), None
+    if import_format == "JSON Lines":
+        return pd.read_json(fileobj, lines=True, dtype=text_columns, convert_dates=False), None
+    return _frame_from_json(json.load(fileobj))
+
+def input_columns(df):
+    """{input: array} from the "Input: " columns of an export frame, validated
+
+    Inputs missing from the file are 0, as for a dict; unknown inputs and
+    values outside their range raise ValueError naming the first bad row.
+    """
+    columns = {column.removeprefix("Input: "): df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+               for column in df.columns if column.startswith("Input: ")}
+    if not columns:
+        raise ValueError("No 'Input: ' columns found; is this a simulations export?")
+    validate_input_columns(columns)
+    return columns
+
+def verify_outputs(df, columns, rtol=1e-6, atol=1e-6):
+    """Recompute every metric in one batch and count rows that disagree with the file's "Output: " columns
+
+    Returns {metric: mismatched rows}, listing only metrics that differ.
+    Empty cells (e.g. an infinite ROI written as null) are not compared.
+    """
+    computed = calculate_metrics_batch(columns)
+    mismatches = {}
+    for key in OUTPUT_KEYS:
+        column = f"Output: {key}"
+        if column not in df.columns:
+            continue
+        stored = df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        bad = ~np.isclose(computed[key], stored, rtol=rtol, atol=atol, equal_nan=True) & ~np.isnan(stored)
+        if bad.any():
+            mismatches[key] = int(bad.sum())
+    return mismatches
+
+def _text(df, column, default):
+    if column not in df.columns:
+        return default
+    values = df[column].to_numpy(dtype=object)
+    values[df[column].isna().to_numpy()] = ""
+    return values.astype(str).tolist()
+
+def _baseline_targets(store, baselines):
+    """Store baseline name for each of a file's baselines
+
+    A baseline keeps its name if the store has no baseline of that name, or
+    has one with the same values. Otherwise it goes under the first of
+    "<name> (imported)", "<name> (imported 2)", ... that is free or holds the
+    same values, so rows are never stored against a different baseline.
+    """
+    taken = {name: store.baseline(name) for name in store.baselines()}
+    targets = {}
+    for name, values in baselines.items():
+        values = {**dict.fromkeys(INPUT_KEYS, 0), **values}
+        candidates = itertools.chain([name, f"{name} (imported)"],
+                                     (f"{name} (imported {i})" for i in itertools.count(2)))
+        target = next(target for target in candidates if taken.get(target, values) == values)
+        taken[target] = values
+        targets[name] = target
+    return targets
+
+def import_simulations(store, source, file_name=None, sim_ids=None, verify=False):
+    """Load every simulation in an exported file into a SimulationStore
+
+    `sim_ids` replaces the file's ids: a list, or a function of the number
+    of rows returning one (the app numbers imports after its own runs);
+    otherwise ids already in the store raise KeyError before anything
+    is added. With `verify`, outputs in the file are checked against a batch
+    recompute. Rows from the changes-only JSON keep their baselines, which
+    are added to the store under the same name (or "<name> (imported)",
+    "<name> (imported 2)", ... when the store already has a different
+    baseline of that name); they are added one baseline at a time. An import
+    is all or nothing: if adding any rows fails, the rows and baselines
+    already added are removed again.
+
+    Returns {"imported": n, "ids": [...], "mismatches": {metric: rows}}.
+    """
+    df, baselines = read_export(source, file_name)
+    columns = input_columns(df)
+    inputs = np.zeros((len(df), len(INPUT_KEYS)))
+    for i, key in enumerate(INPUT_KEYS):
+        if key in columns:
+            inputs[:, i] = columns[key]
+    mismatches = verify_outputs(df, columns) if verify else {}
+
+    if sim_ids is None:
+        sim_ids = _text(df, "Simulation ID", None)
+        if sim_ids is None:
+            raise ValueError("The file has no 'Simulation ID' column; pass sim_ids")
+    sim_ids = list(sim_ids(len(df)) if callable(sim_ids) else sim_ids)
+    if len(sim_ids) != len(df):
+        raise ValueError(f"Expected {len(df)} simulation ids, got {len(sim_ids)}")
+    if len(set(sim_ids)) != len(sim_ids):
+        raise KeyError("Simulation ids in the file must be unique")
+    clashes = [sim_id for sim_id in sim_ids if sim_id in store]
+    if clashes:
+        raise KeyError(f"Simulation(s) already exist: {', '.join(map(str, clashes[:5]))}"
+                       f"{'...' if len(clashes) > 5 else ''}")
+    names = _text(df, "Simulation Name", sim_ids)
+    timestamps = _text(df, "Timestamp", [""] * len(df))
+
+    if baselines is None:
+        store.add_many(sim_ids, names, timestamps, inputs)
+        return {"imported": len(sim_ids), "ids": sim_ids, "mismatches": mismatches}
+
+    # One add_many per baseline, so each row's changes stay relative to its own baseline
+    row_baselines = df["Baseline"].to_numpy(dtype=object)
+    targets = _baseline_targets(store, baselines)
+    added_ids, added_baselines = [], []
+    try:
+        for name, values in baselines.items():
+            rows = np.flatnonzero(row_baselines == name)
+            if not len(rows):
+                continue
+            target = targets[name]
+            if target not in store.baselines():
+                added_baselines.append(store.add_baseline(target, values))
+            ids = [sim_ids[row] for row in rows]
+            store.add_many(ids, [names[row] for row in rows], [timestamps[row] for row in rows], inputs[rows],
+                           baseline=target)
+            added_ids += ids
+    except Exception:
+        store.delete_many(added_ids)
+        for target in reversed(added_baselines):
+            store.remove_baseline(target)
+        raise
+    return {"imported": len(sim_ids), "ids": sim_ids, "mismatches": mismatches}
@@ -0,0 +1,35 @@
+"""Deferred imports for heavy optional dependencies"""
+import importlib
+import importlib.util
+import sys
+import types
+
+class LazyModule(types.ModuleType):
+    """Stand-in for a module that imports it on first attribute access"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        return getattr(self._module, attr)
+
+def lazy_import(name):
+    """Return `name` if already imported, otherwise a module that loads on first use
+
+    Lets the app bind names like `pd` at the top of the script while pandas,
+    plotly and friends load only once a view really uses them. The stand-in
+    is never put in sys.modules, so code that walks loaded modules does not
+    trigger the import by accident.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name.partition(".")[0]) is None:
+        raise ImportError(f"No module named '{name}'")
+    return LazyModule(name)
+
+def is_available(name):
+    """Whether a module can be imported, without importing it"""
+    return name in sys.modules or importlib.util.find_spec(name) is not None
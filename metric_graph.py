@@ -0,0 +1,296 @@
+"""Declarative dependency graph of the derived sales metrics
+
+Each metric is a formula over inputs and other metrics, written as a Python
+expression. `where(condition, value, default)` expresses the guarded ratios;
+it evaluates lazily for single scenarios and as a masked ufunc for batches,
+so both paths keep the `if revenue > 0 else 0` semantics of
+calculate_metrics. The scalar functions and every batch backend in kernel.py
+are generated from these formulas.
+"""
+import ast
+
+from metrics import INPUT_KEYS, OUTPUT_KEYS
+
+FORMULAS = {
+    # Sales and customer metrics
+    "booked_meetings": "leads * lead_booking_rate",
+    "customers": "booked_meetings * meeting_conversion_rate",
+    "revenue": "customers * average_deal_size",
+    "total_meeting_costs": "booked_meetings * cost_per_booked_meeting",
+    # Cost metrics
+    "variable_costs": "leads * cost_per_lead",
+    "commission": "revenue * sales_commission_rate",
+    "total_marketing_costs": "marketing_spend + media_spend",
+    "total_variable_costs": "variable_costs + commission + total_meeting_costs",
+    "total_costs": "fixed_costs + total_variable_costs + cogs + operating_expenses",
+    # Performance metrics
+    "gross_profit": "revenue - cogs",
+    "operating_profit": "gross_profit - operating_expenses",
+    "net_profit": "operating_profit - commission - total_marketing_costs",
+    "profit_margin": "where(revenue > 0, (net_profit / revenue) * 100, 0)",
+    "roi": "where(total_costs > 0, (net_profit / total_costs) * 100, 0)",
+    "customer_retention": "1 - churn_rate",
+    # Lifetime value metrics
+    "customer_lifetime": "where(churn_rate > 0, 1 / churn_rate, 0)",
+    "customer_lifetime_value": "(average_deal_size * profit_margin / 100) * customer_lifetime",
+    "cac_ratio": "where(customer_acquisition_cost > 0, customer_lifetime_value / customer_acquisition_cost, 0)",
+    # Special calculations
+    "discounts_given": "revenue * discount_rate",
+    "refunds_given": "revenue * refund_rate",
+    "seasonality_adjusted_revenue": "revenue",
+}
+
+class _WhereToIfExp(ast.NodeTransformer):
+    """Rewrite where(c, a, b) as `a if c else b` for scalar evaluation"""
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id == "where":
+            if len(node.args) != 3:
+                raise ValueError("where() takes a condition, a value and a default")
+            condition, value, default = node.args
+            return ast.IfExp(test=condition, body=value, orelse=default)
+        return node
+
+_UFUNCS = {ast.Add: "add", ast.Sub: "subtract", ast.Mult: "multiply", ast.Div: "divide"}
+_COMPARISONS = {ast.Gt: "greater", ast.GtE: "greater_equal", ast.Lt: "less", ast.LtE: "less_equal"}
+
+class _UfuncWriter:
+    """Statements evaluating formulas with NumPy ufuncs writing into preallocated rows
+
+    A formula becomes a chain of `np.<ufunc>(a, b, out=row)` calls applying
+    the same operations in the same order as evaluating it on whole arrays.
+    An operand that is an expression of its own goes through a scratch row.
+    where(c, a, b) fills the row with b, builds c in `mask` and evaluates a
+    with where=mask, so masked-out rows are never divided.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.scratch_rows = 0
+
+    def _operand(self, node, depth, where):
+        if isinstance(node, ast.Name):
+            return node.id
+        if isinstance(node, ast.Constant):
+            return repr(node.value)
+        self.scratch_rows = max(self.scratch_rows, depth + 1)
+        self.write(node, f"scratch[{depth}]", depth + 1, where)
+        return f"scratch[{depth}]"
+
+    def write(self, node, target, depth=0, where=None):
+        masked = f", where={where}" if where else ""
+        if isinstance(node, (ast.Name, ast.Constant)):
+            self.lines.append(f"np.copyto({target}, {self._operand(node, depth, where)}{masked})")
+        elif isinstance(node, ast.BinOp) and type(node.op) in _UFUNCS:
+            if isinstance(node.left, (ast.Name, ast.Constant)):
+                left = self._operand(node.left, depth, where)
+            else:
+                self.write(node.left, target, depth, where)
+                left = target
+            right = self._operand(node.right, depth, where)
+            self.lines.append(f"np.{_UFUNCS[type(node.op)]}({left}, {right}, out={target}{masked})")
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            self.lines.append(f"np.negative({self._operand(node.operand, depth, where)}, out={target}{masked})")
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "where" and not where:
+            condition, value, default = node.args
+            if not (isinstance(condition, ast.Compare) and len(condition.ops) == 1
+                    and type(condition.ops[0]) in _COMPARISONS):
+                raise ValueError(f"where() needs a single comparison, got {ast.unparse(condition)}")
+            self.write(default, target, depth)
+            left = self._operand(condition.left, depth, None)
+            right = self._operand(condition.comparators[0], depth + 1, None)
+            self.lines.append(f"np.{_COMPARISONS[type(condition.ops[0])]}({left}, {right}, out=mask)")
+            self.write(value, target, depth, "mask")
+        else:
+            raise ValueError(f"Cannot write {ast.unparse(node)} as ufuncs")
+
+class MetricGraph:
+    """Dependency graph over FORMULAS: scalar and incremental evaluation, and source for the batch kernels"""
+
+    def __init__(self, formulas=None):
+        self.formulas = dict(formulas or FORMULAS)
+        self.dependencies = {}
+        for metric, expression in self.formulas.items():
+            names = {node.id for node in ast.walk(ast.parse(expression, mode="eval"))
+                     if isinstance(node, ast.Name) and node.id != "where"}
+            unknown = names - set(INPUT_KEYS) - set(self.formulas)
+            if unknown:
+                raise ValueError(f"{metric} refers to unknown names: {', '.join(sorted(unknown))}")
+            self.dependencies[metric] = names
+
+        self.order = self._topological_order()
+        self.dependents = {name: set() for name in list(INPUT_KEYS) + self.order}
+        for metric, names in self.dependencies.items():
+            for name in names:
+                self.dependents[name].add(metric)
+
+        self._scalar_code, self.scalar_formulas = {}, {}
+        for metric in self.order:
+            tree = ast.parse(self.formulas[metric], mode="eval")
+            tree = ast.fix_missing_locations(_WhereToIfExp().visit(tree))
+            self._scalar_code[metric] = compile(tree, f"<metric {metric}>", "eval")
+            self.scalar_formulas[metric] = ast.unparse(tree)
+        self._scalar_functions = {}
+
+    def _topological_order(self):
+        order, visiting, done = [], set(), set()
+
+        def visit(metric):
+            if metric in done:
+                return
+            if metric in visiting:
+                raise ValueError(f"Circular dependency through {metric}")
+            visiting.add(metric)
+            for name in sorted(self.dependencies[metric]):
+                if name in self.formulas:
+                    visit(name)
+            visiting.discard(metric)
+            done.add(metric)
+            order.append(metric)
+
+        for metric in self.formulas:
+            visit(metric)
+        return order
+
+    def affected_by(self, name):
+        """Metrics downstream of an input or metric, in evaluation order"""
+        affected, stack = set(), [name]
+        while stack:
+            for dependent in self.dependents.get(stack.pop(), ()):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    stack.append(dependent)
+        return [metric for metric in self.order if metric in affected]
+
+    def input_impact(self):
+        """Map each input to the metrics it affects"""
+        return {key: self.affected_by(key) for key in INPUT_KEYS}
+
+    def upstream_inputs(self, metric):
+        """Inputs a metric ultimately depends on"""
+        inputs, stack, seen = set(), [metric], set()
+        while stack:
+            for name in self.dependencies.get(stack.pop(), ()):
+                if name in seen:
+                    continue
+                seen.add(name)
+                if name in self.formulas:
+                    stack.append(name)
+                else:
+                    inputs.add(name)
+        return [key for key in INPUT_KEYS if key in inputs]
+
+    def recompute(self, values, metrics):
+        """Re-evaluate the given metrics in place, in the order given"""
+        for metric in metrics:
+            values[metric] = eval(self._scalar_code[metric], {"__builtins__": {}}, values)
+
+    def evaluate(self, inputs):
+        """Evaluate every metric for one scenario given as a dict of scalars"""
+        values = {key: inputs.get(key, 0) for key in INPUT_KEYS}
+        self.recompute(values, self.order)
+        return values
+
+    def used_inputs(self):
+        """Inputs some formula reads, in INPUT_KEYS order"""
+        return [key for key in INPUT_KEYS if self.dependents[key]]
+
+    def scalar_source(self, layout="dict"):
+        """Python source of a function evaluating every metric for one scenario
+
+        With layout "dict" the function takes a dict of inputs (missing ones
+        read as 0) and returns calculate_metrics' layout; with "record" it
+        takes an InputRecord and returns a new SimulationRecord. Either way
+        the formulas are straight-line code, as if written out by hand.
+        """
+        if layout == "dict":
+            lines = ["def calculate(inputs):", "    get = inputs.get"]
+            lines += [f"    {key} = get({key!r}, 0)" for key in self.used_inputs()]
+        elif layout == "record":
+            lines = ["def calculate(inputs):"]
+            lines += [f"    {key} = inputs.{key}" for key in self.used_inputs()]
+        else:
+            raise ValueError(f"Unknown layout '{layout}'; choose 'dict' or 'record'")
+        lines += [f"    {metric} = {self.scalar_formulas[metric]}" for metric in self.order]
+        if layout == "dict":
+            outputs = "".join(f", {metric!r}: {metric}" for metric in OUTPUT_KEYS)
+            lines.append(f"    return {{'inputs': inputs{outputs}}}")
+        else:
+            lines += ["    record = SimulationRecord.__new__(SimulationRecord)", "    record.inputs = inputs"]
+            lines += [f"    record.{metric} = {metric}" for metric in OUTPUT_KEYS]
+            lines.append("    return record")
+        return "\n".join(lines) + "\n"
+
+    def compile_scalar(self, layout="dict"):
+        """Compile scalar_source for a layout (once per graph)"""
+        if layout not in self._scalar_functions:
+            from schema import SimulationRecord
+
+            namespace = {"SimulationRecord": SimulationRecord}
+            exec(compile(self.scalar_source(layout), f"<scalar metrics ({layout})>", "exec"), namespace)
+            self._scalar_functions[layout] = namespace["calculate"]
+        return self._scalar_functions[layout]
+
+    def ufunc_source(self):
+        """(source, scratch rows) of a function evaluating every formula with ufuncs
+
+        The function is `metric_chunk(x, out, mask, scratch)`: x maps inputs
+        to arrays of n rows, out is the (len(OUTPUT_KEYS), n) result, and
+        mask (bool, n) and scratch (scratch rows, n) are working space.
+        Nothing is allocated, so it can run chunk by chunk over a buffer.
+        """
+        lines = ["def metric_chunk(x, out, mask, scratch):"]
+        lines += [f"    {key} = x[{key!r}]" for key in self.used_inputs()]
+        lines += [f"    {metric} = out[{OUTPUT_KEYS.index(metric)}]" for metric in self.order]
+        writer = _UfuncWriter()
+        for metric in self.order:
+            writer.write(ast.parse(self.formulas[metric], mode="eval").body, metric)
+        lines += [f"    {line}" for line in writer.lines]
+        return "\n".join(lines) + "\n", writer.scratch_rows
+
+    def loop_source(self):
+        """Python source of a row-by-row loop over every formula, for numba
+
+        The function is `metric_loop(<one array per used input>, out)`,
+        taking the inputs in used_inputs() order and writing row i of each
+        metric to out[OUTPUT_KEYS.index(metric), i]. Rows are independent,
+        so the loop is a prange.
+        """
+        used_inputs = self.used_inputs()
+        lines = [f"def metric_loop({', '.join(f'{key}_column' for key in used_inputs)}, out):",
+                 "    for i in prange(out.shape[1]):"]
+        lines += [f"        {key} = {key}_column[i]" for key in used_inputs]
+        lines += [f"        {metric} = {self.scalar_formulas[metric]}" for metric in self.order]
+        lines += [f"        out[{OUTPUT_KEYS.index(metric)}, i] = {metric}" for metric in self.order]
+        return "\n".join(lines) + "\n"
+
+class IncrementalEvaluator:
+    """Keeps one scenario's metrics current, recomputing only what changes touch"""
+
+    def __init__(self, inputs, graph=None):
+        self.graph = graph or METRIC_GRAPH
+        self.values = self.graph.evaluate(inputs)
+
+    def update(self, changes):
+        """Apply input changes and return the metrics that were recomputed"""
+        changed = {key: value for key, value in changes.items() if self.values.get(key) != value}
+        if not changed:
+            return []
+        self.values.update(changed)
+        dirty = set()
+        for key in changed:
+            dirty.update(self.graph.affected_by(key))
+        recomputed = [metric for metric in self.graph.order if metric in dirty]
+        self.graph.recompute(self.values, recomputed)
+        return recomputed
+
+    @property
+    def inputs(self):
+        return {key: self.values[key] for key in INPUT_KEYS}
+
+    def results(self):
+        """Metrics in the same layout as calculate_metrics"""
+        return {"inputs": self.inputs, **{metric: self.values[metric] for metric in OUTPUT_KEYS}}
+
+METRIC_GRAPH = MetricGraph()
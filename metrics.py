@@ -0,0 +1,158 @@
+"""Sales metric calculations shared by the app and batch tools"""
+import numpy as np
+
+# Input keys in the order they appear on the simulation form
+INPUT_KEYS = [
+    # Sales metrics
+    "leads", "lead_booking_rate", "meeting_conversion_rate", "average_deal_size",
+    "sales_cycle_length", "number_of_sdrs", "time_to_sell_days", "sales_commission_rate",
+    # Marketing metrics
+    "cost_per_lead", "cost_per_booked_meeting", "marketing_spend", "media_spend",
+    "total_addressable_market", "funnel_conversion_rate", "click_through_rate",
+    "organic_views", "cost_per_thousand_impressions",
+    # Offer metrics
+    "price_of_offer", "churn_rate", "contract_length", "price_of_renewal",
+    "rate_of_renewals", "discount_rate", "refund_rate", "customer_acquisition_cost",
+    # Operations metrics
+    "cogs", "operating_expenses", "fixed_costs", "cost_to_fulfil",
+    # Cash metrics
+    "initial_number_of_customers", "cash_in_bank",
+]
+
+# Inputs entered as whole numbers on the form
+INTEGER_KEYS = [
+    "leads", "sales_cycle_length", "number_of_sdrs", "time_to_sell_days",
+    "total_addressable_market", "organic_views", "contract_length",
+    "initial_number_of_customers",
+]
+
+# Inputs stored as fractions (entered as percentages on the form)
+RATE_KEYS = [
+    "lead_booking_rate", "meeting_conversion_rate", "sales_commission_rate",
+    "funnel_conversion_rate", "click_through_rate", "churn_rate",
+    "rate_of_renewals", "discount_rate", "refund_rate",
+]
+
+# Starting values of the simulation form, as inputs (rates as fractions); the
+# baseline that saved simulations are stored as changes against
+FORM_DEFAULTS = {
+    "leads": 100, "lead_booking_rate": 0.2, "meeting_conversion_rate": 0.3, "average_deal_size": 1000.0,
+    "sales_cycle_length": 30, "number_of_sdrs": 2, "time_to_sell_days": 45, "sales_commission_rate": 0.05,
+    "cost_per_lead": 10.0, "cost_per_booked_meeting": 50.0, "marketing_spend": 5000.0, "media_spend": 3000.0,
+    "total_addressable_market": 100000, "funnel_conversion_rate": 0.15, "click_through_rate": 0.025,
+    "organic_views": 5000, "cost_per_thousand_impressions": 25.0,
+    "price_of_offer": 500.0, "churn_rate": 0.1, "contract_length": 12, "price_of_renewal": 450.0,
+    "rate_of_renewals": 0.7, "discount_rate": 0.1, "refund_rate": 0.05, "customer_acquisition_cost": 200.0,
+    "cogs": 5000.0, "operating_expenses": 10000.0, "fixed_costs": 15000.0, "cost_to_fulfil": 200.0,
+    "initial_number_of_customers": 100, "cash_in_bank": 50000.0,
+}
+
+# Derived metrics in the order calculate_metrics returns them
+OUTPUT_KEYS = [
+    "booked_meetings", "customers", "revenue", "variable_costs", "commission",
+    "total_marketing_costs", "total_variable_costs", "total_costs", "gross_profit",
+    "operating_profit", "net_profit", "profit_margin", "roi", "customer_retention",
+    "customer_lifetime", "customer_lifetime_value", "cac_ratio", "discounts_given",
+    "refunds_given", "seasonality_adjusted_revenue", "total_meeting_costs",
+]
+
+# Metrics offered for comparison and analysis, with display labels
+METRIC_OPTIONS = {
+    "revenue": "Revenue",
+    "gross_profit": "Gross Profit",
+    "operating_profit": "Operating Profit",
+    "net_profit": "Net Profit",
+    "profit_margin": "Profit Margin",
+    "roi": "ROI",
+    "booked_meetings": "Booked Meetings",
+    "customers": "Customers",
+    "customer_lifetime_value": "Customer Lifetime Value",
+    "cac_ratio": "CLTV/CAC Ratio",
+    "total_costs": "Total Costs",
+    "total_marketing_costs": "Total Marketing Costs",
+    "total_meeting_costs": "Total Meeting Costs"
+}
+
+_INPUT_SET = frozenset(INPUT_KEYS)
+
+# Per-scenario evaluators generated from METRIC_GRAPH on first use (metric_graph imports this module)
+_scalar_functions = {}
+
+def _scalar_function(layout):
+    function = _scalar_functions.get(layout)
+    if function is None:
+        from metric_graph import METRIC_GRAPH
+        function = _scalar_functions[layout] = METRIC_GRAPH.compile_scalar(layout)
+    return function
+
+def calculate_metrics(inputs, validate=False):
+    """Calculate all metrics from input data
+
+    `inputs` is a dict keyed by INPUT_KEYS (inputs left out count as 0) or an
+    InputRecord. A misspelled key raises ValueError. The values of a dict are
+    only checked against the InputRecord rules with `validate`: the form's
+    widgets already keep them in range, and a record was checked when built.
+    """
+    if not isinstance(inputs, dict):
+        from schema import InputRecord
+
+        if isinstance(inputs, InputRecord):
+            return calculate_record(inputs).to_dict()
+        inputs = dict(inputs)
+    if validate or not _INPUT_SET.issuperset(inputs):
+        from schema import InputRecord
+
+        InputRecord.from_dict(inputs)  # raises ValueError naming the bad input
+    return _scalar_function("dict")(inputs)
+
+def calculate_record(inputs):
+    """All metrics for one InputRecord, as a SimulationRecord"""
+    return _scalar_function("record")(inputs)
+
+def clip_to_form_range(key, values):
+    """Clip values to the range the simulation form accepts for an input"""
+    if key in RATE_KEYS:
+        return np.clip(values, 0.0, 1.0)
+    return np.maximum(values, 0.0)
+
+def input_column_reader(inputs):
+    """Row count and a float64 column accessor for batch inputs
+
+    Accepts a DataFrame, a dict of equal-length arrays or a structured array
+    (see schema.INPUT_DTYPE). Missing inputs read
+    as zeros, matching the `inputs.get(key, 0)` defaults of the scalar path.
+    """
+    # Structured arrays (schema.INPUT_DTYPE and friends) are read field by field
+    names = inputs.dtype.names if getattr(inputs, "dtype", None) is not None else None
+    present = [key for key in INPUT_KEYS if key in (names or inputs)]
+    if not present:
+        raise ValueError("No known input columns were provided")
+    n_rows = len(inputs[present[0]])
+
+    def column(key):
+        if key not in (names or inputs):
+            return np.zeros(n_rows)
+        values = np.asarray(inputs[key], dtype=np.float64)
+        if values.shape != (n_rows,):
+            raise ValueError(f"Input '{key}' has shape {values.shape}, expected ({n_rows},)")
+        return values
+
+    return n_rows, column
+
+def calculate_metrics_batch(inputs, backend="auto"):
+    """Calculate all metrics for many scenarios at once
+
+    Takes a DataFrame, a structured array or a dict of equal-length arrays
+    keyed by the same input names as calculate_metrics, and returns the
+    derived metrics as columns (a DataFrame for a DataFrame). Missing inputs
+    default to 0 and the guarded ratios use the same conditions as the
+    scalar path. The formulas run through kernel.evaluate, generated from
+    METRIC_GRAPH like calculate_metrics, so each row matches calculate_metrics
+    (to the last bit on the numpy and numba backends).
+
+    The columns are rows of one buffer: copy a column you keep on its own,
+    or the whole buffer stays alive with it.
+    """
+    from kernel import evaluate
+
+    return evaluate(inputs, backend)
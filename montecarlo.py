@@ -0,0 +1,240 @@
+"""Monte Carlo simulation over uncertain sales inputs"""
+import numpy as np
+
+from kernel import evaluate, output_buffer
+from metrics import INPUT_KEYS, clip_to_form_range
+
+DISTRIBUTION_TYPES = ["normal", "triangular", "lognormal", "empirical"]
+
+# Metrics summarised by default
+MONTE_CARLO_METRICS = ["revenue", "net_profit", "roi", "customer_lifetime_value"]
+
+def _norm_cdf(z):
+    """Standard normal CDF (Abramowitz & Stegun 7.1.26, error < 1.5e-7)"""
+    x = np.abs(z) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-x * x)
+    return 0.5 * (1.0 + np.sign(z) * erf)
+
+def validate_distribution(key, spec):
+    """Check a distribution spec and raise ValueError if it is unusable"""
+    kind = spec.get("type")
+    if kind not in DISTRIBUTION_TYPES:
+        raise ValueError(f"{key}: unknown distribution type '{kind}'")
+    if kind == "normal" and spec.get("std", 0) < 0:
+        raise ValueError(f"{key}: standard deviation must be non-negative")
+    if kind == "triangular" and not spec["low"] <= spec["mode"] <= spec["high"]:
+        raise ValueError(f"{key}: triangular requires low <= mode <= high")
+    if kind == "lognormal" and (spec.get("median", 0) <= 0 or spec.get("sigma", 0) < 0):
+        raise ValueError(f"{key}: lognormal requires a positive median and non-negative sigma")
+    if kind == "empirical" and len(spec.get("values", [])) == 0:
+        raise ValueError(f"{key}: empirical distribution needs at least one value")
+
+def default_distribution(kind, base_value):
+    """Suggest a distribution of the given type centred on a point estimate"""
+    base_value = float(base_value)
+    if kind == "normal":
+        return {"type": "normal", "mean": base_value, "std": abs(base_value) * 0.1}
+    if kind == "triangular":
+        return {"type": "triangular", "low": base_value * 0.8, "mode": base_value, "high": base_value * 1.2}
+    if kind == "lognormal":
+        return {"type": "lognormal", "median": base_value if base_value > 0 else 1.0, "sigma": 0.1}
+    if kind == "empirical":
+        return {"type": "empirical", "values": [base_value * 0.9, base_value, base_value * 1.1]}
+    raise ValueError(f"Unknown distribution type '{kind}'")
+
+def _sample(spec, z):
+    """Map correlated standard normal scores onto a distribution"""
+    kind = spec["type"]
+    if kind == "normal":
+        return spec["mean"] + spec["std"] * z
+    if kind == "lognormal":
+        return spec["median"] * np.exp(spec["sigma"] * z)
+
+    u = _norm_cdf(z)
+    if kind == "triangular":
+        low, mode, high = spec["low"], spec["mode"], spec["high"]
+        if high == low:
+            return np.full_like(u, low)
+        split = (mode - low) / (high - low)
+        left = low + np.sqrt(u * (high - low) * (mode - low))
+        right = high - np.sqrt((1 - u) * (high - low) * (high - mode))
+        return np.where(u < split, left, right)
+    if kind == "empirical":
+        values = np.sort(np.asarray(spec["values"], dtype=np.float64))
+        positions = np.linspace(0.0, 1.0, len(values)) if len(values) > 1 else np.zeros(1)
+        return np.interp(u, positions, values)
+    raise ValueError(f"Unknown distribution type '{kind}'")
+
+class QuantileSketch:
+    """Fixed-size streaming histogram for approximate quantiles
+
+    Counts go into `n_bins` equal-width bins. When a value falls outside the
+    current range the bin width doubles and adjacent bins are merged, so
+    memory stays constant and quantile error stays within one bin width.
+    """
+
+    def __init__(self, n_bins=4096):
+        self.n_bins = n_bins - n_bins % 2
+        self.counts = np.zeros(self.n_bins, dtype=np.int64)
+        self.low = None
+        self.width = None
+        self.count = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def high(self):
+        return self.low + self.width * self.n_bins
+
+    def _grow(self, downward):
+        """Double the bin width, keeping existing counts"""
+        merged = self.counts[0::2] + self.counts[1::2]
+        half = self.n_bins // 2
+        self.counts = np.zeros(self.n_bins, dtype=np.int64)
+        if downward:
+            self.counts[half:] = merged
+            self.low -= self.width * self.n_bins
+        else:
+            self.counts[:half] = merged
+        self.width *= 2
+
+    def _cover(self, low, high):
+        """Grow the range until it spans [low, high]"""
+        if self.low is None:
+            span = max(high - low, abs(low) * 1e-9, 1e-9)
+            self.low = low - span * 0.05
+            self.width = span * 1.1 / self.n_bins
+        while low < self.low:
+            self._grow(downward=True)
+        while high >= self.high:
+            self._grow(downward=False)
+
+    def _add(self, values, weights=None):
+        bins = ((values - self.low) / self.width).astype(np.int64)
+        np.clip(bins, 0, self.n_bins - 1, out=bins)
+        self.counts += np.bincount(bins, weights=weights, minlength=self.n_bins).astype(np.int64)
+
+    def update(self, values):
+        """Add a block of values to the sketch"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return
+        block_min, block_max = values.min(), values.max()
+        self._cover(block_min, block_max)
+        self._add(values)
+        self.count += values.size
+        self.total += values.sum()
+        self.min = min(self.min, block_min)
+        self.max = max(self.max, block_max)
+
+    def merge(self, other):
+        """Fold another sketch into this one (e.g. from a worker process)"""
+        if other.count == 0:
+            return
+        self._cover(other.min, other.max)
+        mask = other.counts > 0
+        centres = other.low + other.width * (np.flatnonzero(mask) + 0.5)
+        self._add(np.clip(centres, other.min, other.max), weights=other.counts[mask])
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Approximate quantile(s) for q in [0, 1]"""
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        cumulative = np.cumsum(self.counts)
+        target = np.asarray(q, dtype=np.float64) * self.count
+        idx = np.searchsorted(cumulative, target, side="left")
+        idx = np.clip(idx, 0, self.n_bins - 1)
+        below = np.where(idx > 0, cumulative[idx - 1], 0)
+        in_bin = np.maximum(self.counts[idx], 1)
+        fraction = np.clip((target - below) / in_bin, 0.0, 1.0)
+        result = self.low + self.width * (idx + fraction)
+        return np.clip(result, self.min, self.max)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else np.nan
+
+    def histogram(self, n_bins=50):
+        """Rebin the sketch between the observed min and max for charting"""
+        if self.count == 0:
+            return np.zeros(0), np.zeros(0)
+        edges = np.linspace(self.min, self.max, n_bins + 1) if self.max > self.min \
+            else np.array([self.min - 0.5, self.max + 0.5])
+        centres = np.clip(self.low + self.width * (np.arange(self.n_bins) + 0.5), self.min, self.max)
+        counts, edges = np.histogram(centres, bins=edges, weights=self.counts)
+        return counts, edges
+
+def run_monte_carlo(base_inputs, distributions, n_samples=100_000, chunk_size=20_000,
+                    correlations=None, metrics=None, seed=None, n_bins=4096):
+    """Sample uncertain inputs in chunks and summarise the resulting metrics
+
+    `distributions` maps input keys to distribution specs; every other input
+    is held at its value in `base_inputs`. `correlations` is an optional
+    square matrix over the keys of `distributions` (in order), applied through
+    a Gaussian copula. Only one chunk of samples is held at a time and results
+    are accumulated into fixed-size quantile sketches; metrics for every
+    chunk are written into the same preallocated buffer.
+    """
+    metrics = list(metrics or MONTE_CARLO_METRICS)
+    varied = list(distributions)
+    for key in varied:
+        if key not in INPUT_KEYS:
+            raise ValueError(f"Unknown input '{key}'")
+        validate_distribution(key, distributions[key])
+
+    cholesky = None
+    if correlations is not None and len(varied) > 1:
+        matrix = np.asarray(correlations, dtype=np.float64)
+        if matrix.shape != (len(varied), len(varied)):
+            raise ValueError("Correlation matrix must be square and match the varied inputs")
+        if not np.allclose(matrix, matrix.T) or not np.allclose(np.diag(matrix), 1.0):
+            raise ValueError("Correlation matrix must be symmetric with ones on the diagonal")
+        try:
+            cholesky = np.linalg.cholesky(matrix)
+        except np.linalg.LinAlgError:
+            raise ValueError("Correlation matrix must be positive definite")
+
+    rng = np.random.default_rng(seed)
+    sketches = {metric: QuantileSketch(n_bins) for metric in metrics}
+    input_sketches = {key: QuantileSketch(n_bins) for key in varied}
+    buffer = output_buffer(min(chunk_size, int(n_samples)))
+
+    remaining = int(n_samples)
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        remaining -= size
+
+        z = rng.standard_normal((size, len(varied)))
+        if cholesky is not None:
+            z = z @ cholesky.T
+
+        columns = {key: np.full(size, float(base_inputs.get(key, 0))) for key in INPUT_KEYS}
+        for i, key in enumerate(varied):
+            values = clip_to_form_range(key, _sample(distributions[key], z[:, i]))
+            columns[key] = values
+            input_sketches[key].update(values)
+
+        results = evaluate(columns, out=buffer[:, :size])
+        for metric in metrics:
+            sketches[metric].update(results[metric])
+
+    return {"n_samples": int(n_samples), "metrics": sketches, "inputs": input_sketches}
+
+def summarize(sketches, percentiles=(5, 50, 95)):
+    """Percentile table rows for a dict of quantile sketches"""
+    rows = []
+    for name, sketch in sketches.items():
+        row = {"Metric": name}
+        for p, value in zip(percentiles, sketch.quantile(np.array(percentiles) / 100)):
+            row[f"P{p}"] = float(value)
+        row["Mean"] = float(sketch.mean)
+        rows.append(row)
+    return rows
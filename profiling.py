@@ -0,0 +1,146 @@
+"""Optional timing of app reruns, split into named stages
+
+Switched on with SIM_PROFILE=1 in the environment (or ?profile=1 in the app's
+URL). While off, every hook is a cheap no-op.
+"""
+from collections import defaultdict, deque
+from contextlib import contextmanager
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Histogram bucket edges in milliseconds, roughly logarithmic
+HISTOGRAM_EDGES_MS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf")]
+
+class Profiler:
+    """Rolling window of recent durations per stage, plus bytes sent per download
+
+    Shared by every session in the process, like the report cache, so the
+    panel and JSON export describe the server as a whole.
+    """
+
+    def __init__(self, window=500, enabled=False):
+        self.window = window
+        self.enabled = enabled
+        self._durations = defaultdict(lambda: deque(maxlen=self.window))
+        self._bytes = defaultdict(int)
+        self._downloads = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        if self.enabled:
+            with self._lock:
+                self._durations[stage].append(seconds * 1000)
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as one sample of `name`"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """Decorator recording each call of a function as one sample of `name`"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def rerun(self):
+        """Start timing a script rerun; see RerunTimer"""
+        return RerunTimer(self)
+
+    def track_download(self, name, build):
+        """Wrap a download_button data callable to time it and count the bytes it produces"""
+        def tracked():
+            if not self.enabled:
+                return build()
+            start = time.perf_counter()
+            data = build()
+            self.record(f"download: {name}", time.perf_counter() - start)
+            if hasattr(data, "seek"):
+                size = data.seek(0, os.SEEK_END)
+                data.seek(0)
+            else:
+                size = len(data.encode() if isinstance(data, str) else data)
+            with self._lock:
+                self._bytes[name] += size
+                self._downloads[name] += 1
+            return data
+        return tracked
+
+    def histogram(self, stage):
+        """Sample counts per HISTOGRAM_EDGES_MS bucket for one stage"""
+        with self._lock:
+            samples = np.array(self._durations.get(stage, ()), dtype=float)
+        counts, _ = np.histogram(samples, bins=HISTOGRAM_EDGES_MS)
+        return counts
+
+    def summary(self):
+        """Per-stage latency statistics over the rolling window, in milliseconds"""
+        with self._lock:
+            windows = {stage: np.array(samples, dtype=float) for stage, samples in self._durations.items()}
+        rows = []
+        for stage, samples in sorted(windows.items()):
+            if len(samples) == 0:
+                continue
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            rows.append({"stage": stage, "samples": len(samples), "mean_ms": float(samples.mean()),
+                         "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+                         "max_ms": float(samples.max())})
+        return rows
+
+    def downloads(self):
+        """Bytes and count per download since the process started"""
+        with self._lock:
+            return {name: {"bytes": self._bytes[name], "count": self._downloads[name]} for name in self._bytes}
+
+    def to_json(self):
+        """Everything the panel shows, as a JSON document for monitoring"""
+        return json.dumps({
+            "generated_at": time.time(),
+            "window": self.window,
+            "histogram_edges_ms": [edge if edge != float("inf") else None for edge in HISTOGRAM_EDGES_MS],
+            "stages": [{**row, "histogram": self.histogram(row["stage"]).tolist()} for row in self.summary()],
+            "downloads": self.downloads(),
+        }, indent=2)
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._bytes.clear()
+            self._downloads.clear()
+
+class RerunTimer:
+    """Splits one script rerun into consecutive stages
+
+    Call `lap(name)` at the end of each section of the script: the time since
+    the previous lap is recorded under `name`, and `finish()` records the
+    whole rerun as "rerun total".
+    """
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.start = self._last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.profiler.record(name, now - self._last)
+        self._last = now
+
+    def finish(self):
+        self.profiler.record("rerun total", time.perf_counter() - self.start)
+
+profiler = Profiler(enabled=os.environ.get("SIM_PROFILE", "").lower() in ("1", "true", "yes"))
@@ -0,0 +1,120 @@
+"""Month-by-month cohort projection of customers, MRR and cash"""
+import numpy as np
+
+from metrics import input_column_reader
+
+DAYS_PER_MONTH = 30
+
+# Series returned by project_batch, each shaped (scenarios, months)
+PROJECTION_SERIES = ["leads", "new_customers", "customers", "mrr", "receipts", "costs", "net_cash_flow", "cash_balance"]
+
+def project_batch(inputs, months=60, seasonality=None, start_month=0, keep_history=False):
+    """Project many scenarios forward month by month
+
+    Each scenario keeps a cohort matrix of active customers by acquisition
+    month alongside the monthly fee each cohort pays. Every period the matrix
+    is updated in place: monthly churn applies to all cohorts, cohorts reaching
+    the end of a contract keep `rate_of_renewals` of their customers and move
+    to renewal pricing, and a new cohort joins from leads generated
+    `sales_cycle_length` days earlier. Monthly lead volume is scaled by the
+    optional 12-month `seasonality` multipliers, starting at `start_month`
+    (0 = January).
+
+    Monetary and volume inputs are treated as monthly figures. The initial
+    customers form cohort 0 on renewal pricing. Returns a dict of
+    PROJECTION_SERIES arrays plus `runway_months` (months until the cash
+    balance first goes negative, inf if it never does within the horizon).
+    With keep_history, `cohort_history` holds the full (scenarios, months,
+    cohorts) matrix, so only use it for a handful of scenarios.
+    """
+    months = int(months)
+    if months < 1:
+        raise ValueError("Projection needs at least one month")
+    if seasonality is None:
+        seasonality = np.ones(12)
+    seasonality = np.asarray(seasonality, dtype=np.float64)
+    if seasonality.shape != (12,):
+        raise ValueError("Seasonality needs one multiplier per calendar month")
+
+    n_rows, column = input_column_reader(inputs)
+    contract = np.maximum(np.rint(column("contract_length")).astype(np.int64), 1)
+    lag = np.maximum(np.rint(column("sales_cycle_length") / DAYS_PER_MONTH).astype(np.int64), 0)
+    retention = 1 - np.clip(column("churn_rate"), 0, 1)
+    renewal_rate = np.clip(column("rate_of_renewals"), 0, 1)
+    new_fee = column("average_deal_size") / contract
+    renewal_fee = column("price_of_renewal") / contract
+    booking_rate = column("lead_booking_rate")
+    funnel_rate = booking_rate * column("meeting_conversion_rate")
+
+    # Lead volume per month, and the customers those leads turn into once the sales cycle completes
+    period = np.arange(months)
+    monthly_leads = column("leads")[:, None] * seasonality[(start_month + period) % 12][None, :]
+    closes_at = period[None, :] - lag[:, None]
+    new_customers = np.where(
+        closes_at >= 0,
+        column("leads")[:, None] * seasonality[(start_month + closes_at) % 12] * funnel_rate[:, None],
+        0.0
+    )
+
+    # Cohort 0 holds the initial customers, cohort c joins in period c - 1
+    n_cohorts = months + 1
+    joined = np.maximum(np.arange(n_cohorts) - 1, 0)
+    active = np.zeros((n_rows, n_cohorts))
+    fee = np.zeros((n_rows, n_cohorts))
+    active[:, 0] = column("initial_number_of_customers")
+    fee[:, 0] = renewal_fee
+
+    customers = np.empty((n_rows, months))
+    mrr = np.empty((n_rows, months))
+    history = np.zeros((n_rows, months, n_cohorts)) if keep_history else None
+
+    for t in range(months):
+        live = t + 1
+        if t > 0:
+            cohort_active = active[:, :live]
+            cohort_active *= retention[:, None]
+            age = t - joined[:live]
+            due = (age > 0) & (age % contract[:, None] == 0)
+            cohort_active[due] *= np.broadcast_to(renewal_rate[:, None], due.shape)[due]
+            fee[:, :live][due] = np.broadcast_to(renewal_fee[:, None], due.shape)[due]
+
+        active[:, live] = new_customers[:, t]
+        fee[:, live] = new_fee
+        customers[:, t] = active[:, :live + 1].sum(axis=1)
+        mrr[:, t] = np.einsum("ij,ij->i", active[:, :live + 1], fee[:, :live + 1])
+        if keep_history:
+            history[:, t, :live + 1] = active[:, :live + 1]
+
+    # Cash flow: receipts net of discounts and refunds against monthly costs
+    receipts = mrr * ((1 - column("discount_rate")) * (1 - column("refund_rate")))[:, None]
+    overheads = (column("fixed_costs") + column("operating_expenses") + column("cogs")
+                 + column("marketing_spend") + column("media_spend"))
+    acquisition_costs = monthly_leads * (column("cost_per_lead") + booking_rate * column("cost_per_booked_meeting"))[:, None]
+    closing_costs = new_customers * (column("average_deal_size") * column("sales_commission_rate") + column("cost_to_fulfil"))[:, None]
+    costs = overheads[:, None] + acquisition_costs + closing_costs
+    net_cash_flow = receipts - costs
+    cash_balance = column("cash_in_bank")[:, None] + np.cumsum(net_cash_flow, axis=1)
+
+    negative = cash_balance < 0
+    runway_months = np.where(negative.any(axis=1), negative.argmax(axis=1) + 1, np.inf).astype(np.float64)
+
+    results = {
+        "leads": monthly_leads,
+        "new_customers": new_customers,
+        "customers": customers,
+        "mrr": mrr,
+        "receipts": receipts,
+        "costs": costs,
+        "net_cash_flow": net_cash_flow,
+        "cash_balance": cash_balance,
+        "runway_months": runway_months,
+    }
+    if keep_history:
+        results["cohort_history"] = history
+    return results
+
+def project(inputs, months=60, seasonality=None, start_month=0, keep_history=False):
+    """Project a single scenario given as a dict of scalar inputs"""
+    columns = {key: np.array([value], dtype=np.float64) for key, value in inputs.items()}
+    results = project_batch(columns, months, seasonality, start_month, keep_history)
+    return {key: values[0] for key, values in results.items()}
@@ -0,0 +1,184 @@
+"""PDF report generation with a content-hash cache and background workers"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import io
+import multiprocessing
+import threading
+import zipfile
+
+from lazy import is_available
+from profiling import profiler
+from shared_cache import canonical_key, shared_cache
+
+# ReportLab is only imported once a report is actually rendered
+REPORTLAB_AVAILABLE = is_available("reportlab")
+
+_styles = None
+_table_style = None
+
+def _report_styles():
+    """Paragraph and table styles, built once per process"""
+    global _styles, _table_style
+    if _styles is None:
+        from reportlab.lib import colors
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.platypus import TableStyle
+
+        _styles = getSampleStyleSheet()
+        _table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (1, 0), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (1, 0), 12),
+            ('BACKGROUND', (0, 1), (1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('ALIGN', (1, 1), (1, -1), 'RIGHT'),
+        ])
+    return _styles, _table_style
+
+def _section(elements, title, rows):
+    """Append a titled two-column table to the report"""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Spacer, Table
+
+    styles, table_style = _report_styles()
+    elements.append(Paragraph(title, styles['Heading2']))
+    table = Table([["Metric", "Value"]] + rows, colWidths=[2.5*inch, 2.5*inch])
+    table.setStyle(table_style)
+    elements.append(table)
+    elements.append(Spacer(1, 0.25*inch))
+
+def create_pdf_report(sim_data, sim_name, timestamp=None):
+    """Create a PDF report for a simulation
+
+    `timestamp` is when the simulation was run, as saved with it. The report
+    carries no render time, so identical content always gives the same PDF
+    and a cached copy is never stale.
+    """
+    if not REPORTLAB_AVAILABLE:
+        return None
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+    # Create buffer for PDF
+    buffer = io.BytesIO()
+
+    # Create the PDF object
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    elements = []
+    styles, _ = _report_styles()
+    inputs = sim_data['inputs']
+
+    # Add title
+    elements.append(Paragraph(f"Simulation Report: {sim_name}", styles['Heading1']))
+    elements.append(Spacer(1, 0.25*inch))
+
+    # Add timestamp
+    if timestamp:
+        elements.append(Paragraph(f"Simulation run on: {timestamp}", styles['Normal']))
+        elements.append(Spacer(1, 0.25*inch))
+
+    _section(elements, "Summary Results", [
+        ["Revenue", f"£{sim_data['revenue']:,.2f}"],
+        ["Net Profit", f"£{sim_data['net_profit']:,.2f}"],
+        ["ROI", f"{sim_data['roi']:.2f}%"],
+        ["Customers", f"{sim_data['customers']:.0f}"],
+        ["Customer Lifetime Value", f"£{sim_data['customer_lifetime_value']:,.2f}"]
+    ])
+
+    _section(elements, "Revenue Breakdown", [
+        ["Revenue", f"£{sim_data['revenue']:,.2f}"],
+        ["Discounts", f"-£{sim_data['discounts_given']:,.2f}"],
+        ["Refunds", f"-£{sim_data['refunds_given']:,.2f}"],
+        ["Net Revenue", f"£{sim_data['revenue'] - sim_data['discounts_given'] - sim_data['refunds_given']:,.2f}"],
+        ["Gross Profit", f"£{sim_data['gross_profit']:,.2f}"],
+        ["Operating Profit", f"£{sim_data['operating_profit']:,.2f}"],
+        ["Profit Margin", f"{sim_data['profit_margin']:.2f}%"]
+    ])
+
+    other_variable = sim_data['total_variable_costs'] - sim_data['commission'] - sim_data['total_meeting_costs']
+    _section(elements, "Cost Breakdown", [
+        ["Fixed Costs", f"£{inputs.get('fixed_costs', 0):,.2f}"],
+        ["Marketing", f"£{sim_data['total_marketing_costs']:,.2f}"],
+        ["COGS", f"£{inputs.get('cogs', 0):,.2f}"],
+        ["Commission", f"£{sim_data['commission']:,.2f}"],
+        ["Meeting Costs", f"£{sim_data['total_meeting_costs']:,.2f}"],
+        ["Other Variable", f"£{other_variable:,.2f}"],
+        ["Total Costs", f"£{sim_data['total_costs']:,.2f}"]
+    ])
+
+    _section(elements, "Customer Metrics", [
+        ["Leads", f"{inputs.get('leads', 0):,.0f}"],
+        ["Booked Meetings", f"{sim_data['booked_meetings']:,.0f}"],
+        ["Customers", f"{sim_data['customers']:,.0f}"],
+        ["Customer Acquisition Cost", f"£{inputs.get('customer_acquisition_cost', 0):,.2f}"],
+        ["CLTV/CAC Ratio", f"{sim_data['cac_ratio']:.2f}x"],
+        ["Customer Retention", f"{sim_data['customer_retention']:.2%}"]
+    ])
+
+    # Build the PDF
+    doc.build(elements)
+
+    # Get the value of the PDF
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
+
+def report_key(sim_data, sim_name, timestamp=None):
+    """Shared-cache key identifying a report by its content"""
+    return canonical_key("report", sim_data, sim_name, timestamp)
+
+# Rendered PDFs live in the process-wide shared cache alongside other results
+report_cache = shared_cache
+_report_worker = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-report")
+_pending = {}
+_pending_lock = threading.Lock()
+
+def _render_and_cache(key, sim_data, sim_name, timestamp):
+    try:
+        with profiler.stage("pdf report"):
+            pdf = create_pdf_report(sim_data, sim_name, timestamp)
+        if pdf is not None:
+            report_cache.put(key, pdf)
+        return pdf
+    finally:
+        with _pending_lock:
+            _pending.pop(key, None)
+
+def request_report(sim_data, sim_name, timestamp=None):
+    """Cached PDF bytes, or None while the report renders in the background
+
+    The first request for a report queues it on a worker thread; later calls
+    return the bytes once rendering has finished.
+    """
+    key = report_key(sim_data, sim_name, timestamp)
+    pdf = report_cache.get(key)
+    if pdf is not None:
+        return pdf
+    with _pending_lock:
+        if key not in _pending:
+            _pending[key] = _report_worker.submit(_render_and_cache, key, sim_data, sim_name, timestamp)
+    return None
+
+def build_report_pack(reports, processes=None):
+    """Render (sim_data, sim_name, timestamp, file_name) reports across processes into one zip"""
+    buffer = io.BytesIO()
+    pending = []
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as pack:
+        # Reuse anything already rendered and only farm out the rest
+        for sim_data, sim_name, timestamp, file_name in reports:
+            key = report_key(sim_data, sim_name, timestamp)
+            pdf = report_cache.get(key)
+            if pdf is None:
+                pending.append((key, sim_data, sim_name, timestamp, file_name))
+            else:
+                pack.writestr(file_name, pdf)
+        if pending:
+            # Spawned workers avoid forking the threaded Streamlit server
+            with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+                rendered = pool.map(create_pdf_report, *zip(*(p[1:4] for p in pending)))
+                for (key, *_, file_name), pdf in zip(pending, rendered):
+                    report_cache.put(key, pdf)
+                    pack.writestr(file_name, pdf)
+    return buffer.getvalue()
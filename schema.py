@@ -0,0 +1,215 @@
+"""Typed records for simulation inputs and results
+
+A single run is an InputRecord (one slot per input, checked once when it is
+built) and a SimulationRecord (the inputs plus one slot per metric). Slots
+make a record a fraction of the size of the equivalent dict, and a misspelled
+input raises instead of quietly reading as 0.
+
+Collections of runs are NumPy structured arrays of SIMULATION_DTYPE (or
+INPUT_DTYPE for inputs alone). Every field is float64, so an array can be
+viewed as a 2-D float matrix and handed to pandas without copying.
+"""
+import difflib
+import math
+import numbers
+
+import numpy as np
+
+from metrics import INPUT_KEYS, INTEGER_KEYS, OUTPUT_KEYS, RATE_KEYS, calculate_metrics_batch
+
+INPUT_DTYPE = np.dtype([(key, np.float64) for key in INPUT_KEYS])
+OUTPUT_DTYPE = np.dtype([(key, np.float64) for key in OUTPUT_KEYS])
+SIMULATION_DTYPE = np.dtype([(key, np.float64) for key in INPUT_KEYS + OUTPUT_KEYS])
+
+_INPUT_SET = frozenset(INPUT_KEYS)
+_INTEGER_SET = frozenset(INTEGER_KEYS)
+_RATE_SET = frozenset(RATE_KEYS)
+
+def _unknown_message(unknown):
+    parts = []
+    for key in sorted(map(str, unknown)):
+        close = difflib.get_close_matches(key, INPUT_KEYS, n=1)
+        parts.append(f"'{key}' (did you mean '{close[0]}'?)" if close else f"'{key}'")
+    return f"Unknown input(s): {', '.join(parts)}"
+
+def _check_value(key, value):
+    """One input value checked against its range and units; whole-number inputs come back as int"""
+    if type(value) is not float and type(value) is not int:
+        if isinstance(value, bool) or not isinstance(value, numbers.Real):
+            raise ValueError(f"Input '{key}' must be a number, got {value!r}")
+        value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f"Input '{key}' must be finite, got {value!r}")
+    if key in _RATE_SET:
+        if not 0 <= value <= 1:
+            hint = f" (rates are fractions: {value / 100:g} for {value:g}%)" if 1 < value <= 100 else ""
+            raise ValueError(f"Rate '{key}' must be between 0 and 1, got {value:g}{hint}")
+        return float(value)
+    if value < 0:
+        raise ValueError(f"Input '{key}' must not be negative, got {value:g}")
+    if key in _INTEGER_SET:
+        if value != int(value):
+            raise ValueError(f"Input '{key}' must be a whole number, got {value:g}")
+        return int(value)
+    return float(value)
+
+class InputRecord:
+    """Validated inputs for one simulation
+
+    Build from keyword arguments or `from_dict`; inputs left out are 0, as
+    on the dict path. Rates are fractions in [0, 1], other inputs are
+    non-negative and INTEGER_KEYS are whole numbers.
+    """
+
+    __slots__ = tuple(INPUT_KEYS)
+
+    def __init__(self, **inputs):
+        unknown = inputs.keys() - _INPUT_SET
+        if unknown:
+            raise ValueError(_unknown_message(unknown))
+        get = inputs.get
+        for key, setter in _INPUT_SETTERS:
+            setter(self, _check_value(key, get(key, 0)))
+
+    @classmethod
+    def from_dict(cls, inputs):
+        return cls(**inputs)
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in INPUT_KEYS}
+
+    def __eq__(self, other):
+        return isinstance(other, InputRecord) and all(getattr(self, k) == getattr(other, k) for k in INPUT_KEYS)
+
+    def __repr__(self):
+        changed = ", ".join(f"{key}={getattr(self, key)!r}" for key in INPUT_KEYS if getattr(self, key))
+        return f"InputRecord({changed})"
+
+# Slot descriptors, so filling a record skips the attribute lookup by name
+_INPUT_SETTERS = [(key, getattr(InputRecord, key).__set__) for key in INPUT_KEYS]
+
+class SimulationRecord:
+    """One simulation's inputs (an InputRecord) and every derived metric"""
+
+    __slots__ = ("inputs",) + tuple(OUTPUT_KEYS)
+
+    def __init__(self, inputs, **outputs):
+        missing = [key for key in OUTPUT_KEYS if key not in outputs]
+        if missing or len(outputs) != len(OUTPUT_KEYS):
+            raise ValueError(f"Expected every metric in OUTPUT_KEYS; missing {missing or 'none'}, "
+                             f"unexpected {sorted(outputs.keys() - set(OUTPUT_KEYS)) or 'none'}")
+        self.inputs = inputs if isinstance(inputs, InputRecord) else InputRecord.from_dict(inputs)
+        for key in OUTPUT_KEYS:
+            setattr(self, key, outputs[key])
+
+    @classmethod
+    def from_dict(cls, results):
+        """Record from a calculate_metrics-style result dict"""
+        return cls(results["inputs"], **{key: results[key] for key in OUTPUT_KEYS})
+
+    def to_dict(self):
+        """The calculate_metrics layout: {"inputs": {...}, <metric>: value, ...}"""
+        return {"inputs": self.inputs.to_dict(), **{key: getattr(self, key) for key in OUTPUT_KEYS}}
+
+    @classmethod
+    def from_validated(cls, inputs, outputs):
+        """Record from an InputRecord and a complete dict of metrics, skipping the checks"""
+        record = cls.__new__(cls)
+        record.inputs = inputs
+        for setter, value in zip(_OUTPUT_SETTERS, outputs.values()):
+            setter(record, value)
+        return record
+
+    def __repr__(self):
+        return f"SimulationRecord(revenue={self.revenue!r}, net_profit={self.net_profit!r}, inputs={self.inputs!r})"
+
+_OUTPUT_SETTERS = [getattr(SimulationRecord, key).__set__ for key in OUTPUT_KEYS]
+
+# Collections
+
+def validate_input_columns(columns):
+    """Check input columns (arrays keyed by input) against the same rules as InputRecord, vectorised"""
+    unknown = set(columns) - _INPUT_SET
+    if unknown:
+        raise ValueError(_unknown_message(unknown))
+    for key in columns:
+        values = np.asarray(columns[key], dtype=np.float64)
+        if key in _RATE_SET:
+            bad = ~((values >= 0) & (values <= 1))
+            rule = "must be between 0 and 1 (rates are fractions)"
+        else:
+            bad = ~(np.isfinite(values) & (values >= 0))
+            rule = "must be finite and not negative"
+            if key in _INTEGER_SET:
+                bad |= np.isfinite(values) & (values != np.round(values))
+                rule = "must be a whole number, finite and not negative"
+        if bad.any():
+            rows = np.flatnonzero(bad)
+            raise ValueError(f"Input '{key}' {rule}: {len(rows):,} bad row(s), first at row {rows[0]} "
+                             f"({values[rows[0]]:g})")
+
+def input_array(inputs):
+    """Validated INPUT_DTYPE array from a dict of columns or a DataFrame; missing inputs are 0"""
+    columns = {key: inputs[key] for key in inputs} if not hasattr(inputs, "columns") else \
+        {key: inputs[key].to_numpy() for key in inputs.columns}
+    validate_input_columns(columns)
+    n_rows = len(next(iter(columns.values()))) if columns else 0
+    array = np.zeros(n_rows, dtype=INPUT_DTYPE)
+    for key, values in columns.items():
+        array[key] = values
+    return array
+
+def simulation_array(inputs):
+    """Validated inputs plus every metric, as a SIMULATION_DTYPE array"""
+    inputs = input_array(inputs)
+    array = np.empty(len(inputs), dtype=SIMULATION_DTYPE)
+    as_matrix(array)[:, :len(INPUT_KEYS)] = as_matrix(inputs)
+    outputs = calculate_metrics_batch(inputs)
+    for key in OUTPUT_KEYS:
+        array[key] = outputs[key]
+    return array
+
+def as_matrix(array):
+    """A (rows x fields) float64 view of a structured array; no copy"""
+    return array.view(np.float64).reshape(len(array), len(array.dtype.names))
+
+def to_frame(array):
+    """DataFrame over a structured array's memory, without copying
+
+    The frame shares the array's buffer, so treat it as read-only (pandas'
+    copy-on-write protects the array from edits made through the frame).
+    """
+    import pandas as pd
+
+    return pd.DataFrame(as_matrix(array), columns=list(array.dtype.names), copy=False)
+
+def from_frame(df, dtype=SIMULATION_DTYPE):
+    """Structured array from a DataFrame with the dtype's columns
+
+    Frames made by to_frame come back as a view of the original array, with
+    no copy; any other frame is copied once into row-major order.
+    """
+    names = list(dtype.names)
+    matrix = df[names].to_numpy(dtype=np.float64, copy=False) if list(df.columns) != names else \
+        df.to_numpy(dtype=np.float64, copy=False)
+    return np.ascontiguousarray(matrix).view(dtype).reshape(len(df))
+
+def to_arrow(array):
+    """pyarrow Table with one float64 column per field
+
+    Arrow stores columns contiguously, so each field is copied once out of
+    the row-major records.
+    """
+    import pyarrow as pa
+
+    return pa.table({name: np.ascontiguousarray(array[name]) for name in array.dtype.names})
+
+def from_arrow(table, dtype=SIMULATION_DTYPE):
+    """Structured array from a pyarrow Table with the dtype's columns
+
+    Each column is read without copying and written once into the records.
+    """
+    array = np.empty(table.num_rows, dtype=dtype)
+    for name in dtype.names:
+        array[name] = table.column(name).to_numpy()
+    return array
@@ -0,0 +1,197 @@
+"""Parameter sweeps and sensitivity analysis for the sales metrics"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+
+import numpy as np
+
+from metrics import INPUT_KEYS, calculate_metrics_batch, clip_to_form_range
+
+def _base_columns(base_inputs, n_rows):
+    """Repeat every base input n_rows times"""
+    return {key: np.full(n_rows, float(base_inputs.get(key, 0))) for key in INPUT_KEYS}
+
+def sweep_1d(base_inputs, key, values, metrics):
+    """Evaluate metrics while one input moves through a range of values"""
+    values = clip_to_form_range(key, np.asarray(values, dtype=np.float64))
+    columns = _base_columns(base_inputs, len(values))
+    columns[key] = values
+    results = calculate_metrics_batch(columns)
+    return {metric: results[metric] for metric in metrics}
+
+def tornado(base_inputs, metric, keys=None, swing=0.2):
+    """One-way sensitivity of a metric to each input moved by +/- swing
+
+    All low/high scenarios are evaluated in a single batch. Returns rows
+    sorted by the width of the metric's range, largest first.
+    """
+    keys = [k for k in (keys or INPUT_KEYS) if float(base_inputs.get(k, 0)) != 0]
+    n_keys = len(keys)
+    columns = _base_columns(base_inputs, 2 * n_keys + 1)
+    for i, key in enumerate(keys):
+        base_value = float(base_inputs.get(key, 0))
+        columns[key][2 * i] = clip_to_form_range(key, base_value * (1 - swing))
+        columns[key][2 * i + 1] = clip_to_form_range(key, base_value * (1 + swing))
+    values = calculate_metrics_batch(columns)[metric]
+    base_value = float(values[-1])
+
+    rows = []
+    for i, key in enumerate(keys):
+        low, high = float(values[2 * i]), float(values[2 * i + 1])
+        rows.append({
+            "input": key,
+            "low": low,
+            "high": high,
+            "low_change": low - base_value,
+            "high_change": high - base_value,
+            "range": abs(high - low),
+        })
+    rows.sort(key=lambda row: row["range"], reverse=True)
+    return base_value, rows
+
+def _evaluate_grid_rows(base_inputs, x_key, x_values, y_key, y_values, metric):
+    """Metric values for a block of grid rows, shape (len(y_values), len(x_values))"""
+    n_x, n_y = len(x_values), len(y_values)
+    columns = _base_columns(base_inputs, n_x * n_y)
+    columns[x_key] = np.tile(clip_to_form_range(x_key, x_values), n_y)
+    columns[y_key] = np.repeat(clip_to_form_range(y_key, y_values), n_x)
+    # Copied out of the batch's buffer so a finished block does not keep every metric alive
+    return calculate_metrics_batch(columns)[metric].reshape(n_y, n_x).copy()
+
+def sweep_2d(base_inputs, x_key, x_values, y_key, y_values, metric, chunk_rows=50, processes=None):
+    """Two-way sweep that yields the grid in row chunks as they finish
+
+    Yields (row_start, row_stop, block) tuples, where block holds the metric
+    for y_values[row_start:row_stop] against every x value. With `processes`
+    set, chunks are evaluated across a process pool and yielded in completion
+    order; otherwise they are evaluated in-process one after another.
+    """
+    if x_key == y_key:
+        raise ValueError("Choose two different inputs for a two-way sweep")
+    x_values = np.asarray(x_values, dtype=np.float64)
+    y_values = np.asarray(y_values, dtype=np.float64)
+    starts = range(0, len(y_values), chunk_rows)
+
+    if not processes:
+        for start in starts:
+            stop = min(start + chunk_rows, len(y_values))
+            yield start, stop, _evaluate_grid_rows(base_inputs, x_key, x_values, y_key, y_values[start:stop], metric)
+        return
+
+    # Spawned workers avoid forking the threaded Streamlit server
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {}
+        for start in starts:
+            stop = min(start + chunk_rows, len(y_values))
+            future = pool.submit(_evaluate_grid_rows, base_inputs, x_key, x_values, y_key, y_values[start:stop], metric)
+            futures[future] = (start, stop)
+        for future in as_completed(futures):
+            start, stop = futures[future]
+            yield start, stop, future.result()
+
+def _primes(count):
+    """The first `count` primes"""
+    primes, candidate = [], 2
+    while len(primes) < count:
+        if all(candidate % p for p in primes if p * p <= candidate):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+def _scrambled_halton(n, d, rng):
+    """n points of a d-dimensional Halton sequence with random digit permutations
+
+    Permuting the digits of each base (keeping 0 fixed) breaks up the
+    correlation between high dimensions that plain Halton suffers from.
+    """
+    indices = np.arange(1, n + 1)
+    points = np.empty((n, d))
+    for j, base in enumerate(_primes(d)):
+        permutation = np.concatenate([[0], rng.permutation(np.arange(1, base))])
+        remaining = indices.copy()
+        value = np.zeros(n)
+        scale = 1.0 / base
+        while remaining.any():
+            value += permutation[remaining % base] * scale
+            remaining //= base
+            scale /= base
+        points[:, j] = value
+    return points
+
+def quasi_random(n, d, seed=None):
+    """n low-discrepancy points in [0, 1)^d
+
+    Uses scipy's scrambled Sobol sequence when scipy is installed, otherwise a
+    scrambled Halton sequence computed with NumPy.
+    """
+    try:
+        from scipy.stats import qmc
+    except ImportError:
+        return _scrambled_halton(n, d, np.random.default_rng(seed))
+    return qmc.Sobol(d, scramble=True, seed=seed).random(n)
+
+def _evaluate_design(base_inputs, keys, unit_points, low, high, metric):
+    """Metric values for design points scaled from the unit cube onto [low, high]"""
+    columns = _base_columns(base_inputs, len(unit_points))
+    for j, key in enumerate(keys):
+        columns[key] = low[j] + unit_points[:, j] * (high[j] - low[j])
+    # Copied out of the batch's buffer, which holds every metric, so only this one is kept
+    return calculate_metrics_batch(columns)[metric].copy()
+
+def sobol_indices(base_inputs, metric, keys=None, ranges=None, swing=0.2, n=2**14, seed=None, processes=None):
+    """First-order and total Sobol indices of a metric with respect to the given inputs
+
+    Each input (default: every input with a nonzero base value) varies
+    uniformly over ranges[key], or its base value +/- swing, clipped to the
+    form's range. A Saltelli design of n*(k+2)
+    evaluations for k inputs is built from a 2k-dimensional quasi-random
+    sample; first-order indices use the Saltelli (2010) estimator and totals
+    the Jansen estimator. With `processes` set, the k+2 design blocks are
+    evaluated across a process pool.
+
+    Returns (rows, details): rows sorted by total index, largest first, and a
+    dict with the metric's mean, variance and the number of evaluations.
+    """
+    keys = [k for k in (keys or INPUT_KEYS) if keys or float(base_inputs.get(k, 0)) != 0]
+    if not keys:
+        raise ValueError("Choose at least one input")
+    ranges = ranges or {}
+    low, high = [], []
+    for key in keys:
+        base_value = float(base_inputs.get(key, 0))
+        key_low, key_high = ranges.get(key, (base_value * (1 - swing), base_value * (1 + swing)))
+        key_low, key_high = clip_to_form_range(key, np.array([min(key_low, key_high), max(key_low, key_high)]))
+        low.append(key_low)
+        high.append(key_high)
+    low, high = np.array(low), np.array(high)
+
+    k = len(keys)
+    sample = quasi_random(n, 2 * k, seed)
+    a, b = sample[:, :k], sample[:, k:]
+    blocks = [a, b]
+    for i in range(k):
+        ab = a.copy()
+        ab[:, i] = b[:, i]
+        blocks.append(ab)
+
+    if processes:
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+            values = list(pool.map(_evaluate_design, *zip(*[(base_inputs, keys, block, low, high, metric)
+                                                             for block in blocks])))
+    else:
+        values = [_evaluate_design(base_inputs, keys, block, low, high, metric) for block in blocks]
+    f_a, f_b, f_ab = values[0], values[1], np.array(values[2:])
+
+    variance = np.var(np.concatenate([f_a, f_b]))
+    rows = []
+    for i, key in enumerate(keys):
+        if variance > 0:
+            first = float(np.mean(f_b * (f_ab[i] - f_a)) / variance)
+            total = float(0.5 * np.mean((f_a - f_ab[i]) ** 2) / variance)
+        else:
+            first = total = 0.0
+        rows.append({"input": key, "low": float(low[i]), "high": float(high[i]),
+                     "first_order": first, "total": total})
+    rows.sort(key=lambda row: row["total"], reverse=True)
+    details = {"mean": float(np.mean(np.concatenate([f_a, f_b]))), "variance": float(variance),
+               "evaluations": n * (k + 2)}
+    return rows, details
@@ -0,0 +1,158 @@
+"""Process-wide cache of computed results, shared by every session
+
+Results are keyed on a canonical hash of their inputs, so two sessions that
+submit the same scenario (or the same values typed as 1 and 1.0) share one
+entry. The cache is bounded by an estimate of the bytes it holds, evicts the
+least recently used entries first, expires entries after a time-to-live and
+counts hits and misses per namespace.
+"""
+from collections import OrderedDict, defaultdict
+import hashlib
+import json
+import numbers
+import sys
+import threading
+import time
+
+import numpy as np
+
+def _canonical(value):
+    """JSON-safe form of a value in which equal inputs look identical"""
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, np.ndarray):
+        data = np.ascontiguousarray(value, dtype=np.float64 if value.dtype.kind in "biuf" else value.dtype)
+        return {"array": hashlib.sha256(data.tobytes()).hexdigest(), "shape": list(value.shape)}
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, numbers.Number):
+        # Integers and floats with the same value share a key
+        value = float(value)
+        return value if np.isfinite(value) else repr(value)
+    return repr(value)
+
+def canonical_key(namespace, *args, **kwargs):
+    """(namespace, digest) key for a computation on the given arguments"""
+    payload = json.dumps([_canonical(args), _canonical(kwargs)], sort_keys=True, separators=(",", ":"))
+    return namespace, hashlib.sha256(payload.encode()).hexdigest()
+
+def estimate_size(value):
+    """Approximate bytes held by a cached value"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+def _freeze(value):
+    """Make cached arrays read-only so one session cannot change another's result"""
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, dict):
+        for item in value.values():
+            _freeze(item)
+    return value
+
+class SharedCache:
+    """Thread-safe LRU cache bounded by bytes, with optional TTL and per-namespace counters
+
+    Keys are (namespace, digest) tuples from canonical_key. Cached values
+    must be treated as read-only; arrays inside them are frozen.
+    """
+
+    def __init__(self, max_bytes=256 << 20, ttl=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = defaultdict(int)
+        self._misses = defaultdict(int)
+        self._evictions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+                self._drop(key)
+                self._evictions[key[0]] += 1
+                entry = None
+            if entry is None:
+                self._misses[key[0]] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits[key[0]] += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        size = estimate_size(value) if size is None else size
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (_freeze(value), size, expires)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._evictions[oldest[0]] += 1
+        return value
+
+    def get_or_compute(self, key, compute):
+        """Cached value for key, computing and storing it on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, compute())
+        return value
+
+    def stats(self):
+        """Entries, bytes, hits, misses and evictions per namespace"""
+        with self._lock:
+            rows = defaultdict(lambda: {"entries": 0, "bytes": 0})
+            for (namespace, _), (_, size, _) in self._entries.items():
+                rows[namespace]["entries"] += 1
+                rows[namespace]["bytes"] += size
+            namespaces = set(rows) | set(self._hits) | set(self._misses)
+            return {namespace: {**rows[namespace], "hits": self._hits[namespace], "misses": self._misses[namespace],
+                                "evictions": self._evictions[namespace]}
+                    for namespace in sorted(namespaces)}
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+shared_cache = SharedCache()
+
+def cached_metrics(inputs):
+    """calculate_metrics through the shared cache; returns a private copy of the result"""
+    from metrics import calculate_metrics
+
+    result = shared_cache.get_or_compute(canonical_key("metrics", inputs), lambda: calculate_metrics(inputs))
+    return {**result, "inputs": dict(result["inputs"])}
+
+def cached_projection(inputs, months=60, seasonality=None, start_month=0, keep_history=False):
+    """projection.project through the shared cache; arrays in the result are read-only"""
+    from projection import project
+
+    key = canonical_key("projection", inputs, months=months, seasonality=seasonality, start_month=start_month,
+                        keep_history=keep_history)
+    return shared_cache.get_or_compute(key, lambda: project(inputs, months=months, seasonality=seasonality,
+                                                            start_month=start_month, keep_history=keep_history))
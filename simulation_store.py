@@ -0,0 +1,502 @@
+"""Columnar storage for saved simulations"""
+import numpy as np
+
+from kernel import evaluate
+from metrics import FORM_DEFAULTS, INPUT_KEYS, INTEGER_KEYS, OUTPUT_KEYS, calculate_metrics_batch, calculate_record
+from schema import SIMULATION_DTYPE, InputRecord, SimulationRecord, as_matrix
+
+# Every stored numeric column: inputs first, then derived metrics
+STORE_COLUMNS = INPUT_KEYS + OUTPUT_KEYS
+
+# Column headings used by the all-simulations export
+EXPORT_COLUMN_NAMES = {
+    **{key: f"Input: {key}" for key in INPUT_KEYS},
+    **{key: f"Output: {key}" for key in OUTPUT_KEYS},
+}
+
+# Name of the baseline every store starts with
+DEFAULT_BASELINE = "Form defaults"
+
+_INPUT_INDEX = {key: i for i, key in enumerate(INPUT_KEYS)}
+_INPUT_NAMES = np.array(INPUT_KEYS, dtype=object)
+_IS_INTEGER_INPUT = np.isin(INPUT_KEYS, INTEGER_KEYS)
+
+def _input_value(key, value):
+    """A stored input as the form would report it: whole numbers as int"""
+    value = float(value)
+    return int(value) if key in INTEGER_KEYS and value.is_integer() else value
+
+class SimulationStore:
+    """Saved simulations held as changes against named baselines, plus id/name/timestamp arrays
+
+    Most scenarios differ from their baseline (by default the form's
+    starting values) in a handful of inputs, so each row keeps only its
+    baseline number and the (input, value) pairs that differ, appended to
+    flat arrays. Outputs are not stored at all: they are recomputed from the
+    inputs with the fused kernel (kernel.evaluate), and metric columns read
+    through `column`, `frame` or an export are cached until rows are
+    compacted.
+
+    Rows are appended into preallocated capacity that doubles when full, and
+    deletes only clear a live flag, so both are O(1) amortised. Dead rows are
+    compacted away once they make up half the used rows. `version` increases
+    on every change so callers can memoise anything derived from the store.
+    """
+
+    def __init__(self, capacity=64, baseline=None):
+        self._baseline_names = []
+        self._baseline_values = np.empty((0, len(INPUT_KEYS)))
+        self.add_baseline(DEFAULT_BASELINE, FORM_DEFAULTS if baseline is None else baseline)
+        self.default_baseline = DEFAULT_BASELINE
+        self._allocate(capacity)
+        self._allocate_changes(max(capacity, 64))
+        self._rows = {}
+        self._size = 0
+        self._n_changes = 0
+        self.version = 0
+
+    def _allocate(self, capacity):
+        self._baseline_rows = np.zeros(capacity, dtype=np.int16)
+        self._change_start = np.zeros(capacity, dtype=np.int64)
+        self._change_count = np.zeros(capacity, dtype=np.int8)
+        self._ids = np.empty(capacity, dtype=object)
+        self._names = np.empty(capacity, dtype=object)
+        self._timestamps = np.empty(capacity, dtype=object)
+        self._live = np.zeros(capacity, dtype=bool)
+        # Cached output columns and how many leading rows of each are filled
+        self._outputs = {}
+        self._outputs_filled = {}
+
+    def _allocate_changes(self, capacity):
+        self._change_keys = np.empty(capacity, dtype=np.int8)
+        self._change_values = np.empty(capacity, dtype=np.float64)
+
+    def _grow(self):
+        old = (self._baseline_rows, self._change_start, self._change_count, self._ids, self._names, self._timestamps,
+               self._live)
+        outputs, filled = self._outputs, self._outputs_filled
+        self._allocate(len(self._live) * 2)
+        n = self._size
+        for target, source in zip((self._baseline_rows, self._change_start, self._change_count, self._ids, self._names,
+                                   self._timestamps, self._live), old):
+            target[:n] = source[:n]
+        for key, values in outputs.items():
+            self._outputs[key] = np.empty(len(self._live))
+            self._outputs[key][:filled[key]] = values[:filled[key]]
+            self._outputs_filled[key] = filled[key]
+
+    def _append_changes(self, keys, values):
+        if self._n_changes + len(keys) > len(self._change_keys):
+            change_keys, change_values = self._change_keys, self._change_values
+            self._allocate_changes(max(2 * len(change_keys), self._n_changes + len(keys)))
+            self._change_keys[:self._n_changes] = change_keys[:self._n_changes]
+            self._change_values[:self._n_changes] = change_values[:self._n_changes]
+        start = self._n_changes
+        self._change_keys[start:start + len(keys)] = keys
+        self._change_values[start:start + len(keys)] = values
+        self._n_changes += len(keys)
+        return start
+
+    def _compact(self):
+        keep = np.flatnonzero(self._live[:self._size])
+        n = len(keep)
+        positions = self._change_positions(keep)
+        counts = self._change_count[keep]
+        self._change_keys[:len(positions)] = self._change_keys[positions]
+        self._change_values[:len(positions)] = self._change_values[positions]
+        self._n_changes = len(positions)
+        self._change_start[:n] = np.cumsum(counts) - counts
+        self._change_count[:n] = counts
+        self._baseline_rows[:n] = self._baseline_rows[keep]
+        self._ids[:n] = self._ids[keep]
+        self._names[:n] = self._names[keep]
+        self._timestamps[:n] = self._timestamps[keep]
+        self._live[:n] = True
+        self._live[n:] = False
+        self._ids[n:self._size] = None
+        self._names[n:self._size] = None
+        self._timestamps[n:self._size] = None
+        self._size = n
+        self._rows = {sim_id: row for row, sim_id in enumerate(self._ids[:n])}
+        self._outputs, self._outputs_filled = {}, {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, sim_id):
+        return sim_id in self._rows
+
+    # Baselines
+
+    def add_baseline(self, name, inputs):
+        """Register (or replace) a named set of inputs that simulations can be stored against"""
+        values = np.array([float(inputs.get(key, 0)) for key in INPUT_KEYS])
+        if name in self._baseline_names:
+            if len(self._rows):
+                raise ValueError(f"Baseline '{name}' is in use and cannot be replaced")
+            self._baseline_values[self._baseline_names.index(name)] = values
+        else:
+            self._baseline_names.append(name)
+            self._baseline_values = np.vstack([self._baseline_values, values])
+        return name
+
+    def remove_baseline(self, name):
+        """Remove a baseline that no simulation is stored against"""
+        if name == self.default_baseline:
+            raise ValueError(f"The default baseline '{name}' cannot be removed")
+        index = self._baseline_names.index(name)
+        rows = self._baseline_rows[:self._size]
+        if np.any(rows[self._live[:self._size]] == index):
+            raise ValueError(f"Baseline '{name}' is in use and cannot be removed")
+        del self._baseline_names[index]
+        self._baseline_values = np.delete(self._baseline_values, index, axis=0)
+        # Only dead rows can still point at it; later baselines move down one
+        rows[rows == index] = 0
+        rows[rows > index] -= 1
+        self.version += 1
+
+    def baselines(self):
+        """Baseline names in the order they were added"""
+        return list(self._baseline_names)
+
+    def baseline(self, name):
+        """Input dict of a named baseline"""
+        values = self._baseline_values[self._baseline_names.index(name)]
+        return {key: _input_value(key, value) for key, value in zip(INPUT_KEYS, values)}
+
+    def baseline_of(self, sim_id):
+        """Name of the baseline a simulation is stored against"""
+        return self._baseline_names[self._baseline_rows[self._rows[sim_id]]]
+
+    # Rows
+
+    def add(self, sim_id, name, timestamp, results, baseline=None):
+        """Append a simulation from a calculate_metrics result dict or a SimulationRecord
+
+        Only the inputs that differ from the baseline are kept; the outputs
+        in `results` are recomputed when they are next needed.
+        """
+        if sim_id in self._rows:
+            raise KeyError(f"Simulation '{sim_id}' already exists")
+        baseline_row = self._baseline_names.index(baseline or self.default_baseline)
+        if self._size == len(self._live):
+            self._grow()
+        row = self._size
+        inputs = results.inputs.to_dict() if isinstance(results, SimulationRecord) else results["inputs"]
+        values = np.array([float(inputs.get(key, 0)) for key in INPUT_KEYS])
+        changed = np.flatnonzero(values != self._baseline_values[baseline_row])
+        self._change_start[row] = self._append_changes(changed, values[changed])
+        self._change_count[row] = len(changed)
+        self._baseline_rows[row] = baseline_row
+        self._ids[row] = sim_id
+        self._names[row] = name
+        self._timestamps[row] = timestamp
+        self._live[row] = True
+        self._rows[sim_id] = row
+        self._size += 1
+        self.version += 1
+
+    def add_many(self, sim_ids, names, timestamps, inputs, baseline=None):
+        """Append many simulations at once from a (simulations x INPUT_KEYS) array
+
+        `inputs` may also be an INPUT_DTYPE or SIMULATION_DTYPE structured
+        array. Values are stored as given, so check them first (e.g. with
+        schema.validate_input_columns). Changes against the baseline are
+        found for every row in one pass; no per-row Python work is done.
+        """
+        sim_ids = list(sim_ids)
+        n = len(sim_ids)
+        inputs = np.asarray(inputs)
+        if inputs.dtype.names:
+            inputs = np.stack([inputs[key] for key in INPUT_KEYS], axis=1) if n else np.empty((0, len(INPUT_KEYS)))
+        inputs = inputs.astype(np.float64, copy=False).reshape(n, -1)
+        if inputs.shape[1] != len(INPUT_KEYS):
+            raise ValueError(f"Expected {len(INPUT_KEYS)} input columns, got {inputs.shape[1]}")
+        if len(set(sim_ids)) != n:
+            raise KeyError("Simulation ids must be unique")
+        clashes = [sim_id for sim_id in sim_ids if sim_id in self._rows]
+        if clashes:
+            raise KeyError(f"Simulation(s) already exist: {', '.join(map(str, clashes[:5]))}"
+                           f"{'...' if len(clashes) > 5 else ''}")
+        baseline_row = self._baseline_names.index(baseline or self.default_baseline)
+        while self._size + n > len(self._live):
+            self._grow()
+        changed = inputs != self._baseline_values[baseline_row]
+        counts = changed.sum(axis=1)
+        _, keys = np.nonzero(changed)
+        start = self._append_changes(keys, inputs[changed])
+        rows = slice(self._size, self._size + n)
+        self._change_start[rows] = start + np.cumsum(counts) - counts
+        self._change_count[rows] = counts
+        self._baseline_rows[rows] = baseline_row
+        self._ids[rows] = np.fromiter(sim_ids, dtype=object, count=n)
+        self._names[rows] = np.fromiter(names, dtype=object, count=n)
+        self._timestamps[rows] = np.fromiter(timestamps, dtype=object, count=n)
+        self._live[rows] = True
+        self._rows.update(zip(sim_ids, range(self._size, self._size + n)))
+        self._size += n
+        self.version += 1
+
+    def delete(self, sim_id):
+        """Remove a simulation"""
+        row = self._rows.pop(sim_id)
+        self._live[row] = False
+        self.version += 1
+        if self._size > 64 and len(self._rows) < self._size // 2:
+            self._compact()
+
+    def delete_many(self, sim_ids):
+        """Remove several simulations at once"""
+        for sim_id in sim_ids:
+            self._live[self._rows.pop(sim_id)] = False
+        self.version += 1
+        if self._size > 64 and len(self._rows) < self._size // 2:
+            self._compact()
+
+    def clear(self):
+        """Remove every simulation"""
+        self._allocate(64)
+        self._allocate_changes(64)
+        self._rows = {}
+        self._size = 0
+        self._n_changes = 0
+        self.version += 1
+
+    def _select(self, sim_ids=None):
+        """Row numbers for the given ids (all live rows, in insertion order, by default)"""
+        if sim_ids is None:
+            return np.flatnonzero(self._live[:self._size])
+        return np.array([self._rows[sim_id] for sim_id in sim_ids], dtype=np.int64)
+
+    def _change_positions(self, rows):
+        """Indexes into the change arrays for every change of the given rows, row by row"""
+        if len(rows) == self._size and np.array_equal(rows, np.arange(self._size)):
+            # Every used row in order (a whole-store read): changes are stored in row order
+            return np.arange(self._n_changes)
+        counts = self._change_count[rows].astype(np.int64)
+        # Offsets of each row's changes within the output, subtracted from a running index
+        shift = np.repeat(self._change_start[rows] - (np.cumsum(counts) - counts), counts)
+        return shift + np.arange(counts.sum())
+
+    def _flat_changes(self, rows):
+        """(owners, keys, values) for every change of the given rows; owners index `rows`"""
+        counts = self._change_count[rows].astype(np.int64)
+        positions = self._change_positions(rows)
+        owners = np.repeat(np.arange(len(rows)), counts)
+        return owners, self._change_keys[positions].astype(np.int64), self._change_values[positions]
+
+    def _input_matrix(self, rows, keys=None):
+        """Dense (rows x keys) input values, rebuilt from baselines and changes"""
+        if keys is None:
+            data = self._baseline_values[self._baseline_rows[rows]]
+            lookup = None
+        else:
+            columns = np.array([_INPUT_INDEX[key] for key in keys], dtype=np.int64)
+            data = self._baseline_values[np.ix_(self._baseline_rows[rows], columns)]
+            lookup = np.full(len(INPUT_KEYS), -1)
+            lookup[columns] = np.arange(len(columns))
+        owners, targets, values = self._flat_changes(rows)
+        if len(owners):
+            if lookup is not None:
+                targets = lookup[targets]
+                wanted = targets >= 0
+                owners, targets, values = owners[wanted], targets[wanted], values[wanted]
+            # Scatter through the flat view, which is cheaper than 2-D fancy indexing
+            data.ravel()[owners * data.shape[1] + targets] = values
+        return data
+
+    def _compute_outputs(self, rows):
+        """Every output for the given rows, as a dict of columns"""
+        return evaluate(dict(zip(INPUT_KEYS, self._input_matrix(rows).T)))
+
+    def _output_columns(self, keys):
+        """Cached output columns covering every used row, as {key: column}
+
+        Rows added since the last read are computed in one batch, which
+        fills every cached column (the kernel computes all metrics anyway).
+        """
+        for key in keys:
+            if key not in self._outputs:
+                self._outputs[key] = np.empty(len(self._live))
+                self._outputs_filled[key] = 0
+        start = min(self._outputs_filled.values(), default=self._size)
+        if start < self._size:
+            outputs = self._compute_outputs(np.arange(start, self._size))
+            for key, column in self._outputs.items():
+                filled = self._outputs_filled[key]
+                column[filled:self._size] = outputs[key][filled - start:]
+                self._outputs_filled[key] = self._size
+        return {key: self._outputs[key] for key in keys}
+
+    def _output_column(self, key):
+        """One cached output column covering every used row"""
+        return self._output_columns([key])[key]
+
+    def ids(self):
+        """Simulation ids in the order they were added"""
+        return list(self._ids[self._select()])
+
+    def name(self, sim_id):
+        return self._names[self._rows[sim_id]]
+
+    def names(self, sim_ids=None):
+        """Simulation names as an array, in the order of sim_ids"""
+        return self._names[self._select(sim_ids)]
+
+    def timestamp(self, sim_id):
+        return self._timestamps[self._rows[sim_id]]
+
+    def column(self, key, sim_ids=None):
+        """One input or metric column as an array"""
+        rows = self._select(sim_ids)
+        if key in _INPUT_INDEX:
+            return self._input_matrix(rows, [key])[:, 0]
+        return self._output_column(key)[rows]
+
+    def inputs(self, sim_id):
+        """Input dict for one simulation"""
+        values = self._input_matrix(np.array([self._rows[sim_id]]))[0]
+        return {key: _input_value(key, value) for key, value in zip(INPUT_KEYS, values)}
+
+    def changes(self, sim_id):
+        """Inputs of one simulation that differ from its baseline"""
+        positions = self._change_positions(np.array([self._rows[sim_id]]))
+        return {INPUT_KEYS[k]: _input_value(INPUT_KEYS[k], v)
+                for k, v in zip(self._change_keys[positions], self._change_values[positions])}
+
+    def changed_keys(self, sim_ids=None):
+        """Inputs that differ from the baseline in any of the simulations, in form order"""
+        present = set(self._change_keys[self._change_positions(self._select(sim_ids))].tolist())
+        return [key for i, key in enumerate(INPUT_KEYS) if i in present]
+
+    def changed_mask(self, keys, sim_ids=None):
+        """Boolean (simulations x keys) array marking inputs that differ from the baseline"""
+        rows = self._select(sim_ids)
+        lookup = np.full(len(INPUT_KEYS), -1)
+        lookup[[_INPUT_INDEX[key] for key in keys]] = np.arange(len(keys))
+        owners, changed, _ = self._flat_changes(rows)
+        columns = lookup[changed]
+        wanted = columns >= 0
+        mask = np.zeros((len(rows), len(keys)), dtype=bool)
+        mask[owners[wanted], columns[wanted]] = True
+        return mask
+
+    def flat_changes(self, sim_ids=None):
+        """Every change from the baseline as flat arrays, simulation by simulation
+
+        Returns (counts, keys, values): the first counts[0] changes belong to
+        the first simulation, and so on. keys are input names and values are
+        as `changes` reports them (whole-number inputs as int), both object
+        arrays.
+        """
+        rows = self._select(sim_ids)
+        _, keys, values = self._flat_changes(rows)
+        objects = values.astype(object)
+        whole = _IS_INTEGER_INPUT[keys] & (values == np.round(values))
+        objects[whole] = values[whole].astype(np.int64).astype(object)
+        return self._change_count[rows].astype(np.int64), _INPUT_NAMES[keys], objects
+
+    def baseline_names(self, sim_ids=None):
+        """Baseline name of each simulation, as an array in the order of sim_ids"""
+        return np.array(self._baseline_names, dtype=object)[self._baseline_rows[self._select(sim_ids)]]
+
+    def _results_rows(self, rows):
+        """calculate_metrics-style result dicts for the given rows, computed in one batch"""
+        inputs = self._input_matrix(rows)
+        outputs = calculate_metrics_batch(dict(zip(INPUT_KEYS, inputs.T)))
+        output_rows = zip(*(outputs[key].tolist() for key in OUTPUT_KEYS))
+        return [{"inputs": {key: _input_value(key, value) for key, value in zip(INPUT_KEYS, input_row)},
+                 **dict(zip(OUTPUT_KEYS, output_row))}
+                for input_row, output_row in zip(inputs.tolist(), output_rows)]
+
+    def results(self, sim_id):
+        """Result dict for one simulation, in the calculate_metrics layout"""
+        return self._results_rows(np.array([self._rows[sim_id]]))[0]
+
+    def record(self, sim_id):
+        """One simulation as a SimulationRecord"""
+        return calculate_record(InputRecord.from_dict(self.inputs(sim_id)))
+
+    def records(self, sim_ids=None):
+        """Simulations as a schema.SIMULATION_DTYPE structured array, inputs and metrics together"""
+        rows = self._select(sim_ids)
+        array = np.empty(len(rows), dtype=SIMULATION_DTYPE)
+        matrix = as_matrix(array)
+        matrix[:, :len(INPUT_KEYS)] = self._input_matrix(rows)
+        outputs = calculate_metrics_batch(array[list(INPUT_KEYS)])
+        for i, key in enumerate(OUTPUT_KEYS):
+            matrix[:, len(INPUT_KEYS) + i] = outputs[key]
+        return array
+
+    def __getitem__(self, sim_id):
+        """One simulation as a {name, timestamp, data} record"""
+        return {"name": self.name(sim_id), "timestamp": self.timestamp(sim_id), "data": self.results(sim_id)}
+
+    def frame(self, columns=None, sim_ids=None, meta=True):
+        """DataFrame slice of the store indexed by simulation id
+
+        With meta, the simulation name and timestamp are included as the
+        first two columns. Metric columns are read through the column cache.
+        """
+        import pandas as pd
+
+        columns = list(columns or STORE_COLUMNS)
+        rows = self._select(sim_ids)
+        input_keys = [key for key in columns if key in _INPUT_INDEX]
+        output_keys = [key for key in columns if key not in _INPUT_INDEX]
+        data = np.empty((len(rows), len(columns)))
+        positions = {key: i for i, key in enumerate(columns)}
+        if input_keys:
+            data[:, [positions[key] for key in input_keys]] = (
+                self._input_matrix(rows) if input_keys == INPUT_KEYS else self._input_matrix(rows, input_keys))
+        for key, column in self._output_columns(output_keys).items():
+            data[:, positions[key]] = column[rows]
+        df = pd.DataFrame(data, columns=columns, index=pd.Index(self._ids[rows], name="Simulation ID"))
+        if meta:
+            df.insert(0, "Timestamp", self._timestamps[rows])
+            df.insert(0, "Simulation Name", self._names[rows])
+        return df
+
+    def export_frame(self, sim_ids=None):
+        """All columns with "Input: " and "Output: " prefixes, as in the CSV export
+
+        Metrics come from the column cache, so the first chunk of an export
+        computes them for every row in one batch and later chunks (and later
+        exports) only copy them.
+        """
+        df = self.frame(None, sim_ids, meta=True)
+        df = df.rename(columns=EXPORT_COLUMN_NAMES)
+        return df.reset_index()
+
+    def to_records(self, sim_ids=None):
+        """Simulations as a {sim_id: {name, timestamp, data}} dict for JSON export"""
+        sim_ids = self.ids() if sim_ids is None else list(sim_ids)
+        rows = self._select(sim_ids)
+        return {sim_id: {"name": self._names[row], "timestamp": self._timestamps[row], "data": results}
+                for sim_id, row, results in zip(sim_ids, rows, self._results_rows(rows))}
+
+    def to_compact_records(self, sim_ids=None):
+        """Simulations as {sim_id: {name, timestamp, baseline, changes}}, without outputs
+
+        Together with `baselines()`/`baseline(name)` this is everything needed
+        to rebuild the simulations; it is what the compact JSON export writes.
+        """
+        sim_ids = self.ids() if sim_ids is None else list(sim_ids)
+        rows = self._select(sim_ids)
+        counts, keys, values = self.flat_changes(sim_ids)
+        ends = np.cumsum(counts).tolist()
+        keys, values = keys.tolist(), values.tolist()
+        baselines = self.baseline_names(sim_ids).tolist()
+        return {sim_id: {"name": name, "timestamp": timestamp, "baseline": baseline,
+                         "changes": dict(zip(keys[end - count:end], values[end - count:end]))}
+                for sim_id, name, timestamp, baseline, count, end in zip(
+                    sim_ids, self._names[rows].tolist(), self._timestamps[rows].tolist(), baselines,
+                    counts.tolist(), ends)}
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the store's arrays"""
+        per_row = (self._baseline_rows.nbytes + self._change_start.nbytes + self._change_count.nbytes
+                   + self._live.nbytes + 3 * self._ids.nbytes)
+        changes = self._change_keys.nbytes + self._change_values.nbytes
+        return per_row + changes + self._baseline_values.nbytes + sum(v.nbytes for v in self._outputs.values())
@@ -1,231 +1,174 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
 import json
 import base64
 import datetime
 import io
+import os
+import time
+
+from lazy import lazy_import
+
+# pandas and plotly load on first use, so a fresh session only pays for the views it renders
+pd = lazy_import("pandas")
+go = lazy_import("plotly.graph_objects")
+
+from calibration import DEFAULT_COLUMNS, calibrate, form_values
+from exports import EXPORT_FORMATS, PYARROW_AVAILABLE, export_file, frame_to_bytes
+from goal_seek import break_even_curve, default_bounds, goal_seek
+from history_db import HistoryWriteError, SimulationHistory
+from imports import import_simulations
+from metric_graph import METRIC_GRAPH, IncrementalEvaluator
+from metrics import INPUT_KEYS, INTEGER_KEYS, METRIC_OPTIONS, OUTPUT_KEYS, RATE_KEYS
+from profiling import HISTOGRAM_EDGES_MS, profiler
+from reports import REPORTLAB_AVAILABLE, build_report_pack, request_report
+from shared_cache import cached_metrics, cached_projection, shared_cache
+from sensitivity import sobol_indices, sweep_1d, sweep_2d, tornado
+from simulation_store import SimulationStore
+from views import (ViewCache, comparison_views, history_page, matching_ids, metric_histogram, metric_quantiles,
+                   parallel_coordinates_figure, parameter_frame, scatter_matrix_figure, top_ids)
+from montecarlo import DISTRIBUTION_TYPES, MONTE_CARLO_METRICS, default_distribution, run_monte_carlo, summarize
 
 # Set page configuration
 st.set_page_config(page_title="Sales Metrics Simulator", layout="wide", initial_sidebar_state="expanded")
 
-# Try to import optional dependencies with fallbacks
-try:
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.lib import colors
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.styles import getSampleStyleSheet
-    from reportlab.lib.units import inch
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+# Optional profiling panel, also enabled by SIM_PROFILE=1
+if st.query_params.get("profile") in ("1", "true"):
+    profiler.enabled = True
+rerun_timer = profiler.rerun()
+
+# Optional persistent history, enabled by pointing SIM_HISTORY_DB at a SQLite file
+HISTORY_DB_PATH = os.environ.get("SIM_HISTORY_DB")
+
+@st.cache_resource
+def get_history(path):
+    """One history writer per database file, shared by every session"""
+    return SimulationHistory(path)
+
+history = get_history(HISTORY_DB_PATH) if HISTORY_DB_PATH else None
 
 # Initialize session state for simulations
 if 'simulations' not in st.session_state:
-    st.session_state.simulations = {}
+    st.session_state.simulations = SimulationStore()
     st.session_state.sim_counter = 0
+if 'views' not in st.session_state:
+    st.session_state.views = ViewCache(st.session_state.simulations)
 
 # Utility functions
-def get_csv_download_link(df, filename, text):
-    """Generate a download link for a CSV file"""
-    csv = df.to_csv(index=False)
-    b64 = base64.b64encode(csv.encode()).decode()
-    href = f'<a href="data:file/csv;base64,{b64}" download="{filename}">{text}</a>'
-    return href
-
-def get_json_download_link(data, filename, text):
-    """Generate a download link for a JSON file"""
-    json_str = json.dumps(data, indent=4)
-    b64 = base64.b64encode(json_str.encode()).decode()
-    href = f'<a href="data:application/json;base64,{b64}" download="{filename}">{text}</a>'
-    return href
-
-def get_pdf_download_link(pdf_bytes, filename, text):
-    """Generate a download link for a PDF file"""
-    if pdf_bytes is None:
-        return ""
-    b64 = base64.b64encode(pdf_bytes).decode()
-    href = f'<a href="data:application/pdf;base64,{b64}" download="{filename}" target="_blank">{text}</a>'
-    return href
-
-def create_pdf_report(sim_data, sim_name):
-    """Create a PDF report for a simulation"""
-    if not REPORTLAB_AVAILABLE:
-        return None
-    
-    # Create buffer for PDF
-    buffer = io.BytesIO()
-    
-    # Create the PDF object
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elements = []
-    
-    # Set styles
-    styles = getSampleStyleSheet()
-    title_style = styles['Heading1']
-    subtitle_style = styles['Heading2']
-    normal_style = styles['Normal']
-    
-    # Add title
-    elements.append(Paragraph(f"Simulation Report: {sim_name}", title_style))
-    elements.append(Spacer(1, 0.25*inch))
-    
-    # Add timestamp
-    elements.append(Paragraph(f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", normal_style))
-    elements.append(Spacer(1, 0.25*inch))
-    
-    # Add summary section
-    elements.append(Paragraph("Summary Results", subtitle_style))
-    
-    # Create summary table
-    summary_data = [
-        ["Metric", "Value"],
-        ["Revenue", f"£{sim_data['revenue']:,.2f}"],
-        ["Net Profit", f"£{sim_data['net_profit']:,.2f}"],
-        ["ROI", f"{sim_data['roi']:.2f}%"],
-        ["Customers", f"{sim_data['customers']:.0f}"],
-        ["Customer Lifetime Value", f"£{sim_data['customer_lifetime_value']:,.2f}"]
-    ]
-    
-    # Create the table
-    summary_table = Table(summary_data, colWidths=[2.5*inch, 2.5*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (1, 0), 12),
-        ('BACKGROUND', (0, 1), (1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ALIGN', (1, 1), (1, -1), 'RIGHT'),
-    ]))
-    
-    elements.append(summary_table)
-    elements.append(Spacer(1, 0.25*inch))
-    
-    # Build the PDF
-    doc.build(elements)
-    
-    # Get the value of the PDF
-    pdf = buffer.getvalue()
-    buffer.close()
-    return pdf
-
-def calculate_metrics(inputs):
-    """Calculate all metrics from input data"""
-    # Extract inputs by category
-    
-    # Sales metrics
-    leads = inputs.get('leads', 0)
-    lead_booking_rate = inputs.get('lead_booking_rate', 0)  # Renamed
-    meeting_conversion_rate = inputs.get('meeting_conversion_rate', 0)  # Renamed
-    average_deal_size = inputs.get('average_deal_size', 0)
-    sales_cycle_length = inputs.get('sales_cycle_length', 0)
-    sales_commission_rate = inputs.get('sales_commission_rate', 0)
-    number_of_sdrs = inputs.get('number_of_sdrs', 0)
-    time_to_sell_days = inputs.get('time_to_sell_days', 0)
-    
-    # Marketing metrics
-    cost_per_lead = inputs.get('cost_per_lead', 0)
-    cost_per_booked_meeting = inputs.get('cost_per_booked_meeting', 0)  # New
-    marketing_spend = inputs.get('marketing_spend', 0)
-    media_spend = inputs.get('media_spend', 0)
-    total_addressable_market = inputs.get('total_addressable_market', 0)  # Moved
-    funnel_conversion_rate = inputs.get('funnel_conversion_rate', 0)
-    click_through_rate = inputs.get('click_through_rate', 0)
-    organic_views = inputs.get('organic_views', 0)
-    cost_per_thousand_impressions = inputs.get('cost_per_thousand_impressions', 0)
-    
-    # Offer metrics
-    price_of_offer = inputs.get('price_of_offer', 0)  # Moved
-    churn_rate = inputs.get('churn_rate', 0)
-    contract_length = inputs.get('contract_length', 0)
-    price_of_renewal = inputs.get('price_of_renewal', 0)
-    rate_of_renewals = inputs.get('rate_of_renewals', 0)
-    discount_rate = inputs.get('discount_rate', 0)
-    refund_rate = inputs.get('refund_rate', 0)
-    customer_acquisition_cost = inputs.get('customer_acquisition_cost', 0)
-    
-    # Operations metrics
-    fixed_costs = inputs.get('fixed_costs', 0)
-    cogs = inputs.get('cogs', 0)
-    operating_expenses = inputs.get('operating_expenses', 0)
-    cost_to_fulfil = inputs.get('cost_to_fulfil', 0)
-    
-    # Cash metrics
-    initial_number_of_customers = inputs.get('initial_number_of_customers', 0)
-    cash_in_bank = inputs.get('cash_in_bank', 0)
-    
-    # Calculate derived metrics
-    
-    # Sales and customer metrics
-    booked_meetings = leads * lead_booking_rate  # Renamed
-    customers = booked_meetings * meeting_conversion_rate  # Renamed
-    revenue = customers * average_deal_size
-    
-    # Include Cost per Booked Meeting in calculations
-    total_meeting_costs = booked_meetings * cost_per_booked_meeting  # New calculation
-    
-    # Cost metrics
-    variable_costs = leads * cost_per_lead
-    commission = revenue * sales_commission_rate
-    total_marketing_costs = marketing_spend + media_spend
-    total_variable_costs = variable_costs + commission + total_meeting_costs  # Updated to include meeting costs
-    total_costs = fixed_costs + total_variable_costs + cogs + operating_expenses
+@st.fragment(run_every=0.5)
+def wait_for_report(sim_data, sim_name, timestamp):
+    """Poll the background PDF worker and rerun the page once the report is ready"""
+    if request_report(sim_data, sim_name, timestamp) is not None:
+        st.rerun()
+    st.info("Rendering PDF report...")
+
+@st.fragment
+def live_what_if(sim_id):
+    """Recalculate a saved simulation live as inputs change, without rerunning the page"""
+    state = st.session_state.get("live_what_if")
+    if state is None or state["sim_id"] != sim_id:
+        state = {"sim_id": sim_id, "evaluator": IncrementalEvaluator(st.session_state.simulations.inputs(sim_id)), "recomputed": []}
+        st.session_state.live_what_if = state
+    evaluator = state["evaluator"]
     
-    # Performance metrics
-    gross_profit = revenue - cogs
-    operating_profit = gross_profit - operating_expenses
-    net_profit = operating_profit - commission - total_marketing_costs
-    profit_margin = (net_profit / revenue) * 100 if revenue > 0 else 0
-    roi = (net_profit / total_costs) * 100 if total_costs > 0 else 0
-    customer_retention = 1 - churn_rate
+    live_keys = ["leads", "lead_booking_rate", "meeting_conversion_rate", "average_deal_size",
+                 "churn_rate", "cost_per_lead", "marketing_spend"]
+    cols = st.columns(len(live_keys))
+    changes = {}
+    for col, key in zip(cols, live_keys):
+        with col:
+            changes[key] = st.number_input(key, value=float(evaluator.values[key]), format="%g",
+                                           key=f"live_{sim_id}_{key}")
     
-    # Lifetime value metrics
-    customer_lifetime = 1 / churn_rate if churn_rate > 0 else 0
-    customer_lifetime_value = (average_deal_size * profit_margin / 100) * customer_lifetime
-    cac_ratio = customer_lifetime_value / customer_acquisition_cost if customer_acquisition_cost > 0 else 0
+    recomputed = evaluator.update(changes)
+    if recomputed:
+        state["recomputed"] = recomputed
     
-    # Special calculations
-    discounts_given = revenue * discount_rate
-    refunds_given = revenue * refund_rate
-    seasonality_adjusted_revenue = revenue  # Placeholder for more complex calculation
+    values = evaluator.values
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Revenue", f"£{values['revenue']:,.2f}")
+    col2.metric("Net Profit", f"£{values['net_profit']:,.2f}")
+    col3.metric("ROI", f"{values['roi']:,.2f}%")
+    col4.metric("CLTV/CAC Ratio", f"{values['cac_ratio']:.2f}x")
+    if state["recomputed"]:
+        st.caption(f"Recomputed {len(state['recomputed'])} of {len(METRIC_GRAPH.order)} metrics: "
+                   + ", ".join(state["recomputed"]))
     
-    # Return all calculated metrics
-    return {
-        "inputs": inputs,
-        "booked_meetings": booked_meetings,
-        "customers": customers,
-        "revenue": revenue,
-        "variable_costs": variable_costs,
-        "commission": commission,
-        "total_marketing_costs": total_marketing_costs,
-        "total_variable_costs": total_variable_costs,
-        "total_costs": total_costs,
-        "gross_profit": gross_profit,
-        "operating_profit": operating_profit,
-        "net_profit": net_profit,
-        "profit_margin": profit_margin,
-        "roi": roi,
-        "customer_retention": customer_retention,
-        "customer_lifetime": customer_lifetime,
-        "customer_lifetime_value": customer_lifetime_value,
-        "cac_ratio": cac_ratio,
-        "discounts_given": discounts_given,
-        "refunds_given": refunds_given,
-        "seasonality_adjusted_revenue": seasonality_adjusted_revenue,
-        "total_meeting_costs": total_meeting_costs  # Add new calculated metric
-    }
+    with st.expander("Which metrics does each input affect?"):
+        impact = METRIC_GRAPH.input_impact()
+        st.dataframe(pd.DataFrame({
+            "Input": list(impact.keys()),
+            "Affected metrics": [", ".join(metrics) if metrics else "(none)" for metrics in impact.values()]
+        }).set_index("Input"))
 
 # Main title
 st.title("Comprehensive Sales Metrics Simulator")
 st.write("Enter your sales metrics to generate a comprehensive analysis.")
 
+rerun_timer.lap("setup")
+
 # Create tabs
-tab_input, tab_compare, tab_download = st.tabs(["Run Simulation", "Compare Simulations", "Download Data"])
+tab_input, tab_compare, tab_download, tab_monte_carlo, tab_sensitivity, tab_projection, tab_goal_seek, tab_history = st.tabs(
+    ["Run Simulation", "Compare Simulations", "Download Data", "Monte Carlo", "Sensitivity", "Projection", "Goal Seek",
+     "History"]
+)
+
+@st.fragment
+@profiler.timed("calibration")
+def calibration_panel():
+    """Estimate funnel rates, sales cycle and deal size from a CRM event log"""
+    with st.expander("Calibrate from CRM events"):
+        st.caption("One row per event: lead id, event (lead, meeting, deal or churn), timestamp and, for deals, "
+                   "amount. Large logs are streamed in chunks, so give a local path rather than uploading them.")
+        path = st.text_input("Path to a local CSV or Parquet event log", key="calib_path")
+        uploaded = st.file_uploader("...or upload one", type=["csv", "parquet", "gz"], key="calib_file")
+        column_cols = st.columns(4)
+        columns = {name: col.text_input(f"{name.capitalize()} column", value=default, key=f"calib_col_{name}")
+                   for col, (name, default) in zip(column_cols, DEFAULT_COLUMNS.items())}
+        if st.button("Calibrate", disabled=not (path or uploaded), key="calib_run"):
+            source, file_name = (path, path) if path else (uploaded, uploaded.name)
+            try:
+                with st.spinner("Reading events..."), profiler.stage("calibrate"):
+                    st.session_state.calibration = calibrate(source, file_name, columns=columns)
+            except (OSError, KeyError, ValueError, RuntimeError) as e:
+                st.error(f"Could not read the event log: {e}")
+        calibrator = st.session_state.get("calibration")
+        if calibrator is None:
+            return
+        summary = calibrator.summary()
+        st.write(f"{summary['rows']:,} events ({summary['skipped']:,} skipped): {summary['lead']:,} leads, "
+                 f"{summary['meeting']:,} meetings, {summary['deal']:,} deals, {summary['churn']:,} churns; "
+                 f"{summary['cycles_measured']:,} sales cycles measured")
+        estimates = calibrator.inputs()
+        if not estimates:
+            st.warning("No lead, meeting, deal or churn events were found; check the column and event names.")
+            return
+        st.dataframe(pd.DataFrame({"Estimate": estimates}))
+        monthly = calibrator.monthly()
+        rates = monthly[["lead_booking_rate", "meeting_conversion_rate", "churn_rate"]]
+        st.line_chart(rates.set_axis(rates.index.astype(str)))
+        st.dataframe(monthly.set_axis(monthly.index.astype(str)))
+        col1, col2 = st.columns(2)
+        if col1.button("Prefill the form", key="calib_prefill"):
+            st.session_state.form_prefill = form_values(estimates)
+            st.rerun()
+        if col2.button("Use as Monte Carlo distributions", key="calib_mc"):
+            prefill = {"mc_inputs": list(estimates)}
+            for key, spec in calibrator.distributions().items():
+                prefill[f"mc_type_{key}"] = spec["type"]
+                if spec["type"] == "empirical":
+                    prefill[f"mc_values_{key}"] = ", ".join(f"{v:g}" for v in spec["values"])
+                else:
+                    prefill.update({f"mc_{param}_{key}": float(spec[param]) for param in spec if param != "type"})
+            st.session_state.mc_prefill = prefill
+            st.rerun()
 
 # Tab 1: Input Form
 with tab_input:
+    # Values from a calibration are written into the widgets' state before they are drawn
+    for key, value in st.session_state.pop("form_prefill", {}).items():
+        st.session_state[key] = value
+    calibration_panel()
     with st.form("metrics_form"):
         # Simulation name
         sim_name = st.text_input("Simulation Name", value=f"Simulation {st.session_state.sim_counter + 1}")
@@ -325,8 +268,9 @@ with tab_input:
             "cash_in_bank": cash_in_bank
         }
         
-        # Calculate metrics
-        results = calculate_metrics(input_data)
+        # Calculate metrics (repeat scenarios come from the shared cache)
+        with profiler.stage("calculate_metrics"):
+            results = cached_metrics(input_data)
         
         # Save to session state
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -335,11 +279,13 @@ with tab_input:
         if sim_name.strip() == "":
             sim_name = sim_id
         
-        st.session_state.simulations[sim_id] = {
-            "name": sim_name,
-            "timestamp": timestamp,
-            "data": results
-        }
+        st.session_state.simulations.add(sim_id, sim_name, timestamp, results)
+        if history is not None:
+            try:
+                history.save(sim_id, sim_name, timestamp, results)
+                history.check()  # earlier batches that could not be written
+            except HistoryWriteError as e:
+                st.warning(f"History: {e}")
         
         st.session_state.sim_counter += 1
         
@@ -414,40 +360,45 @@ with tab_input:
                 ]
             })
             st.bar_chart(cost_data.set_index('Category'))
+    
+    # Live what-if on the latest simulation, recalculated outside the form
+    if len(st.session_state.simulations) > 0:
+        st.subheader("Live What-If")
+        st.write("Adjust key inputs of the latest simulation and see the metrics update instantly.")
+        live_what_if(st.session_state.simulations.ids()[-1])
+
+rerun_timer.lap("tab: Run Simulation")
 
 # Tab 2: Compare Simulations
-with tab_compare:
+@st.fragment
+@profiler.timed("tab: Compare")
+def compare_tab():
+    """Compare Simulations tab; its widgets rerun only this fragment"""
     if len(st.session_state.simulations) == 0:
         st.warning("No simulations have been run. Please run at least one simulation in the 'Run Simulation' tab.")
     else:
         st.subheader("Compare Simulations")
         
-        # Select simulations to compare
-        sim_options = list(st.session_state.simulations.keys())
-        selected_sims = st.multiselect(
-            "Select simulations to compare",
-            options=sim_options,
-            default=sim_options,
-            format_func=lambda x: f"{x}: {st.session_state.simulations[x]['name']}"
-        )
+        # Select simulations to compare; "All" avoids a widget holding every id
+        store = st.session_state.simulations
+        views = st.session_state.views
+        compare_scope = st.radio("Simulations", ["All", "Choose"], horizontal=True, key="compare_scope")
+        if compare_scope == "All":
+            selected_sims, selection_key = None, "all"
+        else:
+            sim_options = views.ids()
+            selected_sims = st.multiselect(
+                "Select simulations to compare",
+                options=sim_options,
+                default=sim_options[-10:],
+                format_func=lambda x: f"{x}: {st.session_state.simulations.name(x)}"
+            )
+            selection_key = tuple(selected_sims)
+        n_selected = len(store) if selected_sims is None else len(selected_sims)
         
-        if selected_sims:
+        if n_selected:
             # Choose metrics to compare
-            metric_options = {
-                "revenue": "Revenue",
-                "gross_profit": "Gross Profit",
-                "operating_profit": "Operating Profit",
-                "net_profit": "Net Profit",
-                "profit_margin": "Profit Margin",
-                "roi": "ROI",
-                "booked_meetings": "Booked Meetings",
-                "customers": "Customers",
-                "customer_lifetime_value": "Customer Lifetime Value",
-                "cac_ratio": "CLTV/CAC Ratio",
-                "total_costs": "Total Costs",
-                "total_marketing_costs": "Total Marketing Costs",
-                "total_meeting_costs": "Total Meeting Costs"
-            }
+            metric_options = METRIC_OPTIONS
             
             selected_metrics = st.multiselect(
                 "Select metrics to compare",
@@ -457,31 +408,64 @@ with tab_compare:
             )
             
             if selected_metrics:
-                # Create comparison dataframe
-                comparison_data = []
-                
-                for sim_id in selected_sims:
-                    sim = st.session_state.simulations[sim_id]
-                    row = {"Simulation": sim["name"]}
-                    
-                    for metric in selected_metrics:
-                        row[metric_options[metric]] = sim["data"][metric]
-                    
-                    comparison_data.append(row)
+                # Tables and bar charts show the top simulations; the views below cover the whole selection
+                col1, col2 = st.columns(2)
+                with col1:
+                    rank_by = st.selectbox("Rank by", options=selected_metrics, format_func=lambda x: metric_options[x],
+                                           key="compare_rank_by")
+                with col2:
+                    top_n = st.slider("Show top", min_value=1, max_value=max(1, min(n_selected, 100)),
+                                      value=min(n_selected, 20), key="compare_top_n") if n_selected > 1 else 1
                 
-                df_comparison = pd.DataFrame(comparison_data)
+                # Built once per selection and reused until the store changes
+                with profiler.stage("compare: build frames"):
+                    shown_sims = views.get("compare_top", (selection_key, rank_by, top_n),
+                                           lambda: top_ids(store, selected_sims, rank_by, top_n))
+                    df_comparison, chart_data = views.get(
+                        "comparison", (tuple(shown_sims), tuple(selected_metrics)),
+                        lambda: comparison_views(store, shown_sims, selected_metrics))
                 
                 # Display comparison table
+                if n_selected > top_n:
+                    st.caption(f"Top {top_n} of {n_selected:,} simulations by {metric_options[rank_by]}")
                 st.dataframe(df_comparison)
                 
                 # Visualization of selected metrics
                 st.subheader("Comparison Chart")
-                chart_data = pd.DataFrame({
-                    sim["name"]: [sim["data"][metric] for metric in selected_metrics]
-                    for sim_id, sim in st.session_state.simulations.items() if sim_id in selected_sims
-                }, index=[metric_options[metric] for metric in selected_metrics])
+                st.bar_chart(chart_data)
                 
-                st.bar_chart(chart_data.T)
+                # Views over every selected simulation, aggregated or downsampled
+                st.subheader(f"Across all {n_selected:,} selected simulations")
+                compare_view = st.radio("View", ["Quantiles", "Distribution", "Scatter matrix", "Parallel coordinates"],
+                                        horizontal=True, key="compare_view")
+                if compare_view == "Quantiles":
+                    st.dataframe(views.get("compare_quantiles", (selection_key, tuple(selected_metrics)),
+                                           lambda: metric_quantiles(store, selected_sims, selected_metrics)))
+                elif compare_view == "Distribution":
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        hist_metric = st.selectbox("Metric", options=selected_metrics,
+                                                   format_func=lambda x: metric_options[x], key="compare_hist_metric")
+                    with col2:
+                        hist_bins = st.slider("Bins", min_value=5, max_value=100, value=30, key="compare_hist_bins")
+                    st.bar_chart(views.get("compare_histogram", (selection_key, hist_metric, hist_bins),
+                                           lambda: metric_histogram(store, selected_sims, hist_metric, hist_bins)))
+                else:
+                    max_points = st.select_slider("Points to draw", options=[500, 1000, 2000, 5000, 10000, 20000],
+                                                  value=5000, key="compare_max_points")
+                    if n_selected > max_points:
+                        st.caption(f"Showing a random sample of {max_points:,} of {n_selected:,} simulations")
+                    if compare_view == "Scatter matrix":
+                        if len(selected_metrics) < 2:
+                            st.info("Select at least two metrics for a scatter matrix.")
+                        else:
+                            st.plotly_chart(views.get("compare_splom", (selection_key, tuple(selected_metrics), max_points),
+                                                      lambda: scatter_matrix_figure(store, selected_sims, selected_metrics,
+                                                                                    max_points)))
+                    else:
+                        st.plotly_chart(views.get("compare_parcoords", (selection_key, tuple(selected_metrics), max_points),
+                                                  lambda: parallel_coordinates_figure(store, selected_sims, selected_metrics,
+                                                                                      max_points)))
                 
                 # Input parameter comparison
                 st.subheader("Input Parameter Comparison")
@@ -500,49 +484,82 @@ with tab_compare:
                     "Cash": ["initial_number_of_customers", "cash_in_bank"]
                 }
                 
-                # Let user select a category
+                # Let user select a category; by default only inputs changed from the baseline are shown
                 selected_category = st.selectbox(
                     "Select parameter category",
-                    options=list(param_categories.keys())
+                    options=["Changed from baseline"] + list(param_categories.keys())
                 )
                 
                 if selected_category:
                     # Get parameters for this category
-                    category_params = param_categories[selected_category]
-                    
-                    # Create parameter comparison dataframe
-                    param_comparison_data = []
+                    if selected_category == "Changed from baseline":
+                        category_params = views.get("changed_keys", tuple(shown_sims),
+                                                    lambda: store.changed_keys(shown_sims))
+                    else:
+                        category_params = param_categories[selected_category]
                     
-                    for sim_id in selected_sims:
-                        sim = st.session_state.simulations[sim_id]
-                        row = {"Simulation": sim["name"]}
-                        
-                        for param in category_params:
-                            # Get parameter value
-                            value = sim["data"]["inputs"].get(param, None)
-                            row[param] = value
+                    if category_params:
+                        # Create parameter comparison dataframe
+                        df_param_comparison = views.get(
+                            "parameters", (tuple(shown_sims), selected_category),
+                            lambda: parameter_frame(store, shown_sims, category_params))
                         
-                        param_comparison_data.append(row)
-                    
-                    df_param_comparison = pd.DataFrame(param_comparison_data)
-                    
-                    # Display parameter comparison table
-                    st.dataframe(df_param_comparison)
+                        # Display parameter comparison table; highlighted cells differ from the baseline
+                        st.dataframe(df_param_comparison)
+                    else:
+                        st.info("These simulations use the baseline's inputs unchanged.")
+
+with tab_compare:
+    compare_tab()
+
+def import_section():
+    """Upload an export (from this app or a colleague's) and add its simulations to this session"""
+    with st.expander("Import Simulations"):
+        uploaded = st.file_uploader("Exported simulations", type=["csv", "json", "jsonl", "parquet", "gz"],
+                                    key="import_file",
+                                    help="Any Download All Simulations export, including gzipped and changes-only files")
+        verify = st.checkbox("Check the file's outputs against a recompute", value=True, key="import_verify")
+        if st.button("Import", disabled=uploaded is None, key="import_button"):
+            store = st.session_state.simulations
+            try:
+                with st.spinner("Importing..."), profiler.stage("import simulations"):
+                    # Imported runs are numbered after this session's own, like runs loaded from history
+                    counter = st.session_state.sim_counter
+                    report = import_simulations(store, uploaded.getvalue(), uploaded.name, verify=verify,
+                                                sim_ids=lambda n: [f"Sim {counter + i + 1}" for i in range(n)])
+            except (ValueError, KeyError, RuntimeError) as e:
+                st.error(f"Could not import {uploaded.name}: {e}")
+            else:
+                st.session_state.sim_counter += report["imported"]
+                st.session_state.import_report = report
+                # Imported simulations appear in every tab, so rerun the whole page
+                st.rerun()
+        report = st.session_state.pop("import_report", None)
+        if report:
+            st.success(f"Imported {report['imported']:,} simulations")
+            if report["mismatches"]:
+                st.warning("Some outputs in the file differ from a recompute (it may come from an older version "
+                           "of the model); the recomputed values are used: " +
+                           ", ".join(f"{key} ({rows:,} rows)" for key, rows in report["mismatches"].items()))
 
 # Tab 3: Download Data
-with tab_download:
+@st.fragment
+@profiler.timed("tab: Download")
+def download_tab():
+    """Download Data tab; its widgets rerun only this fragment"""
+    import_section()
     if len(st.session_state.simulations) == 0:
         st.warning("No simulations have been run. Please run at least one simulation in the 'Run Simulation' tab.")
     else:
         st.subheader("Download Simulation Data")
         
         # Select simulation to download
-        sim_options = list(st.session_state.simulations.keys())
+        sim_options = st.session_state.views.ids()
         
         selected_sim = st.selectbox(
             "Select simulation to download",
             options=sim_options,
-            format_func=lambda x: f"{x}: {st.session_state.simulations[x]['name']}"
+            format_func=lambda x: f"{x}: {st.session_state.simulations.name(x)}"
         )
         
         # Create tabs for different download formats
@@ -550,58 +567,68 @@ with tab_download:
         
         with download_tabs[0]:
             if selected_sim:  # Check if selected_sim exists
-                sim = st.session_state.simulations[selected_sim]
-                
-                st.write(f"### Download options for: {sim['name']}")
-                
-                # Create dataframes for different aspects of the simulation
-                
-                # 1. Input parameters
-                input_data = sim['data']['inputs']
-                df_inputs = pd.DataFrame([input_data])
-                
-                # 2. Output metrics
-                output_data = {k: v for k, v in sim['data'].items() if k != 'inputs'}
-                df_outputs = pd.DataFrame([output_data])
+                # Files are only built when their button is clicked, so only the name is needed here
+                store = st.session_state.simulations
+                sim_name = store.name(selected_sim)
                 
-                # 3. All combined
-                combined_data = {**input_data, **output_data}
-                df_combined = pd.DataFrame([combined_data])
-                
-                # CSV and JSON downloads
-                st.markdown(get_csv_download_link(df_inputs, f"{sim['name']}_inputs.csv", "Download Input Parameters (CSV)"), unsafe_allow_html=True)
-                st.markdown(get_csv_download_link(df_outputs, f"{sim['name']}_outputs.csv", "Download Output Metrics (CSV)"), unsafe_allow_html=True)
-                st.markdown(get_csv_download_link(df_combined, f"{sim['name']}_combined.csv", "Download All Data (CSV)"), unsafe_allow_html=True)
-                st.markdown(get_json_download_link(sim['data'], f"{sim['name']}_full.json", "Download Full Simulation Data (JSON)"), unsafe_allow_html=True)
+                st.write(f"### Download options for: {sim_name}")
+                single_formats = [f for f in ["CSV", "JSON Lines", "Parquet"] if f != "Parquet" or PYARROW_AVAILABLE]
+                single_format = st.radio("Format", options=single_formats, horizontal=True, key="single_export_format")
+                extension, mime = EXPORT_FORMATS[single_format]
+                parts = {
+                    "inputs": ("Input Parameters", INPUT_KEYS),
+                    "outputs": ("Output Metrics", OUTPUT_KEYS),
+                    "combined": ("All Data", None),
+                }
+                for part, (label, columns) in parts.items():
+                    st.download_button(
+                        f"Download {label} ({single_format})",
+                        data=profiler.track_download(f"{part} ({single_format})",
+                            lambda columns=columns, sim_id=selected_sim, fmt=single_format: frame_to_bytes(
+                                store.frame(columns, [sim_id], meta=False).reset_index(drop=True), fmt)),
+                        file_name=f"{sim_name}_{part}.{extension}",
+                        mime=mime,
+                        on_click="ignore",
+                        key=f"download_{part}"
+                    )
+                st.download_button(
+                    "Download Full Simulation Data (JSON)",
+                    data=profiler.track_download("full (JSON)",
+                        lambda sim_id=selected_sim: json.dumps(store.results(sim_id), indent=4)),
+                    file_name=f"{sim_name}_full.json",
+                    mime="application/json",
+                    on_click="ignore",
+                    key="download_full_json"
+                )
             
             # Show all simulations download (outside the if statement since this doesn't depend on selected_sim)
             st.write("### Download All Simulations")
             
-            # Create a combined dataframe of all simulations
-            all_sims_data = []
-            
-            for sim_id, sim_data in st.session_state.simulations.items():
-                row = {
-                    "Simulation ID": sim_id,
-                    "Simulation Name": sim_data["name"],
-                    "Timestamp": sim_data["timestamp"]
-                }
-                
-                # Add input parameters
-                for param, value in sim_data["data"]["inputs"].items():
-                    row[f"Input: {param}"] = value
-                
-                # Add output metrics
-                for metric, value in {k: v for k, v in sim_data["data"].items() if k != 'inputs'}.items():
-                    row[f"Output: {metric}"] = value
-                
-                all_sims_data.append(row)
-            
-            df_all_sims = pd.DataFrame(all_sims_data)
-            
-            st.markdown(get_csv_download_link(df_all_sims), "all_simulations.csv",
-            st.markdown(get_csv_download_link(df_all_sims), "all_simulations.csv", "Download All Simulations (CSV)"), unsafe_allow_html=True)
-            st.markdown(get_json_download_link(st.session_state.simulations, "all_simulations.json", "Download All Simulations (JSON)"), unsafe_allow_html=True)
+            # Exports are streamed in chunks from the store when the button is clicked
+            all_formats = [f for f in EXPORT_FORMATS if f != "Parquet" or PYARROW_AVAILABLE] + ["Zip bundle"]
+            col1, col2 = st.columns(2)
+            with col1:
+                all_format = st.selectbox("Format", options=all_formats, key="all_export_format")
+            with col2:
+                compress = st.checkbox("Gzip compress", value=False, key="all_export_gzip",
+                                       disabled=all_format in ["Parquet", "Zip bundle"])
+            if all_format == "Zip bundle":
+                file_name, mime = "all_simulations.zip", "application/zip"
+            else:
+                extension, mime = EXPORT_FORMATS[all_format]
+                file_name = f"all_simulations.{extension}"
+                if compress and all_format != "Parquet":
+                    file_name, mime = f"{file_name}.gz", "application/gzip"
+            store = st.session_state.simulations
+            st.download_button(
+                f"Download All Simulations ({all_format})",
+                data=profiler.track_download(f"all simulations ({all_format})",
+                    lambda store=store, fmt=all_format, compress=compress: export_file(store, fmt, compress=compress)),
+                file_name=file_name,
+                mime=mime,
+                on_click="ignore",
+                key="download_all"
+            )
         
         with download_tabs[1]:
             # PDF Report
@@ -609,52 +636,616 @@ with tab_download:
                 sim = st.session_state.simulations[selected_sim]
                 st.write("Generate a comprehensive PDF report of this simulation.")
                 
-                # Generate PDF
-                pdf_bytes = create_pdf_report(sim['data'], sim['name'])
+                # Reports render in the background and are cached by content
+                pdf_bytes = request_report(sim['data'], sim['name'], sim['timestamp'])
                 
-                # Download button
-                st.markdown(get_pdf_download_link(pdf_bytes, f"{sim['name']}_report.pdf", "Download PDF Report"), unsafe_allow_html=True)
+                if pdf_bytes is None:
+                    wait_for_report(sim['data'], sim['name'], sim['timestamp'])
+                else:
+                    # Download button
+                    st.download_button("Download PDF Report", data=pdf_bytes, file_name=f"{sim['name']}_report.pdf",
+                                       mime="application/pdf", on_click="ignore", key="download_pdf")
+                    
+                    # Preview button
+                    if st.button("Preview PDF in Browser"):
+                        # Convert PDF to base64 string
+                        b64 = base64.b64encode(pdf_bytes).decode()
+                        # Display PDF in an iframe
+                        pdf_display = f'<iframe src="data:application/pdf;base64,{b64}" width="700" height="1000" type="application/pdf"></iframe>'
+                        st.markdown(pdf_display, unsafe_allow_html=True)
                 
-                # Preview button
-                if st.button("Preview PDF in Browser"):
-                    # Convert PDF to base64 string
-                    b64 = base64.b64encode(pdf_bytes).decode()
-                    # Display PDF in an iframe
-                    pdf_display = f'<iframe src="data:application/pdf;base64,{b64}" width="700" height="1000" type="application/pdf"></iframe>'
-                    st.markdown(pdf_display, unsafe_allow_html=True)
+                # Report pack: PDFs for many simulations rendered in parallel
+                st.write("### Report Pack")
+                pack_sims = st.multiselect(
+                    "Simulations to include",
+                    options=sim_options,
+                    format_func=lambda x: f"{x}: {st.session_state.simulations.name(x)}",
+                    key="pack_sims"
+                )
+                if st.button("Build report pack") and pack_sims:
+                    with st.spinner(f"Rendering {len(pack_sims)} reports..."):
+                        store = st.session_state.simulations
+                        st.session_state.report_pack = build_report_pack([
+                            (store.results(x), store.name(x), store.timestamp(x),
+                             f"{x} - {store.name(x)}_report.pdf".replace("/", "_"))
+                            for x in pack_sims
+                        ])
+                if st.session_state.get("report_pack"):
+                    st.download_button("Download Report Pack (ZIP)", data=st.session_state.report_pack,
+                                       file_name="simulation_reports.zip", mime="application/zip",
+                                       on_click="ignore", key="download_report_pack")
             elif not REPORTLAB_AVAILABLE:
                 st.warning("PDF report generation requires ReportLab. Install with: pip install reportlab")
                 st.code("pip install reportlab", language="bash")
             elif not selected_sim:
                 st.info("Please select a simulation from the dropdown above to generate a PDF report.")
 
+with tab_download:
+    download_tab()
+
+# Tab 4: Monte Carlo
+@st.fragment
+@profiler.timed("tab: Monte Carlo")
+def monte_carlo_tab():
+    """Monte Carlo tab; its widgets rerun only this fragment"""
+    if len(st.session_state.simulations) == 0:
+        st.warning("No simulations have been run. Please run at least one simulation in the 'Run Simulation' tab.")
+    else:
+        st.subheader("Monte Carlo Simulation")
+        st.write("Give uncertain inputs a distribution and see the range of likely outcomes.")
+        
+        for key, value in st.session_state.pop("mc_prefill", {}).items():
+            st.session_state[key] = value
+        
+        # Base simulation supplies the point estimates for every input
+        sim_options = st.session_state.views.ids()
+        base_sim = st.selectbox(
+            "Base simulation",
+            options=sim_options,
+            index=len(sim_options) - 1,
+            format_func=lambda x: f"{x}: {st.session_state.simulations.name(x)}",
+            key="mc_base_sim"
+        )
+        base_inputs = st.session_state.simulations.inputs(base_sim)
+        
+        uncertain_inputs = st.multiselect(
+            "Uncertain inputs",
+            options=list(base_inputs.keys()),
+            default=[k for k in ["leads", "meeting_conversion_rate", "churn_rate", "average_deal_size"] if k in base_inputs],
+            key="mc_inputs"
+        )
+        
+        # Distribution type per input (outside the form so parameter fields update)
+        dist_types = {}
+        type_cols = st.columns(max(len(uncertain_inputs), 1))
+        for col, key in zip(type_cols, uncertain_inputs):
+            with col:
+                dist_types[key] = st.selectbox(key, options=DISTRIBUTION_TYPES, key=f"mc_type_{key}")
+        
+        with st.form("monte_carlo_form"):
+            distributions = {}
+            for key in uncertain_inputs:
+                spec = default_distribution(dist_types[key], base_inputs[key])
+                unit = " (fraction)" if key in RATE_KEYS else ""
+                st.markdown(f"**{key}**{unit}: {dist_types[key]}")
+                param_cols = st.columns(3)
+                if spec["type"] == "empirical":
+                    values_text = st.text_input(
+                        "Observed values (comma separated)",
+                        value=", ".join(f"{v:g}" for v in spec["values"]),
+                        key=f"mc_values_{key}"
+                    )
+                    spec["values"] = [float(v) for v in values_text.split(",") if v.strip()]
+                else:
+                    for col, param in zip(param_cols, [p for p in spec if p != "type"]):
+                        with col:
+                            spec[param] = st.number_input(param, value=float(spec[param]), format="%g", key=f"mc_{param}_{key}")
+                distributions[key] = spec
+            
+            correlations = None
+            if len(uncertain_inputs) > 1:
+                st.markdown("**Correlations** (leave as identity for independent inputs)")
+                corr_frame = st.data_editor(
+                    pd.DataFrame(np.eye(len(uncertain_inputs)), index=uncertain_inputs, columns=uncertain_inputs),
+                    key=f"mc_corr_{'_'.join(uncertain_inputs)}"
+                )
+                correlations = corr_frame.to_numpy()
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                n_samples = st.number_input("Number of samples", min_value=1000, max_value=5_000_000, value=100_000, step=10_000)
+            with col2:
+                seed = st.number_input("Random seed", min_value=0, value=42)
+            
+            run_mc = st.form_submit_button("Run Monte Carlo")
+        
+        if run_mc and uncertain_inputs:
+            try:
+                with st.spinner("Sampling..."):
+                    st.session_state.monte_carlo = {
+                        "base_sim": base_sim,
+                        "result": run_monte_carlo(base_inputs, distributions, n_samples=n_samples,
+                                                  correlations=correlations, seed=int(seed))
+                    }
+            except ValueError as e:
+                st.error(str(e))
+        
+        mc = st.session_state.get("monte_carlo")
+        if mc and mc["base_sim"] in st.session_state.simulations:
+            result = mc["result"]
+            st.write(f"### Results from {result['n_samples']:,} samples")
+            st.dataframe(pd.DataFrame(summarize(result["metrics"])).set_index("Metric"))
+            
+            hist_metric = st.selectbox("Histogram", options=MONTE_CARLO_METRICS, key="mc_hist_metric")
+            counts, edges = result["metrics"][hist_metric].histogram(50)
+            st.bar_chart(pd.DataFrame({"Samples": counts}, index=[f"{e:,.0f}" for e in edges[:-1]]))
+
+with tab_monte_carlo:
+    monte_carlo_tab()
+
+# Tab 5: Sensitivity
+@st.fragment
+@profiler.timed("tab: Sensitivity")
+def sensitivity_tab():
+    """Sensitivity tab; its widgets rerun only this fragment"""
+    if len(st.session_state.simulations) == 0:
+        st.warning("No simulations have been run. Please run at least one simulation in the 'Run Simulation' tab.")
+    else:
+        st.subheader("Sensitivity Analysis")
+        
+        sim_options = st.session_state.views.ids()
+        sens_sim = st.selectbox(
+            "Base simulation",
+            options=sim_options,
+            index=len(sim_options) - 1,
+            format_func=lambda x: f"{x}: {st.session_state.simulations.name(x)}",
+            key="sens_base_sim"
+        )
+        sens_inputs = st.session_state.simulations.inputs(sens_sim)
+        
+        sens_metric = st.selectbox(
+            "Metric",
+            options=list(METRIC_OPTIONS.keys()),
+            index=list(METRIC_OPTIONS.keys()).index("net_profit"),
+            format_func=lambda x: METRIC_OPTIONS[x],
+            key="sens_metric"
+        )
+        
+        sens_mode = st.radio("Analysis", ["One-way (tornado)", "Two-way (heatmap)", "Global (Sobol)"], horizontal=True)
+        
+        if sens_mode == "One-way (tornado)":
+            swing = st.slider("Move each input by (±%)", min_value=1, max_value=100, value=20) / 100
+            base_value, rows = tornado(sens_inputs, sens_metric, swing=swing)
+            st.write(f"Base {METRIC_OPTIONS[sens_metric]}: {base_value:,.2f}")
+            
+            top_rows = [row for row in rows if row["range"] > 0][:15]
+            if top_rows:
+                tornado_data = pd.DataFrame({
+                    f"-{swing:.0%}": [row["low_change"] for row in top_rows],
+                    f"+{swing:.0%}": [row["high_change"] for row in top_rows],
+                }, index=[row["input"] for row in top_rows])
+                st.bar_chart(tornado_data, horizontal=True, stack=False)
+                st.dataframe(pd.DataFrame(rows).set_index("input"))
+            else:
+                st.info("No input changes this metric.")
+            
+            # Sweep a single input across a range
+            st.write("### Sweep one input")
+            sweep_key = st.selectbox("Input", options=list(sens_inputs.keys()), key="sens_sweep_key")
+            sweep_base = float(sens_inputs[sweep_key])
+            col1, col2 = st.columns(2)
+            with col1:
+                sweep_low = st.number_input("From", value=sweep_base * 0.5, format="%g", key="sens_sweep_low")
+            with col2:
+                sweep_high = st.number_input("To", value=sweep_base * 1.5 if sweep_base else 1.0, format="%g", key="sens_sweep_high")
+            sweep_values = np.linspace(sweep_low, sweep_high, 200)
+            sweep = sweep_1d(sens_inputs, sweep_key, sweep_values, [sens_metric])
+            st.line_chart(pd.DataFrame({METRIC_OPTIONS[sens_metric]: sweep[sens_metric]}, index=sweep_values))
+        
+        elif sens_mode == "Global (Sobol)":
+            st.write("Variance-based indices: the share of the metric's variance due to each input on its own "
+                     "(first order) and including its interactions with the others (total).")
+            sobol_keys = st.multiselect("Inputs", options=list(sens_inputs.keys()),
+                                        default=[key for key, value in sens_inputs.items() if value], key="sobol_keys")
+            col1, col2 = st.columns(2)
+            with col1:
+                sobol_swing = st.slider("Vary each input uniformly by (±%)", min_value=1, max_value=100, value=20,
+                                        key="sobol_swing") / 100
+            with col2:
+                sobol_n = st.select_slider("Base samples", options=[2**k for k in range(10, 18)], value=2**14,
+                                           key="sobol_n")
+            st.caption(f"{sobol_n * (len(sobol_keys) + 2):,} model evaluations")
+            sobol_processes = st.checkbox("Evaluate design blocks in worker processes", key="sobol_processes")
+            
+            if st.button("Run Sobol analysis"):
+                if not sobol_keys:
+                    st.error("Choose at least one input")
+                else:
+                    start = time.perf_counter()
+                    with st.spinner("Sampling..."), profiler.stage("sobol indices"):
+                        sobol_rows, sobol_details = sobol_indices(sens_inputs, sens_metric, sobol_keys, swing=sobol_swing,
+                                                                  n=sobol_n, seed=0, processes=4 if sobol_processes else None)
+                    elapsed = time.perf_counter() - start
+                    sobol_df = pd.DataFrame(sobol_rows).set_index("input")
+                    st.bar_chart(sobol_df[["first_order", "total"]].rename(columns={"first_order": "First order",
+                                                                                    "total": "Total"}),
+                                 horizontal=True, stack=False)
+                    st.dataframe(sobol_df)
+                    st.caption(f"{sobol_details['evaluations']:,} evaluations in {elapsed:.2f}s; "
+                               f"{METRIC_OPTIONS[sens_metric]} mean {sobol_details['mean']:,.2f}, "
+                               f"variance {sobol_details['variance']:,.4g}")
+        
+        else:
+            input_keys = list(sens_inputs.keys())
+            col1, col2 = st.columns(2)
+            with col1:
+                x_key = st.selectbox("X input", options=input_keys,
+                                     index=input_keys.index("lead_booking_rate") if "lead_booking_rate" in input_keys else 0)
+                x_base = float(sens_inputs[x_key])
+                x_low = st.number_input("X from", value=x_base * 0.5, format="%g", key=f"sens_x_low_{x_key}")
+                x_high = st.number_input("X to", value=x_base * 1.5 if x_base else 1.0, format="%g", key=f"sens_x_high_{x_key}")
+                x_steps = st.number_input("X steps", min_value=2, max_value=2000, value=100)
+            with col2:
+                y_key = st.selectbox("Y input", options=input_keys,
+                                     index=input_keys.index("average_deal_size") if "average_deal_size" in input_keys else 1)
+                y_base = float(sens_inputs[y_key])
+                y_low = st.number_input("Y from", value=y_base * 0.5, format="%g", key=f"sens_y_low_{y_key}")
+                y_high = st.number_input("Y to", value=y_base * 1.5 if y_base else 1.0, format="%g", key=f"sens_y_high_{y_key}")
+                y_steps = st.number_input("Y steps", min_value=2, max_value=2000, value=100)
+            use_processes = st.checkbox("Evaluate chunks in worker processes")
+            
+            if st.button("Run sweep"):
+                if x_key == y_key:
+                    st.error("Choose two different inputs for a two-way sweep")
+                else:
+                    x_values = np.linspace(x_low, x_high, int(x_steps))
+                    y_values = np.linspace(y_low, y_high, int(y_steps))
+                    grid = np.full((len(y_values), len(x_values)), np.nan)
+                    
+                    progress = st.progress(0.0)
+                    heatmap = st.empty()
+                    chunk_rows = max(1, len(y_values) // 10)
+                    done = 0
+                    for start, stop, block in sweep_2d(sens_inputs, x_key, x_values, y_key, y_values, sens_metric,
+                                                       chunk_rows=chunk_rows, processes=4 if use_processes else None):
+                        # Draw each chunk as it arrives
+                        grid[start:stop] = block
+                        done += stop - start
+                        progress.progress(done / len(y_values))
+                        fig = go.Figure(go.Heatmap(z=grid, x=x_values, y=y_values, colorscale="RdYlGn",
+                                                   colorbar={"title": METRIC_OPTIONS[sens_metric]}))
+                        fig.update_layout(xaxis_title=x_key, yaxis_title=y_key, height=600)
+                        heatmap.plotly_chart(fig)
+
+with tab_sensitivity:
+    sensitivity_tab()
+
+# Tab 6: Projection
+@st.fragment
+@profiler.timed("tab: Projection")
+def projection_tab():
+    """Projection tab; its widgets rerun only this fragment"""
+    if len(st.session_state.simulations) == 0:
+        st.warning("No simulations have been run. Please run at least one simulation in the 'Run Simulation' tab.")
+    else:
+        st.subheader("Cohort Projection")
+        st.write("Project customers, recurring revenue and cash month by month, treating volumes and costs as monthly figures.")
+        
+        sim_options = st.session_state.views.ids()
+        proj_sim = st.selectbox(
+            "Base simulation",
+            options=sim_options,
+            index=len(sim_options) - 1,
+            format_func=lambda x: f"{x}: {st.session_state.simulations.name(x)}",
+            key="proj_base_sim"
+        )
+        proj_inputs = st.session_state.simulations.inputs(proj_sim)
+        
+        month_names = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+        col1, col2 = st.columns(2)
+        with col1:
+            proj_months = st.slider("Months to project", min_value=36, max_value=120, value=60, step=12)
+        with col2:
+            start_month = st.selectbox("First month", options=list(range(12)), format_func=lambda m: month_names[m])
+        
+        with st.expander("Seasonality (multiplier on monthly lead volume)"):
+            seasonality_frame = st.data_editor(
+                pd.DataFrame({"Multiplier": np.ones(12)}, index=month_names),
+                key="proj_seasonality"
+            )
+        
+        # Shared with every session that projects the same scenario
+        projection = cached_projection(proj_inputs, months=proj_months, seasonality=seasonality_frame["Multiplier"].to_numpy(),
+                                       start_month=start_month, keep_history=True)
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            runway = projection["runway_months"]
+            st.metric("Cash Runway", "Beyond horizon" if np.isinf(runway) else f"{runway:.0f} months")
+        with col2:
+            st.metric("Final MRR", f"£{projection['mrr'][-1]:,.2f}")
+        with col3:
+            st.metric("Final Customers", f"{projection['customers'][-1]:,.0f}")
+        
+        month_index = pd.RangeIndex(1, proj_months + 1, name="Month")
+        st.write("### Customers")
+        st.line_chart(pd.DataFrame({
+            "Active customers": projection["customers"],
+            "New customers": projection["new_customers"]
+        }, index=month_index))
+        st.write("### Revenue and Costs")
+        st.line_chart(pd.DataFrame({
+            "MRR": projection["mrr"],
+            "Receipts": projection["receipts"],
+            "Costs": projection["costs"]
+        }, index=month_index))
+        st.write("### Cash Balance")
+        st.area_chart(pd.DataFrame({"Cash balance": projection["cash_balance"]}, index=month_index))
+        
+        st.write("### Active Customers by Cohort")
+        fig = go.Figure(go.Heatmap(
+            z=projection["cohort_history"].T,
+            x=list(month_index),
+            y=["Initial"] + [f"Month {m}" for m in range(1, proj_months + 1)],
+            colorscale="Blues"
+        ))
+        fig.update_layout(xaxis_title="Month", yaxis_title="Acquired", height=600)
+        st.plotly_chart(fig)
+
+with tab_projection:
+    projection_tab()
+
+# Tab 7: Goal Seek
+@st.fragment
+@profiler.timed("tab: Goal Seek")
+def goal_seek_tab():
+    """Goal Seek tab; its widgets rerun only this fragment"""
+    if len(st.session_state.simulations) == 0:
+        st.warning("No simulations have been run. Please run at least one simulation in the 'Run Simulation' tab.")
+    else:
+        st.subheader("Goal Seek")
+        st.write("Find the input values needed to hit a target, instead of adjusting the form by hand.")
+        
+        sim_options = st.session_state.views.ids()
+        gs_sim = st.selectbox(
+            "Base simulation",
+            options=sim_options,
+            index=len(sim_options) - 1,
+            format_func=lambda x: f"{x}: {st.session_state.simulations.name(x)}",
+            key="gs_base_sim"
+        )
+        gs_inputs = st.session_state.simulations.inputs(gs_sim)
+        gs_results = st.session_state.simulations.results(gs_sim)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            gs_metric = st.selectbox("Target metric", options=list(METRIC_OPTIONS.keys()),
+                                     index=list(METRIC_OPTIONS.keys()).index("net_profit"),
+                                     format_func=lambda x: METRIC_OPTIONS[x], key="gs_metric")
+        with col2:
+            gs_target = st.number_input(f"Target {METRIC_OPTIONS[gs_metric]} (currently {gs_results[gs_metric]:,.2f})",
+                                        value=0.0, format="%g", key="gs_target")
+        
+        gs_free = st.multiselect(
+            "Inputs to solve for (several inputs all change by the same percentage)",
+            options=INPUT_KEYS,
+            default=["leads"],
+            key="gs_free"
+        )
+        gs_bounds = {}
+        bound_cols = st.columns(max(len(gs_free), 1))
+        for col, key in zip(bound_cols, gs_free):
+            low, high = default_bounds(key, gs_inputs[key])
+            with col:
+                gs_bounds[key] = (
+                    st.number_input(f"{key} min", value=float(low), format="%g", key=f"gs_low_{key}"),
+                    st.number_input(f"{key} max", value=float(high), format="%g", key=f"gs_high_{key}"),
+                )
+        
+        if gs_free and st.button("Solve", key="gs_solve"):
+            try:
+                solution = goal_seek(gs_inputs, gs_metric, gs_target, gs_free, gs_bounds)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                if solution["feasible"]:
+                    st.success(f"{METRIC_OPTIONS[gs_metric]} reaches {solution['achieved']:,.2f} ({solution['method']})")
+                else:
+                    st.warning(f"The target is out of reach within these bounds; the closest is "
+                               f"{solution['achieved']:,.2f}")
+                st.dataframe(pd.DataFrame({
+                    "Current": [gs_inputs[key] for key in gs_free],
+                    "Required": [solution["values"][key] for key in gs_free],
+                    "Change": [f"{(solution['values'][key] / gs_inputs[key] - 1):+.1%}" if gs_inputs[key] else "n/a"
+                               for key in gs_free],
+                }, index=gs_free))
+                if any(key in INTEGER_KEYS for key in gs_free):
+                    st.caption("Whole-number inputs such as leads may need rounding up.")
+        
+        # Batch goal seek: the value needed at every point of another input's range
+        st.write("### Break-even Curve")
+        col1, col2 = st.columns(2)
+        with col1:
+            curve_solve = st.selectbox("Solve for", options=INPUT_KEYS, index=INPUT_KEYS.index("leads"),
+                                       key="gs_curve_solve")
+        with col2:
+            curve_over = st.selectbox("Across", options=INPUT_KEYS, index=INPUT_KEYS.index("average_deal_size"),
+                                      key="gs_curve_over")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            curve_low = st.number_input("From", value=max(float(gs_inputs[curve_over]) * 0.5, 0.0), format="%g",
+                                        key="gs_curve_low")
+        with col2:
+            curve_high = st.number_input("To", value=max(float(gs_inputs[curve_over]) * 2.0, 1.0), format="%g",
+                                         key="gs_curve_high")
+        with col3:
+            curve_points = st.number_input("Points", min_value=10, max_value=100000, value=1000, step=100,
+                                           key="gs_curve_points")
+        
+        if curve_solve != curve_over and st.button("Build curve", key="gs_curve_build"):
+            over_values = np.linspace(curve_low, curve_high, int(curve_points))
+            curve = break_even_curve(gs_inputs, curve_solve, curve_over, over_values, metric=gs_metric,
+                                     target=gs_target,
+                                     bounds={curve_solve: gs_bounds[curve_solve]} if curve_solve in gs_bounds else None)
+            required = np.where(curve["feasible"], curve["values"][curve_solve], np.nan)
+            st.line_chart(pd.DataFrame({f"{curve_solve} needed": required},
+                                       index=pd.Index(over_values, name=curve_over)))
+            st.caption(f"{METRIC_OPTIONS[gs_metric]} = {gs_target:,.2f} is reachable at "
+                       f"{curve['feasible'].sum():,} of {len(over_values):,} points")
+
+with tab_goal_seek:
+    goal_seek_tab()
+
+# Tab 8: History
+@st.fragment
+@profiler.timed("tab: History")
+def history_tab():
+    """History tab; its widgets rerun only this fragment"""
+    if history is None:
+        st.info("Persistent history is off. Set the SIM_HISTORY_DB environment variable to a SQLite file path to keep every run across sessions.")
+        st.code("SIM_HISTORY_DB=simulations.db streamlit run streamlit_app.py", language="bash")
+    else:
+        st.subheader("Simulation History")
+        
+        # Filters
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            name_filter = st.text_input("Name contains", key="hist_name")
+            days_back = st.number_input("Last N days (0 for all)", min_value=0, value=30, key="hist_days")
+        with col2:
+            filter_metric = st.selectbox("Metric filter", options=list(METRIC_OPTIONS.keys()),
+                                         index=list(METRIC_OPTIONS.keys()).index("roi"),
+                                         format_func=lambda x: METRIC_OPTIONS[x], key="hist_metric")
+            filter_min = st.number_input("Minimum (blank for none)", value=None, format="%g", key="hist_min")
+        with col3:
+            sort_by = st.selectbox("Sort by", options=["timestamp", "name"] + list(METRIC_OPTIONS.keys()), key="hist_sort")
+            descending = st.checkbox("Descending", value=True, key="hist_desc")
+        
+        filters = []
+        if name_filter:
+            filters.append(("name", "LIKE", f"%{name_filter}%"))
+        if days_back:
+            since = datetime.datetime.now() - datetime.timedelta(days=int(days_back))
+            filters.append(("timestamp", ">=", since.strftime("%Y-%m-%d %H:%M:%S")))
+        if filter_min is not None:
+            filters.append((filter_metric, ">=", filter_min))
+        
+        # Only the requested page is read from disk
+        total = history.count(filters)
+        page_size = st.selectbox("Rows per page", options=[25, 50, 100, 250], index=1, key="hist_page_size")
+        n_pages = max(1, -(-total // page_size))
+        page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, key="hist_page")
+        page_frame = history.query(filters, columns=["revenue", "net_profit", "roi", "customer_lifetime_value"],
+                                   order_by=sort_by, descending=descending,
+                                   limit=page_size, offset=(page - 1) * page_size)
+        st.write(f"{total:,} matching simulations")
+        st.dataframe(page_frame.set_index("id"))
+        
+        to_load = st.multiselect("Load into this session", options=list(page_frame["id"]),
+                                 format_func=lambda x: f"#{x}", key="hist_load")
+        if st.button("Load selected") and to_load:
+            for db_id, (name, timestamp, results) in history.load(to_load).items():
+                sim_id = f"Sim {st.session_state.sim_counter + 1}"
+                st.session_state.simulations.add(sim_id, name, timestamp, results)
+                st.session_state.sim_counter += 1
+            st.session_state.history_loaded = len(to_load)
+            # Loaded simulations appear in every tab, so rerun the whole page
+            st.rerun()
+        loaded = st.session_state.pop("history_loaded", None)
+        if loaded:
+            st.success(f"Loaded {loaded} simulations")
+
+with tab_history:
+    history_tab()
+
 # Sidebar
-with st.sidebar:
+@st.fragment
+@profiler.timed("sidebar")
+def simulation_sidebar():
+    """Saved simulations; changing them reruns the whole page since every tab reads the store"""
     st.header("Simulation History")
     
     if len(st.session_state.simulations) == 0:
         st.info("No simulations have been run yet.")
     else:
-        for sim_id, sim in st.session_state.simulations.items():
-            st.write(f"**{sim_id}**: {sim['name']}")
-            st.write(f"*Run at: {sim['timestamp']}*")
-            
-            # Show key metrics
-            st.write(f"Revenue: £{sim['data']['revenue']:,.2f}")
-            st.write(f"Net Profit: £{sim['data']['net_profit']:,.2f}")
-            st.write(f"ROI: {sim['data']['roi']:,.2f}%")
-            
-            # Add delete button
-            if st.button(f"Delete {sim_id}", key=f"delete_{sim_id}"):
-                del st.session_state.simulations[sim_id]
-                st.success(f"Deleted {sim_id}")
-                st.experimental_rerun()
-            
-            st.write("---")
+        store = st.session_state.simulations
+        search = st.text_input("Search", placeholder="Name or ID", key="sidebar_search")
+        col1, col2 = st.columns(2)
+        with col1:
+            sort_by = st.selectbox("Sort by", options=[None] + list(METRIC_OPTIONS.keys()),
+                                   format_func=lambda x: "Run order" if x is None else METRIC_OPTIONS[x],
+                                   key="sidebar_sort")
+        with col2:
+            page_size = st.selectbox("Per page", options=[10, 25, 50, 100], index=1, key="sidebar_page_size")
+        descending = st.toggle("Newest / highest first", value=True, key="sidebar_descending")
+        
+        # Only the visible page is built and rendered
+        matches = st.session_state.views.get("sidebar_matches", (search, sort_by, descending),
+                                             lambda: matching_ids(store, search, sort_by, descending))
+        n_matches = len(matches)
+        n_pages = max(1, -(-n_matches // page_size))
+        if st.session_state.get("sidebar_page", 1) > n_pages:
+            st.session_state.sidebar_page = n_pages
+        page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, key="sidebar_page")
+        page_frame = st.session_state.views.get("sidebar_page", (search, sort_by, descending, page, page_size),
+                                                lambda: history_page(store, matches, page, page_size))
+        st.caption(f"{n_matches:,} of {len(store):,} simulations")
+        
+        selection = st.dataframe(
+            page_frame.drop(columns="Timestamp"),
+            column_config={
+                "Simulation Name": st.column_config.TextColumn("Name"),
+                "revenue": st.column_config.NumberColumn("Revenue", format="£%.2f"),
+                "net_profit": st.column_config.NumberColumn("Net Profit", format="£%.2f"),
+                "roi": st.column_config.NumberColumn("ROI", format="%.2f%%"),
+            },
+            on_select="rerun",
+            selection_mode="multi-row",
+            # A new key per page and store version so a selection never carries over to different rows
+            key=f"sidebar_table_{store.version}_{search}_{sort_by}_{descending}_{page}_{page_size}"
+        )
+        selected = [page_frame.index[row] for row in selection.selection.rows if row < len(page_frame)]
+        if selected:
+            st.caption("Selected: " + ", ".join(selected))
+            if st.button(f"Delete {len(selected)} selected", type="primary", key="sidebar_delete"):
+                # One batch delete, then one full rerun so every tab sees it
+                store.delete_many(selected)
+                st.rerun()
     
     # Clear all simulations button
     if st.button("Clear All Simulations"):
-        st.session_state.simulations = {}
+        st.session_state.simulations.clear()
         st.session_state.sim_counter = 0
-        st.experimental_rerun()
-        
\ No newline at end of file
+        st.rerun()
+
+@st.fragment
+def profiling_panel():
+    """Stage timings collected by the profiler"""
+    with st.expander("Profiling", expanded=False):
+        stage_summary = profiler.summary()
+        if stage_summary:
+            st.dataframe(pd.DataFrame(stage_summary).set_index("stage").round(2))
+            profile_stage = st.selectbox("Latency histogram", options=[row["stage"] for row in stage_summary],
+                                         key="profile_stage")
+            bucket_labels = [f"<{edge:g} ms" if edge != float("inf") else f">={HISTOGRAM_EDGES_MS[-2]:g} ms"
+                             for edge in HISTOGRAM_EDGES_MS[1:]]
+            st.bar_chart(pd.DataFrame({"Reruns": profiler.histogram(profile_stage)}, index=bucket_labels))
+        cache_stats = shared_cache.stats()
+        if cache_stats:
+            st.write(f"Shared cache ({shared_cache.nbytes / 2**20:,.1f} of {shared_cache.max_bytes / 2**20:,.0f} MB)")
+            st.dataframe(pd.DataFrame(cache_stats).T)
+        downloads = profiler.downloads()
+        if downloads:
+            st.write("Bytes sent through downloads")
+            st.dataframe(pd.DataFrame(downloads).T)
+        st.download_button("Export profile (JSON)", data=profiler.to_json, file_name="profile.json",
+                           mime="application/json", on_click="ignore", key="download_profile")
+        if st.button("Reset profile"):
+            profiler.reset()
+
+with st.sidebar:
+    simulation_sidebar()
+    if profiler.enabled:
+        profiling_panel()
+
+rerun_timer.finish()
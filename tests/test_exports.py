@@ -0,0 +1,28 @@
+"""Exports must be data st.download_button can serve"""
+import numpy as np
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+from exports import EXPORT_FORMATS, PYARROW_AVAILABLE, export_file
+from metrics import INPUT_KEYS
+from simulation_store import SimulationStore
+
+FORMATS = [f for f in EXPORT_FORMATS if f != "Parquet" or PYARROW_AVAILABLE] + ["Zip bundle"]
+
+@pytest.fixture
+def store():
+    store = SimulationStore()
+    inputs = np.random.default_rng(0).uniform(1, 100, (3, len(INPUT_KEYS))).round()
+    store.add_many(["Sim 1", "Sim 2", "Sim 3"], ["One", "Two", "Three"], ["2024-01-01 00:00:00"] * 3, inputs)
+    return store
+
+@pytest.mark.parametrize("export_format", FORMATS)
+@pytest.mark.parametrize("compress", [False, True])
+def test_export_file_is_downloadable(store, export_format, compress):
+    data = export_file(store, export_format, compress=compress)
+    converted, _ = convert_data_to_bytes_and_infer_mime(data, TypeError("unsupported"))
+    assert converted == data and len(converted) > 0
+
+def test_json_lines_has_no_blank_lines(store):
+    lines = export_file(store, "JSON Lines").decode().split("\n")
+    assert lines[-1] == "" and all(lines[:-1])
@@ -0,0 +1,190 @@
+"""Tables and chart data built from the simulation store for the app's views"""
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import METRIC_OPTIONS
+
+# Columns shown for each simulation in the sidebar list
+SIDEBAR_METRICS = ["revenue", "net_profit", "roi"]
+
+# Cell style for inputs that differ from a simulation's baseline
+CHANGED_STYLE = "background-color: rgba(255, 193, 7, 0.3)"
+
+class ViewCache:
+    """Values derived from a SimulationStore, memoised until the store changes
+
+    Entries are keyed on a name plus the parameters that shaped them, and all
+    of them are dropped once store.version moves on, so a rerun that leaves
+    the store alone reuses every table instead of rebuilding it.
+    """
+
+    def __init__(self, store, max_entries=64):
+        self.store = store
+        self.max_entries = max_entries
+        self._version = store.version
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, params, build):
+        """Cached value for (name, params), calling build() on a miss"""
+        if self.store.version != self._version:
+            self._entries.clear()
+            self._version = self.store.version
+        key = (name, params)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        value = build()
+        self._entries[key] = value
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def ids(self):
+        """The store's simulation ids"""
+        return self.get("ids", (), self.store.ids)
+
+def comparison_frame(store, sim_ids, metrics):
+    """The Compare tab's table: one row per simulation, metric labels as columns"""
+    df = store.frame(metrics, sim_ids, meta=False)
+    df = df.rename(columns=METRIC_OPTIONS)
+    df.insert(0, "Simulation", store.names(sim_ids))
+    return df.reset_index(drop=True)
+
+def comparison_chart_data(df_comparison):
+    """Bar chart data for a comparison table, indexed by simulation name"""
+    return df_comparison.set_index("Simulation")
+
+def change_summaries(store, sim_ids):
+    """Each simulation's changes from its baseline as short text, e.g. leads=150, churn_rate=0.2"""
+    counts, keys, values = store.flat_changes(sim_ids)
+    parts = [f"{key}={value:g}" for key, value in zip(keys.tolist(), values.tolist())]
+    ends = np.cumsum(counts).tolist()
+    summaries = [", ".join(parts[end - count:end]) or "(no changes)" for count, end in zip(counts.tolist(), ends)]
+    baselines = store.baseline_names(sim_ids)
+    for i in np.flatnonzero(baselines != store.default_baseline).tolist():
+        summaries[i] = f"{baselines[i]}: {summaries[i]}"
+    return summaries
+
+def comparison_views(store, sim_ids, metrics):
+    """Comparison table and its chart data, built together so they can be cached as one
+
+    The table also lists the inputs each simulation changes from its baseline.
+    """
+    df_comparison = comparison_frame(store, sim_ids, metrics)
+    chart_data = comparison_chart_data(df_comparison)
+    df_comparison.insert(1, "Changed inputs", change_summaries(store, sim_ids))
+    return df_comparison, chart_data
+
+def parameter_frame(store, sim_ids, params):
+    """Input parameters of the selected simulations side by side, changed inputs highlighted
+
+    Returns a Styler; cells holding an input that differs from the
+    simulation's baseline are shaded with CHANGED_STYLE.
+    """
+    df = store.frame(params, sim_ids, meta=False)
+    df.insert(0, "Simulation", store.names(sim_ids))
+    changed = store.changed_mask(params, sim_ids)
+    return df.reset_index(drop=True).style.apply(lambda _: np.where(changed, CHANGED_STYLE, ""), axis=None,
+                                                 subset=list(params))
+
+def matching_ids(store, search="", sort_by=None, descending=True):
+    """Simulation ids for the sidebar list, filtered and sorted on the store's arrays
+
+    `search` matches the simulation id or name (case-insensitive); `sort_by`
+    is a stored column, or None for run order.
+    """
+    sim_ids = np.array(store.ids(), dtype=object)
+    if search:
+        needle = search.lower()
+        names = store.names()
+        matches = np.array([needle in str(sim_id).lower() or needle in str(name).lower()
+                            for sim_id, name in zip(sim_ids, names)], dtype=bool)
+        positions = np.flatnonzero(matches)
+    else:
+        positions = np.arange(len(sim_ids))
+    if sort_by is not None:
+        order = np.argsort(store.column(sort_by)[positions], kind="stable")
+        positions = positions[order[::-1] if descending else order]
+    elif descending:
+        positions = positions[::-1]
+    return sim_ids[positions]
+
+def history_page(store, sim_ids, page=1, page_size=25):
+    """One page of the sidebar's simulation list; only this page becomes a DataFrame"""
+    start = (page - 1) * page_size
+    return store.frame(SIDEBAR_METRICS, list(sim_ids[start:start + page_size]))
+
+def top_ids(store, sim_ids, rank_by, n, descending=True):
+    """The n simulations with the highest (or lowest) value of rank_by"""
+    sim_ids = np.array(store.ids() if sim_ids is None else list(sim_ids), dtype=object)
+    values = store.column(rank_by, list(sim_ids))
+    if n >= len(sim_ids):
+        order = np.argsort(values, kind="stable")
+    else:
+        # Partition first so only the top n are fully sorted
+        picked = np.argpartition(-values if descending else values, n - 1)[:n]
+        order = picked[np.argsort(values[picked], kind="stable")]
+    order = order[::-1] if descending else order
+    return list(sim_ids[order[:n]])
+
+def metric_quantiles(store, sim_ids, metrics, percentiles=(0, 5, 25, 50, 75, 95, 100)):
+    """Percentiles and mean of each metric across the selected simulations"""
+    import pandas as pd
+
+    data = store.frame(metrics, sim_ids, meta=False).to_numpy()
+    table = pd.DataFrame(np.percentile(data, percentiles, axis=0).T,
+                         index=[METRIC_OPTIONS.get(m, m) for m in metrics],
+                         columns=[f"P{p}" for p in percentiles])
+    table["Mean"] = data.mean(axis=0)
+    return table
+
+def metric_histogram(store, sim_ids, metric, bins=30):
+    """Counts per bin of one metric, labelled by bin start, for a bar chart"""
+    import pandas as pd
+
+    counts, edges = np.histogram(store.column(metric, sim_ids), bins=bins)
+    return pd.DataFrame({"Simulations": counts}, index=pd.Index([f"{edge:,.4g}" for edge in edges[:-1]],
+                                                                 name=METRIC_OPTIONS.get(metric, metric)))
+
+def sample_ids(store, sim_ids, max_points, seed=0):
+    """At most max_points of the selected ids, sampled without replacement"""
+    sim_ids = store.ids() if sim_ids is None else list(sim_ids)
+    if len(sim_ids) <= max_points:
+        return sim_ids
+    rng = np.random.default_rng(seed)
+    picked = np.sort(rng.choice(len(sim_ids), size=max_points, replace=False))
+    return [sim_ids[i] for i in picked]
+
+def scatter_matrix_figure(store, sim_ids, metrics, max_points=5000):
+    """WebGL scatter-matrix of the metrics, downsampled to max_points simulations"""
+    import plotly.graph_objects as go
+
+    shown = sample_ids(store, sim_ids, max_points)
+    df = store.frame(metrics, shown, meta=False)
+    fig = go.Figure(go.Splom(
+        dimensions=[{"label": METRIC_OPTIONS.get(m, m), "values": df[m].to_numpy()} for m in metrics],
+        text=list(store.names(shown)),
+        marker={"size": 4, "opacity": 0.6, "color": df[metrics[0]].to_numpy(), "colorscale": "Viridis"},
+        diagonal_visible=False,
+        showupperhalf=False,
+    ))
+    fig.update_layout(height=180 * len(metrics) + 100, dragmode="select")
+    return fig
+
+def parallel_coordinates_figure(store, sim_ids, metrics, max_points=5000):
+    """Parallel-coordinates view of the metrics, downsampled to max_points simulations"""
+    import plotly.graph_objects as go
+
+    shown = sample_ids(store, sim_ids, max_points)
+    df = store.frame(metrics, shown, meta=False)
+    fig = go.Figure(go.Parcoords(
+        dimensions=[{"label": METRIC_OPTIONS.get(m, m), "values": df[m].to_numpy()} for m in metrics],
+        line={"color": df[metrics[0]].to_numpy(), "colorscale": "Viridis", "showscale": True},
+    ))
+    fig.update_layout(height=500)
+    return fig